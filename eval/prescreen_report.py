@@ -0,0 +1,60 @@
+"""Accuracy versus savings of `pipeline.prescreen` over the synthesized dataset, whose ground-truth degradations are the names of the directories (dataset/LQ/d{n}/{degradation}+...; dataset/HQ is clean)."""
+from pathlib import Path
+import argparse
+import json
+from tqdm import tqdm
+
+from pipeline.prescreen import prescreen
+from utils.misc import sorted_glob
+
+
+EVALUATED_DEGRADATIONS = [
+    "motion blur", "defocus blur", "rain", "haze", "dark", "noise", "jpeg compression artifact"
+]
+
+
+def collect_samples(dataset_dir: Path) -> list[tuple[Path, set[str]]]:
+    samples = [(img_path, set()) for img_path in sorted_glob(dataset_dir / "HQ", "*.png")]
+    for comb_dir in sorted_glob(dataset_dir / "LQ", "d*/*"):
+        degradations = set(comb_dir.name.split('+'))
+        samples += [(img_path, degradations) for img_path in sorted_glob(comb_dir, "*.png")]
+    return samples
+
+
+def report(samples: list[tuple[Path, set[str]]]) -> dict:
+    per_degra = {degradation: {"ruled_out": 0, "wrongly_ruled_out": 0, "present": 0}
+                 for degradation in EVALUATED_DEGRADATIONS}
+    for img_path, degradations in tqdm(samples, unit='img'):
+        ruled_out = prescreen(img_path)
+        for degradation, stat in per_degra.items():
+            present = degradation in degradations
+            stat["present"] += present
+            if degradation in ruled_out:
+                stat["ruled_out"] += 1
+                stat["wrongly_ruled_out"] += present
+
+    n_queries = len(samples) * len(EVALUATED_DEGRADATIONS)
+    n_saved = sum(stat["ruled_out"] for stat in per_degra.values())
+    n_wrong = sum(stat["wrongly_ruled_out"] for stat in per_degra.values())
+    for stat in per_degra.values():
+        # fraction of images with the degradation that would be missed
+        stat["miss_rate"] = stat["wrongly_ruled_out"] / stat["present"] if stat["present"] else 0.
+    return {
+        "n_images": len(samples),
+        "queries_saved": n_saved / n_queries if n_queries else 0.,
+        "precision": 1 - n_wrong / n_saved if n_saved else 1.,
+        "per_degradation": per_degra,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_dir", type=Path, default=Path("dataset"))
+    parser.add_argument("--output_path", type=Path, default=None)
+    args = parser.parse_args()
+
+    res = report(collect_samples(args.dataset_dir))
+    print(json.dumps(res, indent=2))
+    if args.output_path is not None:
+        with open(args.output_path, "w") as f:
+            json.dump(res, f, indent=2)
@@ -3,6 +3,7 @@ from pathlib import Path
 import shutil
 import time
 import cv2
+from typing import Optional
 
 from utils.custom_types import Subtask, ToolName
 
@@ -15,7 +16,7 @@ from .deraining import deraining_toolbox
 from .brightening import brightening_toolbox
 from .jpeg_compression_artifact_removal import jpeg_compression_artifact_removal_toolbox
 
-from .tool import Tool
+from .tool import Tool, TIERS
 
 
 __all__ = ['executor']
@@ -86,12 +87,24 @@ class Executor:
     
     def invoke_a_tool(self, 
                       subtask_name: str, tool_name: str, 
-                      input_dir: Path, output_dir: Path):
+                      input_dir: Path, output_dir: Path,
+                      tier: Optional[str] = None):
         toolbox = self.toolbox_router[subtask_name]
         for tool in toolbox:
             if tool.tool_name == tool_name:
-                tool(input_dir, output_dir)
+                tool(input_dir, output_dir, tier=tier)
                 return
+
+    def batch_invoke_a_tool(self,
+                            subtask_name: str, tool_name: str,
+                            input_paths: list[Path], output_dir: Path,
+                            tier: Optional[str] = None) -> list[Path]:
+        """Invokes a tool on many images. See `Tool.batch_call`."""
+        toolbox = self.toolbox_router[subtask_name]
+        for tool in toolbox:
+            if tool.tool_name == tool_name:
+                return tool.batch_call(input_paths, output_dir, silent=True, tier=tier)
+        raise ValueError(f"Tool {tool_name} not found for {subtask_name}.")
             
     def test_toolbox(self, 
                      input_dir: Path, 
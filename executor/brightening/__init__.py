@@ -18,6 +18,16 @@ class BrighteningTool(Tool):
     
     def _invoke(self):
         input_path = list(self.input_dir.glob('*'))[0]
+        self._brighten(input_path, self.output_dir / 'output.png')
+
+    def _batch_invoke(self, input_paths: list[Path], tmp_dir: Path) -> list[Path]:
+        """In-process, thus no directory per image."""
+        res_paths = [tmp_dir / f"{i:06d}.png" for i in range(len(input_paths))]
+        for input_path, res_path in zip(input_paths, res_paths):
+            self._brighten(input_path, res_path)
+        return res_paths
+
+    def _brighten(self, input_path: Path, output_path: Path) -> None:
         img = cv2.imread(str(input_path))
         hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
         h, s, v = cv2.split(hsv)
@@ -26,8 +36,7 @@ class BrighteningTool(Tool):
 
         hsv = cv2.merge((h, s, v))
         img = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-        output_path = str(self.output_dir / 'output.png')
-        cv2.imwrite(output_path, img)
+        cv2.imwrite(str(output_path), img)
 
     def _update_v(self, v: np.ndarray) -> np.ndarray:
         raise NotImplementedError
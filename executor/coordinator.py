@@ -0,0 +1,87 @@
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from llm.http_client import http_client
+from utils.batching import BatchQueue
+from .tool import Tool
+
+
+class ToolCoordinator:
+    """Lets concurrent agents share invocations of tools: requests for the same tool at the same tier are queued, and flushed as one `Tool.batch_call` after at most `max_wait` seconds, so that the model is loaded once per batch. Only tools batching natively (see `Tool.batches_natively`) are queued, since the others gain nothing and would lose the parallelism across agents; they are invoked directly. Batches of the same queued tool are serialized, so that its model is not loaded several times at once. Evaluations of degradation by DepictQA are coalesced likewise into one request to the server, see `depictqa_queue`.
+
+    Args:
+        max_batch_size (int, optional): Maximum number of images in a batch. Defaults to 16.
+        max_wait (float, optional): Flush window in seconds. Defaults to 0.05.
+        depictqa_url (str, optional): Endpoint evaluating queries about multiple images. Defaults to "http://127.0.0.1:5001/evaluate_degradations_batch".
+    """
+
+    def __init__(self,
+                 max_batch_size: int = 16,
+                 max_wait: float = 0.05,
+                 depictqa_url: str = "http://127.0.0.1:5001/evaluate_degradations_batch"):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.depictqa_url = depictqa_url
+        self.tool_queues: dict[tuple[str, str, str], BatchQueue] = {}
+        self._tool_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        # queries of `{"imageA_path": ..., "prompt": ...}`, answered in text
+        self.depictqa_queue = BatchQueue(
+            self._evaluate_by_depictqa, max_batch_size=max_batch_size, max_wait=max_wait)
+
+    def invoke(self, tool: Tool, input_dir: Path, output_dir: Path,
+               tier: Optional[str] = None) -> float:
+        """Counterpart of `tool(input_dir, output_dir, silent=True, tier=tier)`, blocking until the batch containing it is done. Returns the seconds attributed to this request, i.e., its share of the batch, excluding the wait in the queue and the batches of others."""
+        if not tool.batches_natively:
+            start_time = time.time()
+            tool(input_dir, output_dir, silent=True, tier=tier)
+            return time.time() - start_time
+        assert len(os.listdir(input_dir)) == 1, "The input directory should contain the input only."
+        assert os.listdir(output_dir) == [], "The output directory should be empty."
+        tier = tool.resolve_tier(tier)
+        key = (tool.subtask, tool.tool_name, tier)
+        with self._lock:
+            if key not in self.tool_queues:
+                self._tool_locks.setdefault(key[:2], threading.Lock())
+                self.tool_queues[key] = BatchQueue(
+                    lambda requests: self._run_batch(tool, tier, requests),
+                    max_batch_size=self.max_batch_size, max_wait=self.max_wait)
+            tool_queue = self.tool_queues[key]
+        input_path = next(input_dir.glob('*')).resolve()
+        return tool_queue.submit([{"input_path": input_path, "output_dir": output_dir}])[0]
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "tools": {'@'.join(key): tool_queue.stats
+                      for key, tool_queue in self.tool_queues.items()},
+            "depictqa": self.depictqa_queue.stats,
+        }
+
+    def _run_batch(self, tool: Tool, tier: str, requests: list[dict]) -> list[float]:
+        """Returns the share of seconds of each request."""
+        with self._tool_locks[(tool.subtask, tool.tool_name)], \
+                tempfile.TemporaryDirectory() as tmp_dir:
+            start_time = time.time()
+            tmp_dir = Path(tmp_dir).resolve()
+            # named by indices, since the inputs of agents share names
+            input_paths = []
+            for i, r in enumerate(requests):
+                input_path = tmp_dir / f"{i:06d}{r['input_path'].suffix}"
+                input_path.symlink_to(r["input_path"])
+                input_paths.append(input_path)
+            output_paths = tool.batch_call(input_paths, tmp_dir / "output", silent=True, tier=tier)
+            for output_path, r in zip(output_paths, requests):
+                shutil.move(output_path, r["output_dir"] / "output.png")
+            seconds = time.time() - start_time
+        return [seconds / len(requests)] * len(requests)
+
+    def _evaluate_by_depictqa(self, queries: list[dict]) -> list[str]:
+        payload = {"queries": json.dumps(queries)}
+        return http_client.post(self.depictqa_url, data=payload).json()["answers"]
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 import yaml
 import shutil
+import subprocess
 
 from .tool import Tool
 
@@ -61,6 +62,22 @@ class BasicSRModel(Tool):
             if p.is_dir():
                 shutil.rmtree(p)
 
+    def _batch_invoke(self, input_paths: list[Path], tmp_dir: Path) -> list[Path]:
+        """BasicSR tests a whole directory, so the model is loaded once for all images."""
+        self.input_dir = tmp_dir / "input"
+        self.output_dir = tmp_dir / "output"
+        self._link_batch_inputs(input_paths, self.input_dir)
+        self.output_dir.mkdir()
+        self._preprocess()
+        subprocess.run(self._get_cmd(), cwd=self.work_dir, shell=True, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.new_cfg_dir)
+        # named after the inputs, optionally with a suffix
+        res_paths = sorted(self.output_dir.rglob('*.png'), key=lambda p: p.name)
+        assert len(res_paths) == len(input_paths), \
+            f'There should be {len(input_paths)} output images in {self.output_dir}'
+        return res_paths
+
 
 class XRestormer(BasicSRModel):
     """[A Comparative Study of Image Restoration Networks for General Backbone Network Design (ECCV 2024)](https://arxiv.org/abs/2310.11881) for SR, denoising, dehazing, motion deblurring, deraining.
@@ -86,6 +103,9 @@ class SwinIR(Tool):
     """
 
     def __init__(self, subtask: str, pretrained_on: str):
+        if subtask == "super_resolution":
+            # the fast tier uses the medium model instead of the large one
+            self.tiers = ("fast", "best")
         super().__init__(
             tool_name=f"swinir_{pretrained_on}",
             subtask=subtask,
@@ -115,20 +135,25 @@ class SwinIR(Tool):
         }
         self.opt_task, opt_model_names = opt_dict[subtask]
         self.model_name = opt_model_names[pretrained_on]
+        self.fast_model_name = {
+            'gan': '003_realSR_BSRGAN_DFO_s64w8_SwinIR-M_x4_GAN.pth',
+            'psnr': '003_realSR_BSRGAN_DFO_s64w8_SwinIR-M_x4_PSNR.pth'
+        }.get(pretrained_on)
 
     def _get_cmd_opts(self) -> list[str]:
-        """Requires parameter `input_dir: Path`, `output_dir: Path`, `opt_task: str`, and `model_name: str`."""
+        """Requires parameter `input_dir: Path`, `output_dir: Path`, `opt_task: str`, `model_name: str`, and `tier: str`."""
+        fast = self.subtask == "super_resolution" and self.tier == "fast"
+        model_name = self.fast_model_name if fast else self.model_name
         opts = [
             "--task", self.opt_task,
-            "--model_path", f"SwinIR/model_zoo/swinir/{self.model_name}",
+            "--model_path", f"SwinIR/model_zoo/swinir/{model_name}",
             "--folder_lq", self.input_dir,
             "--save_dir", self.output_dir
         ]
         if self.subtask == "super_resolution":
-            opts += [
-                '--scale', '4',
-                '--large_model'
-            ]
+            opts += ['--scale', '4']
+            if not fast:
+                opts += ['--large_model']
         return opts
 
 
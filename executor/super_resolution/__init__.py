@@ -23,6 +23,9 @@ class HAT(BasicSRModel):
 class DiffBIR(Tool):
     """[DiffBIR: Towards Blind Image Restoration with Generative Diffusion Prior (ECCV 2024)](https://arxiv.org/abs/2308.15070)"""    
 
+    tiers = ("fast", "balanced", "best")
+    steps_dict = {"fast": 10, "balanced": 25, "best": 50}
+
     def __init__(self):
         super().__init__(
             tool_name="diffbir",
@@ -38,7 +41,7 @@ class DiffBIR(Tool):
             "--ckpt", "DiffBIR/weights/general_full_v1.ckpt",
             "--reload_swinir",
             "--swinir_ckpt", "DiffBIR/weights/general_swinir_v1.ckpt",
-            "--steps", "50",
+            "--steps", str(self.steps_dict[self.tier]),
             "--sr_scale", "4",
             "--color_fix_type", "wavelet",
             "--output", self.output_dir,
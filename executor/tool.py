@@ -1,12 +1,19 @@
+import copy
 import os
 from pathlib import *
+import shutil
 import subprocess
+import tempfile
 import time
 from typing import Optional
 
 
+# tiers of quality/latency trade-off, from the fastest to the best
+TIERS = ("fast", "balanced", "best")
+
+
 class Tool:
-    """Abstract class for a tool.
+    """Abstract class for a tool. A tool may declare tiers in `tiers` (subset of `TIERS`), and read `self.tier` in `_get_cmd_opts`. Each call runs on a shallow copy of the tool, which holds the state of the call (`tier`, `input_dir`, `output_dir`, etc.), so that a tool can be called by concurrent agents.
 
     Args:
         tool_name (str): Tool name, a valid identifier serving as the name of environment, configuration file, etc. An exception is that if there's '_' in the name, the environment name will be the part before '_'.
@@ -15,6 +22,8 @@ class Tool:
         script_rel_path (Path | str | None, optional): Path relative to the working directory of the script to run. Defaults to None.
     """
 
+    tiers: tuple[str, ...] = ("best",)
+
     def __init__(self,
                  tool_name: str,
                  subtask: str, 
@@ -30,12 +39,19 @@ class Tool:
             self.work_dir: Path = Path().resolve() / 'executor' / subtask / 'tools' / work_dir
             self.script_path: Path = self.work_dir / script_rel_path
 
-    def __call__(self, input_dir: Path, output_dir: Path, silent: bool = False, *args) -> None:
-        """Executes the tool. `input_dir` should be absolute and only contain the input image, and `output_dir` should be empty, which will only contain the output image named `output.png` after the execution."""
+    def __call__(self, input_dir: Path, output_dir: Path, silent: bool = False, *args,
+                 tier: Optional[str] = None) -> None:
+        """Executes the tool. `input_dir` should be absolute and only contain the input image, and `output_dir` should be empty, which will only contain the output image named `output.png` after the execution. `tier` defaults to the best (see `resolve_tier`)."""
+        copy.copy(self)._call(input_dir, output_dir, silent, *args, tier=tier)
+
+    def _call(self, input_dir: Path, output_dir: Path, silent: bool, *args,
+              tier: Optional[str]) -> None:
+        self.tier = self.resolve_tier(tier)
         if not silent:
             print('-'*100)
             print(f"Subtask\t: {self.subtask}")
             print(f"Tool\t: {self.tool_name}")
+            print(f"Tier\t: {self.tier}")
             print(f"Input\t: {list(input_dir.glob('*'))[0]}")
         start_time = time.time()
         self.input_dir = input_dir
@@ -48,6 +64,69 @@ class Tool:
             print(f"Output\t: {list(output_dir.glob('*'))[0]}")
             print(f"Time\t: {round(end_time - start_time, 3)}s")
 
+    def batch_call(self, input_paths: list[Path], output_dir: Path, silent: bool = False,
+                   tier: Optional[str] = None) -> list[Path]:
+        """Executes the tool on many images, the outputs of which are named after the inputs (`{stem}.png`) in `output_dir`. Returns the paths to the outputs, in the order of the inputs. Tools able to process a directory of images at once override `_batch_invoke`."""
+        return copy.copy(self)._batch_call(input_paths, output_dir, silent, tier)
+
+    def _batch_call(self, input_paths: list[Path], output_dir: Path, silent: bool,
+                    tier: Optional[str]) -> list[Path]:
+        self.tier = self.resolve_tier(tier)
+        output_paths = [output_dir / f"{input_path.stem}.png" for input_path in input_paths]
+        assert len(set(output_paths)) == len(output_paths), "Names of inputs should be unique."
+        if not silent:
+            print('-'*100)
+            print(f"Subtask\t: {self.subtask}")
+            print(f"Tool\t: {self.tool_name}")
+            print(f"Tier\t: {self.tier}")
+            print(f"Inputs\t: {len(input_paths)} images")
+        start_time = time.time()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+            res_paths = self._batch_invoke(
+                [input_path.resolve() for input_path in input_paths], Path(tmp_dir).resolve())
+            for res_path, output_path in zip(res_paths, output_paths):
+                shutil.move(res_path, output_path)
+        end_time = time.time()
+        if not silent:
+            print(f"Output\t: {output_dir}")
+            print(f"Time\t: {round(end_time - start_time, 3)}s")
+        return output_paths
+
+    @property
+    def batches_natively(self) -> bool:
+        """Whether the tool processes a batch at once (overriding `_batch_invoke`), rather than image by image."""
+        return type(self)._batch_invoke is not Tool._batch_invoke
+
+    def _batch_invoke(self, input_paths: list[Path], tmp_dir: Path) -> list[Path]:
+        """Invokes the tool image by image in `tmp_dir`, at `self.tier`. Returns the paths to the outputs."""
+        res_paths = []
+        for i, input_path in enumerate(input_paths):
+            input_dir = tmp_dir / f"{i}-input"
+            output_dir = tmp_dir / f"{i}-output"
+            input_dir.mkdir()
+            output_dir.mkdir()
+            (input_dir / f"input{input_path.suffix}").symlink_to(input_path)
+            self(input_dir, output_dir, silent=True, tier=self.tier)
+            res_paths.append(output_dir / "output.png")
+        return res_paths
+
+    def _link_batch_inputs(self, input_paths: list[Path], input_dir: Path) -> None:
+        """Links the inputs into one directory, named by their indices with fixed width, so that the order is kept by names, and no name is a prefix of another."""
+        input_dir.mkdir()
+        for i, input_path in enumerate(input_paths):
+            (input_dir / f"{i:06d}{input_path.suffix}").symlink_to(input_path)
+
+    def resolve_tier(self, tier: Optional[str]) -> str:
+        """Returns the declared tier for the requested one: itself if declared, otherwise the fastest declared tier that is better, or the best declared."""
+        if tier is None:
+            return self.tiers[-1]
+        assert tier in TIERS, f"Unexpected tier: {tier}"
+        for declared in sorted(self.tiers, key=TIERS.index):
+            if TIERS.index(declared) >= TIERS.index(tier):
+                return declared
+        return max(self.tiers, key=TIERS.index)
+
     def _precheck(self) -> None:
         """Checks whether `input_dir` contains the input image named `input.png` only and `output_dir` is empty."""
         assert len(os.listdir(self.input_dir)) == 1, "The input directory should contain the input only."
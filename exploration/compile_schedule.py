@@ -0,0 +1,63 @@
+"""Compiles the experience of exploration (memory/fail_rate.json) into an order table for `IRAgent(schedule_by="table")`.
+
+Sets explored as a whole in all orders take the order with the lowest observed fail rate, keeping the fail rates of all orders for compute-aware scheduling. Other sets compose the pairwise fail rates (see `pipeline.schedule_table.best_order`), and are tabulated only if all their pairs have been explored in both orders.
+"""
+from pathlib import Path
+from itertools import combinations, permutations
+import argparse
+import json
+
+from pipeline.schedule_table import Pairwise, best_order, has_evidence, set_key
+
+
+def collect(experience_hub: dict) -> tuple[Pairwise, dict[str, dict[str, dict]]]:
+    """Returns the pairwise statistics and the statistics of explored orders grouped by set."""
+    pairwise: Pairwise = {}
+    explored: dict[str, dict[str, dict]] = {}
+    for exp in experience_hub.values():
+        for exe_path, stat in exp.items():
+            plan = exe_path.split('+')
+            entry = {"fail_rate": stat["fail rate"]["total"], "n": stat["total"]}
+            explored.setdefault(set_key(plan), {})[exe_path] = entry
+            if len(plan) == 2:
+                pairwise.setdefault(plan[0], {})[plan[1]] = entry
+    return pairwise, explored
+
+
+def compile_table(experience_hub: dict, min_samples: int) -> dict:
+    pairwise, explored = collect(experience_hub)
+    subtasks = sorted(set(pairwise) | {b for a in pairwise for b in pairwise[a]})
+
+    orders = {}
+    for r in range(2, len(subtasks) + 1):
+        for subset in combinations(subtasks, r):
+            key = set_key(subset)
+            stats = explored.get(key, {})
+            if all(stats.get('+'.join(perm), {"n": 0})["n"] >= min_samples
+                   for perm in permutations(subset)):
+                exe_path = min(stats, key=lambda p: stats[p]["fail_rate"])
+                orders[key] = {"order": exe_path.split('+'),
+                               "cost": stats[exe_path]["fail_rate"],
+                               "source": "observed",
+                               "fail_rates": {p: stat["fail_rate"] for p, stat in stats.items()}}
+            elif has_evidence(list(subset), pairwise, min_samples):
+                order, cost = best_order(list(subset), pairwise)
+                orders[key] = {"order": order, "cost": cost, "source": "composed"}
+
+    return {"min_samples": min_samples, "pairwise": pairwise, "orders": orders}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fail_rate_path", type=Path, default=Path("memory/fail_rate.json"))
+    parser.add_argument("--output_path", type=Path, default=Path("memory/schedule_table.json"))
+    parser.add_argument("--min_samples", type=int, default=100,
+                        help="Minimum number of samples for each order of a pair.")
+    args = parser.parse_args()
+
+    with open(args.fail_rate_path) as f:
+        experience_hub = json.load(f)
+    table = compile_table(experience_hub, args.min_samples)
+    print(f"{len(table['orders'])} sets of subtasks tabulated.")
+    with open(args.output_path, "w") as f:
+        json.dump(table, f, indent=2)
@@ -6,6 +6,7 @@ from tqdm import tqdm
 from executor import executor
 from utils.misc import sorted_glob, sorted_rglob
 from utils.img_tree import ImgTree
+from utils.dedupe import DedupeIndex
 
 
 distortion_subtask_dict = {
@@ -48,6 +49,8 @@ def get_n_nodes(subtask_idx_lst: list[int]) -> int:
 
 
 def generate_tree(subtask_idx_lst: list[int], root_dir: Path, virtual: bool = False):
+    """If deduplicating, the subtree under a result near-identical to that of a sibling tool is copied from the sibling instead of generated."""
+    global n_collapsed
     if not subtask_idx_lst:
         return
     for i, subtask_idx in enumerate(subtask_idx_lst):
@@ -58,6 +61,9 @@ def generate_tree(subtask_idx_lst: list[int], root_dir: Path, virtual: bool = Fa
         subtask_dir = root_dir / f"subtask-{subtask}"
         subtask_dir.mkdir()
         input_dir = root_dir / '0-img'
+        dedupe_index = None
+        if args.dedupe_pixel_tol is not None and not virtual:
+            dedupe_index = DedupeIndex(pixel_tol=args.dedupe_pixel_tol)
         for tool in toolbox:
             tool_dir = subtask_dir / f"tool-{tool.tool_name}"
             tool_dir.mkdir()
@@ -65,6 +71,14 @@ def generate_tree(subtask_idx_lst: list[int], root_dir: Path, virtual: bool = Fa
             output_dir.mkdir()
             if not virtual:
                 tool(input_dir, output_dir, silent=True)
+            if dedupe_index is not None:
+                rep = dedupe_index.add(sorted_glob(output_dir)[0])
+                if rep is not None:
+                    rep_tool_dir = rep.parents[1]
+                    for sub_dir in sorted_glob(rep_tool_dir, "subtask-*"):
+                        shutil.copytree(sub_dir, tool_dir / sub_dir.name)
+                    n_collapsed += 1
+                    continue
             generate_tree(rem_subtask_idx_lst, tool_dir, virtual=virtual)
 
 
@@ -72,6 +86,9 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--n_d", type=int, default=2)
 parser.add_argument("--idx", type=int, default=0)
 parser.add_argument("--range", type=int, nargs=2, default=[1, 100])
+parser.add_argument("--dedupe_pixel_tol", type=float, default=None,
+                    help="If set, copy the subtree of a sibling tool with a near-identical result "
+                         "(mean absolute difference within this tolerance) instead of generating it.")
 args = parser.parse_args()
 
 input_dir = Path("dataset/train").resolve()
@@ -107,6 +124,7 @@ expected_n_nodes = get_n_nodes(all_subtask_idx_lst) - 1
 print(f"Expected #leaves: {expected_n_leaves}")
 print(f"Expected #nodes (except root): {expected_n_nodes}")
 
+n_collapsed = 0  # subtrees copied from siblings
 leave_pat = "0-img"
 for i in range(n_d):
     leave_pat = "*/*/" + leave_pat
@@ -142,6 +160,8 @@ if __name__ == "__main__":
     # virtual = True
     virtual = False
     generate_imgs(virtual=virtual)
+    if args.dedupe_pixel_tol is not None:
+        print(f"Subtrees collapsed by dedupe: {n_collapsed}")
 
     # all
     if not virtual:
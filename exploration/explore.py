@@ -49,9 +49,9 @@ def explore_order():
                         experience[task][plan][degra] = 0
                 experience[task][plan]["total"] += 1
                 for degra in degradations:
-                    level = eval(dqa(img_path=leave_path, 
+                    level = dqa(img_path=leave_path, 
                                 task="eval_degradation",
-                                degradation=degra))[0][1]
+                                degradation=degra)[0][1]
                     # experience[task][plan][degra][level] = experience[task][plan][degra].get(level, 0)+1
                     if level in levels_to_address:
                         experience[task][plan][degra] += 1
@@ -70,6 +70,6 @@ def explore_order():
 
 mem_dir = Path("memory")
 root_exh_dir = Path("exhaustive_sequences")
-dqa = DepictQA()
+dqa = DepictQA(cache_path=Path(".cache/llm_cache.sqlite"))
 levels_to_address = {"medium", "high", "very high"}
 explore_order()
\ No newline at end of file
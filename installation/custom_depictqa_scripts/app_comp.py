@@ -2,6 +2,7 @@ import argparse
 import logging
 import os
 import pprint
+import tempfile
 
 import torch
 import yaml
@@ -11,6 +12,9 @@ from easydict import EasyDict
 from model.depictqa import DepictQA
 
 from flask import Flask, request
+from PIL import Image
+
+from batching import BatchQueue
 
 
 def parse_args():
@@ -21,11 +25,53 @@ def parse_args():
     parser.add_argument("--dataset_name", type=str, default=None)
     parser.add_argument("--task_name", type=str, default=None)
     parser.add_argument("--batch_size", type=int, default=None)
+    # serving cfgs, overwrite cfg.serving if set
+    parser.add_argument("--max_batch_size", type=int, default=None)
+    parser.add_argument("--max_wait_ms", type=float, default=None)
     args = parser.parse_args()
     return args
 
 app = Flask(__name__)
 
+def generate(queries: list[dict]) -> list[str]:
+    """Answers queries (each with `prompt`, `imageA_path`, and `imageB_path`) in one batched generation."""
+    texts, output_ids, probs, confidences = model.generate(
+        {
+            "query": [q["prompt"] for q in queries],
+            "img_path": [None] * len(queries),
+            "img_A_path": [q["imageA_path"] for q in queries],
+            "img_B_path": [q["imageB_path"] for q in queries],
+            "temperature": cfg.infer["temperature"],
+            "top_p": cfg.infer["top_p"],
+            "max_new_tokens": cfg.infer["max_new_tokens"],
+            "task_type": "quality_compare_noref",
+            "output_prob_id": cfg.infer["output_prob_id"],
+            "output_confidence": cfg.infer["output_confidence"],
+            "sentence_model": cfg.infer["sentence_model"],
+        }
+    )
+    return [text.strip() for text in texts]
+
+
+def warmup() -> None:
+    """Runs a full-size batch once so that the first requests do not pay for initialization."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        img_path = os.path.join(tmp_dir, "warmup.png")
+        Image.new("RGB", (224, 224), (128, 128, 128)).save(img_path)
+        generate([{"prompt": "Which of the two images is of better quality?",
+                   "imageA_path": img_path, "imageB_path": img_path}]
+                 * cfg.serving["max_batch_size"])
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    return {
+        "status": "ok",
+        "checkpoint": os.path.splitext(os.path.basename(cfg.model["delta_path"]))[0],
+        **batcher.stats,
+    }
+
+
 @app.route("/compare_quality", methods=["POST"])
 def query():
     """Compares the quality of two images.
@@ -43,23 +89,10 @@ def query():
     prompt = request.form.get('prompt')
     assert os.path.exists(image_A)
     assert os.path.exists(image_B)
-    texts, output_ids, probs, confidences = model.generate(
-        {
-            "query": [prompt],
-            "img_path": [None],
-            "img_A_path": [image_A],
-            "img_B_path": [image_B],
-            "temperature": cfg.infer["temperature"],
-            "top_p": cfg.infer["top_p"],
-            "max_new_tokens": cfg.infer["max_new_tokens"],
-            "task_type": "quality_compare_noref",
-            "output_prob_id": cfg.infer["output_prob_id"],
-            "output_confidence": cfg.infer["output_confidence"],
-            "sentence_model": cfg.infer["sentence_model"],
-        }
-    )
-    text = texts[0].strip()
-    return {"answer": text}
+    answer = batcher.submit([
+        {"prompt": prompt, "imageA_path": image_A, "imageB_path": image_B}
+    ])[0]
+    return {"answer": answer}
 
 
 if __name__ == "__main__":
@@ -72,7 +105,9 @@ if __name__ == "__main__":
         if key != "cfg" and args[key] is not None:
             args_filter[key] = args[key]
     # command line has higher priority
-    cfg.data.infer.update(args_filter)
+    serving_keys = {"max_batch_size", "max_wait_ms"}
+    cfg.data.infer.update({k: v for k, v in args_filter.items() if k not in serving_keys})
+    cfg.serving.update({k: v for k, v in args_filter.items() if k in serving_keys})
 
     logging.info("args: {}".format(pprint.pformat(cfg)))
     assert os.path.exists(
@@ -89,4 +124,10 @@ if __name__ == "__main__":
     Visualization(model).structure_graph()
     logging.info(f"[!] init the LLM over ...")
 
-    app.run(host='0.0.0.0', port=5002, debug=True, use_reloader=False)
+    batcher = BatchQueue(generate,
+                         max_batch_size=cfg.serving["max_batch_size"],
+                         max_wait=cfg.serving["max_wait_ms"] / 1000)
+    warmup()
+    logging.info(f"[!] warmup over ...")
+
+    app.run(host='0.0.0.0', port=5002, threaded=True)
@@ -1,7 +1,9 @@
 import argparse
+import json
 import logging
 import os
 import pprint
+import tempfile
 
 import torch
 import yaml
@@ -11,6 +13,9 @@ from easydict import EasyDict
 from model.depictqa import DepictQA
 
 from flask import Flask, request
+from PIL import Image
+
+from batching import BatchQueue
 
 
 def parse_args():
@@ -21,17 +26,65 @@ def parse_args():
     parser.add_argument("--dataset_name", type=str, default=None)
     parser.add_argument("--task_name", type=str, default=None)
     parser.add_argument("--batch_size", type=int, default=None)
+    # serving cfgs, overwrite cfg.serving if set
+    parser.add_argument("--max_batch_size", type=int, default=None)
+    parser.add_argument("--max_wait_ms", type=float, default=None)
     args = parser.parse_args()
     return args
 
 app = Flask(__name__)
 
+def generate(queries: list[dict]) -> list[str]:
+    """Answers queries (each with `prompt` and `imageA_path`) in one batched generation."""
+    texts, output_ids, probs, confidences = model.generate(
+        {
+            "query": [q["prompt"] for q in queries],
+            "img_path": [None] * len(queries),
+            "img_A_path": [q["imageA_path"] for q in queries],
+            "img_B_path": [None] * len(queries),
+            "temperature": cfg.infer["temperature"],
+            "top_p": cfg.infer["top_p"],
+            "max_new_tokens": cfg.infer["max_new_tokens"],
+            "task_type": "quality_single_A_noref",
+            "output_prob_id": cfg.infer["output_prob_id"],
+            "output_confidence": cfg.infer["output_confidence"],
+            "sentence_model": cfg.infer["sentence_model"],
+        }
+    )
+    return [text.strip() for text in texts]
+
+
+def evaluate(image_A: str, prompts: list[str]) -> list[str]:
+    """Answers the prompts about the same image, batched with concurrent requests."""
+    return batcher.submit([
+        {"prompt": prompt, "imageA_path": image_A} for prompt in prompts
+    ])
+
+
+def warmup() -> None:
+    """Runs a full-size batch once so that the first requests do not pay for initialization."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        img_path = os.path.join(tmp_dir, "warmup.png")
+        Image.new("RGB", (224, 224), (128, 128, 128)).save(img_path)
+        generate([{"prompt": "What's the severity of noise in this image?",
+                   "imageA_path": img_path}] * cfg.serving["max_batch_size"])
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    return {
+        "status": "ok",
+        "checkpoint": os.path.splitext(os.path.basename(cfg.model["delta_path"]))[0],
+        **batcher.stats,
+    }
+
+
 @app.route("/evaluate_degradation", methods=["POST"])
 def query():
     """Evaluates the level of degradation in an image.
 
     Args:
-        imageA_path, imageB_path (Path)
+        imageA_path (Path)
         prompt (str)
 
     Returns:
@@ -41,23 +94,45 @@ def query():
     image_A = request.form.get('imageA_path')
     prompt = request.form.get('prompt')
     assert os.path.exists(image_A)
-    texts, output_ids, probs, confidences = model.generate(
-        {
-            "query": [prompt],
-            "img_path": [None],
-            "img_A_path": [image_A],
-            "img_B_path": [None],
-            "temperature": cfg.infer["temperature"],
-            "top_p": cfg.infer["top_p"],
-            "max_new_tokens": cfg.infer["max_new_tokens"],
-            "task_type": "quality_single_A_noref",
-            "output_prob_id": cfg.infer["output_prob_id"],
-            "output_confidence": cfg.infer["output_confidence"],
-            "sentence_model": cfg.infer["sentence_model"],
-        }
-    )
-    text = texts[0].strip()
-    return {"answer": text}
+    return {"answer": evaluate(image_A, [prompt])[0]}
+
+
+@app.route("/evaluate_degradations", methods=["POST"])
+def query_batch():
+    """Evaluates the levels of multiple degradations in an image.
+
+    Args:
+        imageA_path (Path)
+        prompts (str): JSON list of prompts, one for each degradation.
+
+    Returns:
+        list[str]: Responses in text, in the order of prompts.
+    """
+    assert request.form.keys() == {'imageA_path', 'prompts'}
+    image_A = request.form.get('imageA_path')
+    prompts = json.loads(request.form.get('prompts'))
+    assert os.path.exists(image_A)
+    assert isinstance(prompts, list) and prompts
+    return {"answers": evaluate(image_A, prompts)}
+
+
+@app.route("/evaluate_degradations_batch", methods=["POST"])
+def query_multi():
+    """Evaluates the levels of degradations in multiple images, e.g., coalesced from concurrent agents.
+
+    Args:
+        queries (str): JSON list of queries, each with `imageA_path` and `prompt`.
+
+    Returns:
+        list[str]: Responses in text, in the order of queries.
+    """
+    assert request.form.keys() == {'queries'}
+    queries = json.loads(request.form.get('queries'))
+    assert isinstance(queries, list) and queries
+    for q in queries:
+        assert q.keys() == {'imageA_path', 'prompt'}
+        assert os.path.exists(q['imageA_path'])
+    return {"answers": batcher.submit(queries)}
 
 
 if __name__ == "__main__":
@@ -70,7 +145,9 @@ if __name__ == "__main__":
         if key != "cfg" and args[key] is not None:
             args_filter[key] = args[key]
     # command line has higher priority
-    cfg.data.infer.update(args_filter)
+    serving_keys = {"max_batch_size", "max_wait_ms"}
+    cfg.data.infer.update({k: v for k, v in args_filter.items() if k not in serving_keys})
+    cfg.serving.update({k: v for k, v in args_filter.items() if k in serving_keys})
 
     logging.info("args: {}".format(pprint.pformat(cfg)))
     assert os.path.exists(
@@ -87,4 +164,10 @@ if __name__ == "__main__":
     Visualization(model).structure_graph()
     logging.info(f"[!] init the LLM over ...")
 
-    app.run(host='0.0.0.0', port=5001, debug=True, use_reloader=False)
+    batcher = BatchQueue(generate,
+                         max_batch_size=cfg.serving["max_batch_size"],
+                         max_wait=cfg.serving["max_wait_ms"] / 1000)
+    warmup()
+    logging.info(f"[!] warmup over ...")
+
+    app.run(host='0.0.0.0', port=5001, threaded=True)
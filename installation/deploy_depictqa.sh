@@ -2,6 +2,7 @@ git clone https://github.com/XPixelGroup/DepictQA.git
 
 mv installation/custom_depictqa_scripts/app_eval.py DepictQA/src/
 mv installation/custom_depictqa_scripts/app_comp.py DepictQA/src/
+cp utils/batching.py DepictQA/src/
 
 mkdir DepictQA/experiments/agenticir
 mv installation/custom_depictqa_scripts/config_eval.yaml DepictQA/experiments/agenticir/
@@ -47,3 +47,10 @@ ln -s $(pwd)/executor/dehazing/tools/X-Restormer executor/motion_deblurring/tool
 
 ln -s $(pwd)/executor/denoising/tools/SwinIR executor/super_resolution/tools/
 ln -s $(pwd)/executor/dehazing/tools/X-Restormer executor/super_resolution/tools/
+
+# weights of SwinIR-M for the fast tier of super-resolution (see `executor/multitask_tools.py`);
+# weights of the other tiers and tools are downloaded as described in installation/INSTALL.md
+mkdir -p executor/denoising/tools/SwinIR/model_zoo/swinir
+for model in 003_realSR_BSRGAN_DFO_s64w8_SwinIR-M_x4_GAN.pth 003_realSR_BSRGAN_DFO_s64w8_SwinIR-M_x4_PSNR.pth; do
+    wget -nc -P executor/denoising/tools/SwinIR/model_zoo/swinir https://github.com/JingyunLiang/SwinIR/releases/download/v0.0/$model
+done
@@ -1,18 +1,31 @@
 from pathlib import Path
+import asyncio
 import logging
+import shutil
+import threading
 from typing import Optional
 import yaml
 
-from utils.misc import encode_img
+from utils.misc import hash_img
 from utils.logger import get_logger
 
 
 class BaseLLM:
+    """
+    Args:
+        config_path (Path | None, optional): Path to the config file. Defaults to None.
+        log_path (Path | None, optional): Path to the markdown log of chats. Defaults to None.
+        logger (logging.Logger | None, optional): Logger of chats, exclusive with `log_path`. Defaults to None.
+        silent (bool, optional): Whether to suppress the console output. Defaults to False.
+        img_store_dir (Path | None, optional): Directory, next to the log file, where images in chats are stored once per content and linked from the log. Defaults to None, i.e., "qa_images" next to `log_path` if given; otherwise images are not logged.
+    """
+
     def __init__(self,
                  config_path: Optional[Path] = None,
                  log_path: Optional[Path] = None,
                  logger: Optional[logging.Logger] = None,
-                 silent: bool = False
+                 silent: bool = False,
+                 img_store_dir: Optional[Path] = None
                  ):
         if config_path is not None:
             with open(config_path, "r") as f:
@@ -21,6 +34,9 @@ class BaseLLM:
             self.cfg = None
 
         self.silent = silent
+        # keeps the lines of concurrent chats from interleaving in the log
+        self._log_lock = threading.Lock()
+        self.n_calls = 0  # number of chats, e.g., for budgets of callers
 
         self.logger = None
         if logger is not None:
@@ -32,18 +48,42 @@ class BaseLLM:
                 log_file=log_path,
                 console_log_level=logging.WARNING,
                 file_format_str="%(message)s",
-                silent=self.silent)
+                silent=self.silent,
+                async_file=True)
+
+        if img_store_dir is None and log_path is not None:
+            img_store_dir = Path(log_path).parent / "qa_images"
+        self.img_store_dir = img_store_dir
+        if self.img_store_dir is not None:
+            self.img_store_dir.mkdir(parents=True, exist_ok=True)
 
     def query(self,
               img_path_lst: Optional[list[Path]] = None,
-              *args, **kwargs) -> tuple[str, str]:
-        """Returns the prompt and response in text."""
+              *args, **kwargs) -> tuple[str, object]:
+        """Returns the prompt and response, in text unless parsed by the model (see `DepictQA`)."""
         raise NotImplementedError
 
     def __call__(self,
                  img_path: Optional[Path | list[Path]] = None,
-                 *args, **kwargs) -> str:
+                 *args, **kwargs) -> object:
         """Queries the model and logs the chat."""
+        img_path_lst = self._to_img_path_lst(img_path)
+        prompt, rsp = self.query(img_path_lst, *args, **kwargs)
+        self._finish_chat(prompt, img_path_lst, str(rsp))
+        return rsp
+
+    async def acall(self,
+                    img_path: Optional[Path | list[Path]] = None,
+                    *args, **kwargs) -> object:
+        """Async counterpart of `__call__`, so that multiple queries can overlap."""
+        img_path_lst = self._to_img_path_lst(img_path)
+        prompt, rsp = await asyncio.to_thread(
+            self.query, img_path_lst, *args, **kwargs)
+        self._finish_chat(prompt, img_path_lst, str(rsp))
+        return rsp
+
+    def _to_img_path_lst(self, img_path: Optional[Path | list[Path]]
+                         ) -> Optional[list[Path]]:
         img_path_lst = img_path
         if img_path is not None:
             if isinstance(img_path, Path):
@@ -51,34 +91,46 @@ class BaseLLM:
             else:
                 assert isinstance(img_path, list), \
                     f"Unexpected type of img_path: {type(img_path)}"
-        prompt, rsp_text = self.query(img_path_lst, *args, **kwargs)
+        return img_path_lst
 
-        img_base64_lst = []
-        if img_path_lst is not None:
+    def _finish_chat(self,
+                     prompt: str,
+                     img_path_lst: Optional[list[Path]],
+                     rsp_text: str) -> None:
+        img_link_lst = []
+        if img_path_lst is not None and self.img_store_dir is not None:
             for img_path in img_path_lst:
-                img_base64 = encode_img(img_path)
-                img_base64_lst.append(img_base64)
+                img_link_lst.append(self._store_img(img_path))
 
-        self._log_chat(prompt, img_base64_lst, rsp_text)
-        self._post_process()
+        with self._log_lock:
+            self.n_calls += 1
+            self._log_chat(prompt, img_link_lst, rsp_text)
+            self._post_process()
 
-        return rsp_text
+    def _store_img(self, img_path: Path) -> str:
+        """Stores the image once per content and returns its link relative to the log file."""
+        img_name = f"{hash_img(img_path)}{img_path.suffix}"
+        stored_path = self.img_store_dir / img_name
+        if not stored_path.exists():
+            tmp_path = stored_path.with_name(f".{img_name}.{threading.get_ident()}")
+            shutil.copy(img_path, tmp_path)
+            tmp_path.replace(stored_path)  # atomic, in case of concurrent writers
+        return f"{self.img_store_dir.name}/{img_name}"
 
     def _post_process(self):
         pass
 
     def _log_chat(self,
                   prompt: str,
-                  img_base64_lst: list[str],
+                  img_link_lst: list[str],
                   rsp_text: str) -> None:
-        """Logs the single-round chat in markdown format."""
+        """Logs the single-round chat in markdown format. Images are linked rather than embedded; see `utils.render_qa_log` for a self-contained version."""
         def escape(s: str):
             return s.replace('<', R'\<').replace('>', R'\>')
         self._log("**Question**")
         self._log(f"{escape(prompt)}")
-        if img_base64_lst is not None:
-            for img_base64 in img_base64_lst:
-                self._log(f"![image]({img_base64})")
+        for img_link in img_link_lst:
+            self._log(f"![image]({img_link})")
         self._log(f"**Answer (from {self.__class__.__name__})**")
         self._log(f"{escape(rsp_text)}")
 
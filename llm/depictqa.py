@@ -1,32 +1,55 @@
 from pathlib import Path
-import requests
+import json
 import logging
+import threading
 from typing import Optional
 
 from .base_llm import BaseLLM
+from .http_client import http_client
+from utils.cache import SQLiteCache
+from utils.misc import hash_img
 from pipeline.prompts import depictqa_evaluate_degradation_prompt, depictqa_compare_prompt
 from utils.custom_types import Degradation, Level
 
 
 class DepictQA(BaseLLM):
-    """Parameters when called: img_path_lst, task (eval_degradation or comp_quality), degradations (if task is eval_degradation)."""
+    """Parameters when called: img_path_lst, task (eval_degradation or comp_quality), degradations (if task is eval_degradation). Returns the list of (degradation, level) for eval_degradation, and "former" or "latter" for comp_quality.
+
+    Args:
+        cache_path (Path | str | None, optional): If not None, answers are cached in this SQLite database keyed by image content and prompt, so that repeated evaluations are free. Defaults to None.
+        eval_checkpoint (str | None, optional): Name of the checkpoint served for degradation evaluation, which versions the cached answers. Defaults to None, i.e., the one reported by `/health` of the server on first use.
+        comp_checkpoint (str | None, optional): Name of the checkpoint served for quality comparison, which versions the cached answers. Defaults to None, i.e., the one reported by `/health` of the server on first use.
+        eval_queue (BatchQueue | None, optional): If not None, degradation evaluations are submitted to this queue (see `executor.coordinator.ToolCoordinator.depictqa_queue`), which coalesces those of concurrent agents into one request. Defaults to None.
+    """
 
     def __init__(
         self,
         log_path: Optional[Path | str] = None,
         logger: Optional[logging.Logger] = None,
         silent: bool = False,
+        cache_path: Optional[Path | str] = None,
+        eval_checkpoint: Optional[str] = None,
+        comp_checkpoint: Optional[str] = None,
+        img_store_dir: Optional[Path] = None,
+        eval_queue=None,
     ):
         super().__init__(
-            log_path=log_path, logger=logger, silent=silent
-        )  # set attributes: cfg, logger, silent
+            log_path=log_path, logger=logger, silent=silent,
+            img_store_dir=img_store_dir
+        )  # set attributes: cfg, logger, silent, img_store_dir
+
+        self.eval_queue = eval_queue
+        self.cache_path = cache_path
+        self.checkpoints = {"eval": eval_checkpoint, "comp": comp_checkpoint}
+        self._caches: dict[str, SQLiteCache] = {}
+        self._caches_lock = threading.Lock()
 
     def query(
         self,
         img_path_lst: list[Path],
         task: str,
-        degradation: Optional[Degradation] = None,
-    ) -> tuple[str, str]:
+        degradation: Optional[Degradation | list[Degradation]] = None,
+    ) -> tuple[str, list[tuple[Degradation, Level]] | str]:
         assert task in ["eval_degradation", "comp_quality"], f"Unexpected task: {task}"
         if task == "eval_degradation":
             assert (
@@ -40,8 +63,9 @@ class DepictQA(BaseLLM):
             return self.compare_img_qual(img_path_lst[0], img_path_lst[1])
 
     def eval_degradation(
-        self, img: Path, degradation: Optional[Degradation]
-    ) -> tuple[str, str]:
+        self, img: Path, degradation: Optional[Degradation | list[Degradation]]
+    ) -> tuple[str, list[tuple[Degradation, Level]]]:
+        """Evaluates all degradations if `degradation` is None, otherwise the given one or list."""
         all_degradations: list[Degradation] = [
             "motion blur",
             "defocus blur",
@@ -53,6 +77,10 @@ class DepictQA(BaseLLM):
         ]
         if degradation is None:
             degradations_lst = all_degradations
+        elif isinstance(degradation, list):
+            for d in degradation:
+                assert d in all_degradations, f"Unexpected degradation: {d}"
+            degradations_lst = degradation
         else:
             if degradation == "low resolution":
                 degradation = "blur"
@@ -66,31 +94,74 @@ class DepictQA(BaseLLM):
             degradations_lst = [degradation]
 
         levels: set[Level] = {"very low", "low", "medium", "high", "very high"}
-        res: list[tuple[Degradation, Level]] = []
-        for degradation in degradations_lst:
-            prompt = depictqa_evaluate_degradation_prompt.format(
+        prompt_dict: dict[Degradation, str] = {
+            degradation: depictqa_evaluate_degradation_prompt.format(
                 degradation=degradation
             )
+            for degradation in degradations_lst
+        }
+        level_dict: dict[Degradation, Level] = {}
+        cache_key_dict: dict[Degradation, str] = {}
+        eval_cache = self._get_cache("eval")
+        if eval_cache is not None:
+            img_hash = hash_img(img)
+            for degradation, prompt in prompt_dict.items():
+                cache_key_dict[degradation] = SQLiteCache.make_key(img_hash, prompt)
+                rsp = eval_cache.get(cache_key_dict[degradation])
+                if rsp is not None:
+                    level_dict[degradation] = rsp
+
+        to_query = [d for d in degradations_lst if d not in level_dict]
+        if to_query and self.eval_queue is not None:
+            rsp_lst = self.eval_queue.submit([
+                {"imageA_path": str(img.resolve()), "prompt": prompt_dict[d]} for d in to_query
+            ])
+        elif len(to_query) > 1:
+            # one request for all, so that the server reads the image only once
+            url = "http://127.0.0.1:5001/evaluate_degradations"
+            payload = {
+                "imageA_path": img.resolve(),
+                "prompts": json.dumps([prompt_dict[d] for d in to_query])
+            }
+            rsp_lst: list[str] = http_client.post(url, data=payload).json()["answers"]
+        elif to_query:
             url = "http://127.0.0.1:5001/evaluate_degradation"
-            payload = {"imageA_path": img.resolve(), "prompt": prompt}
-            rsp: str = requests.post(url, data=payload).json()["answer"]
+            payload = {"imageA_path": img.resolve(), "prompt": prompt_dict[to_query[0]]}
+            rsp_lst = [http_client.post(url, data=payload).json()["answer"]]
+        else:
+            rsp_lst = []
+        for degradation, rsp in zip(to_query, rsp_lst):
             assert rsp in levels, f"Unexpected response from DepictQA: {list(rsp)}"
-            res.append((degradation, rsp))
+            if eval_cache is not None:
+                eval_cache.set(cache_key_dict[degradation], rsp)
+            level_dict[degradation] = rsp
+
+        res: list[tuple[Degradation, Level]] = [
+            (degradation, level_dict[degradation]) for degradation in degradations_lst
+        ]
 
         prompt_to_display = depictqa_evaluate_degradation_prompt.format(
             degradation=degradations_lst
         )
-        return prompt_to_display, str(res)
+        return prompt_to_display, res
 
     def compare_img_qual(self, img1: Path, img2: Path) -> tuple[str, str]:
         prompt = depictqa_compare_prompt
-        url = "http://127.0.0.1:5002/compare_quality"
-        payload = {
-            "imageA_path": img1.resolve(),
-            "imageB_path": img2.resolve(),
-            "prompt": prompt
-        }
-        rsp: str = requests.post(url, data=payload).json()["answer"]
+        rsp = None
+        comp_cache = self._get_cache("comp")
+        if comp_cache is not None:
+            cache_key = SQLiteCache.make_key(hash_img(img1), hash_img(img2), prompt)
+            rsp = comp_cache.get(cache_key)
+        if rsp is None:
+            url = "http://127.0.0.1:5002/compare_quality"
+            payload = {
+                "imageA_path": img1.resolve(),
+                "imageB_path": img2.resolve(),
+                "prompt": prompt
+            }
+            rsp: str = http_client.post(url, data=payload).json()["answer"]
+            if comp_cache is not None:
+                comp_cache.set(cache_key, rsp)
 
         if "A" in rsp and "B" not in rsp:
             choice = "former"
@@ -100,3 +171,18 @@ class DepictQA(BaseLLM):
             raise ValueError(f"Unexpected answer from DepictQA: {rsp}")
 
         return prompt, choice
+
+    def _get_cache(self, task: str) -> Optional[SQLiteCache]:
+        """Cache of the answers of the server of `task` ("eval" or "comp"), namespaced by the checkpoint it serves. The server is asked only when the cache is first used, since one may not be running."""
+        if self.cache_path is None:
+            return None
+        with self._caches_lock:
+            if task not in self._caches:
+                checkpoint = self.checkpoints[task]
+                if checkpoint is None:
+                    port = {"eval": 5001, "comp": 5002}[task]
+                    checkpoint = http_client.get(
+                        f"http://127.0.0.1:{port}/health").json()["checkpoint"]
+                self._caches[task] = SQLiteCache(
+                    self.cache_path, namespace=f"depictqa_{task}@{checkpoint}")
+            return self._caches[task]
@@ -5,13 +5,33 @@ from typing import Callable, Optional
 from time import sleep
 import random
 import re
+import threading
 
 from .base_llm import BaseLLM
-from utils.misc import encode_img
+from .http_client import http_client
+from .image_payload import ImagePayloadEncoder
+from .response_parser import ResponseParser
+from .rate_limiter import get_rate_limiter, estimate_text_tokens, estimate_img_tokens
+from utils.cache import SQLiteCache
+from utils.misc import hash_img
 
 
 class GPT4(BaseLLM):
-    """Parameters when called: img_path_lst, prompt, format_check."""
+    """Parameters when called: img_path_lst, prompt, format_check, img_detail.
+
+    Args:
+        img_detail (str, optional): Default detail level of input images, "low", "high", or "auto". Images are downscaled to the resolution the level consumes. Defaults to "auto".
+        img_format (str, optional): Format to re-encode input images, "jpeg", "webp", or "png" (lossless). Defaults to "jpeg".
+        img_quality (int, optional): Quality of re-encoded images in lossy formats. Defaults to 95.
+        structured_output (bool, optional): Whether to request structured output when the format check carries a JSON schema (see `llm.response_parser.with_json_schema`). Defaults to None, i.e., "STRUCTURED_OUTPUT" in the config if any, otherwise False.
+        max_format_retries (int, optional): Maximum number of re-queries when the response cannot be parsed or repaired to pass the format check. Defaults to 3.
+        cache_path (Path | str | None, optional): If not None, responses that pass the format check are cached in this SQLite database and reused for identical requests. Defaults to None.
+        cache_max_entries (int | None, optional): Maximum number of cached responses. Defaults to None (unlimited).
+        cache_ttl (float | None, optional): Lifetime of cached responses in seconds. Defaults to None (forever).
+        rpm (int | None, optional): Requests per minute allowed by the quota. If `rpm` or `tpm` is set, requests wait in a token bucket shared by all GPT4 instances with the same setting. Defaults to None, i.e., "RPM" in the config if any.
+        tpm (int | None, optional): Tokens per minute allowed by the quota. Defaults to None, i.e., "TPM" in the config if any.
+        rate_limit_state_path (Path | str | None, optional): If set, the token bucket is stored in this file to be shared across processes. Defaults to None, i.e., "RATE_LIMIT_STATE_PATH" in the config if any.
+    """
 
     def __init__(self,
                  config_path: Path = Path("config.yml"),
@@ -19,14 +39,27 @@ class GPT4(BaseLLM):
                  logger: Optional[logging.Logger] = None,
                  silent: bool = False,
                  system_message: Optional[str] = None,
-                 model: Optional[str] = None
+                 model: Optional[str] = None,
+                 cache_path: Optional[Path | str] = None,
+                 cache_max_entries: Optional[int] = None,
+                 cache_ttl: Optional[float] = None,
+                 rpm: Optional[int] = None,
+                 tpm: Optional[int] = None,
+                 rate_limit_state_path: Optional[Path | str] = None,
+                 img_detail: str = "auto",
+                 img_format: str = "jpeg",
+                 img_quality: int = 95,
+                 img_store_dir: Optional[Path] = None,
+                 structured_output: Optional[bool] = None,
+                 max_format_retries: int = 3
                  ):
         super().__init__(
             config_path=config_path,
             log_path=log_path,
             logger=logger,
-            silent=silent
-        )  # set attributes: cfg, logger, silent
+            silent=silent,
+            img_store_dir=img_store_dir
+        )  # set attributes: cfg, logger, silent, img_store_dir
 
         self.api_key = self.cfg["OPENAI_API_KEY"]
         if model is None:
@@ -38,6 +71,31 @@ class GPT4(BaseLLM):
 
         self.prompt_tokens = 0
         self.completion_tokens = 0
+        self._usage_lock = threading.Lock()
+
+        assert img_detail in {"low", "high", "auto"}, f"Unexpected detail: {img_detail}"
+        self.img_detail = img_detail
+        self.img_encoder = ImagePayloadEncoder(fmt=img_format, quality=img_quality)
+
+        if structured_output is None:
+            structured_output = self.cfg.get("STRUCTURED_OUTPUT", False)
+        self.structured_output = structured_output
+        self.max_format_retries = max_format_retries
+        self.rsp_parser = ResponseParser()
+
+        self.cache = None
+        if cache_path is not None:
+            self.cache = SQLiteCache(cache_path, namespace="gpt4",
+                                     max_entries=cache_max_entries, ttl=cache_ttl)
+
+        self.rate_limiter = None
+        # fall back to the config so that a fleet of agents can share the setting
+        rpm = self.cfg.get("RPM") if rpm is None else rpm
+        tpm = self.cfg.get("TPM") if tpm is None else tpm
+        rate_limit_state_path = self.cfg.get("RATE_LIMIT_STATE_PATH") \
+            if rate_limit_state_path is None else rate_limit_state_path
+        if rpm is not None or tpm is not None:
+            self.rate_limiter = get_rate_limiter(rpm, tpm, rate_limit_state_path)
 
         self.system_message = system_message
         if self.system_message is not None:
@@ -50,38 +108,103 @@ class GPT4(BaseLLM):
               img_path_lst: Optional[list[Path]] = None,
               prompt: str = "",
               format_check: Optional[Callable[[object], None]] = None,
+              img_detail: Optional[str] = None,
               ) -> tuple[str, str]:
-        headers, payload = self._prepare_for_request(
-            prompt, img_path_lst)
+        if img_detail is None:
+            img_detail = self.img_detail
+        structured = self.structured_output and hasattr(format_check, "json_schema")
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._get_cache_key(prompt, img_path_lst, img_detail, structured)
+            rsp_text = self.cache.get(cache_key)
+            if rsp_text is not None:
+                if format_check is None:
+                    return prompt, rsp_text
+                # the same prompt may be checked differently by different callers;
+                # the parse of the response has been counted when it was received
+                valid, rsp_text = self._check_syntax(rsp_text, format_check, count=False)
+                if valid:
+                    return prompt, rsp_text
+
+        headers, payload, img_size_lst = self._prepare_for_request(
+            prompt, img_path_lst, img_detail)
+        if structured:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": format_check.__name__,
+                    "schema": format_check.json_schema,
+                    "strict": True
+                }
+            }
+        n_tokens = 0
+        if self.rate_limiter is not None:
+            n_tokens = self._estimate_tokens(prompt, img_size_lst, img_detail)
+        n_retries = 0
         while True:
-            response = self._send_request(headers, payload)
+            response = self._send_request(headers, payload, n_tokens)
 
             usage = response.json()["usage"]
-            self.prompt_tokens += usage["prompt_tokens"]
-            self.completion_tokens += usage["completion_tokens"]
+            with self._usage_lock:
+                self.prompt_tokens += usage["prompt_tokens"]
+                self.completion_tokens += usage["completion_tokens"]
 
             rsp_text: str = response.json()['choices'][0]['message']['content']
             if format_check is not None:
                 valid, rsp_text = self._check_syntax(rsp_text, format_check)
                 if not valid:
+                    n_retries += 1
+                    if n_retries > self.max_format_retries:
+                        raise RuntimeError(
+                            f"No response in the expected format after {n_retries} queries.")
                     continue
+            if self.cache is not None:
+                self.cache.set(cache_key, rsp_text)
             return prompt, rsp_text
 
+    def _get_cache_key(self, prompt: str,
+                       img_path_lst: Optional[list[Path]] = None,
+                       img_detail: str = "auto",
+                       structured: bool = False) -> str:
+        """Identifies a request by everything that determines the response."""
+        img_hash_lst = []
+        if img_path_lst is not None:
+            img_hash_lst = [hash_img(img_path) for img_path in img_path_lst]
+        return SQLiteCache.make_key(
+            self.model, self.system_message, prompt, img_hash_lst,
+            img_detail, self.img_encoder.fmt, self.img_encoder.quality,
+            self.max_tokens, self.temperature, structured)
+
+    def _estimate_tokens(self, prompt: str,
+                         img_size_lst: list[tuple[int, int]],
+                         img_detail: str = "auto") -> int:
+        """Estimates the tokens counted against the quota, i.e., the prompt plus `max_tokens`."""
+        n_tokens = estimate_text_tokens(prompt) + self.max_tokens
+        if self.system_message is not None:
+            n_tokens += estimate_text_tokens(self.system_message)
+        for img_size in img_size_lst:
+            n_tokens += estimate_img_tokens(*img_size, detail=img_detail)
+        return n_tokens
+
     def _prepare_for_request(self, prompt: str,
-                             img_path_lst: Optional[list[Path]] = None
-                             ) -> tuple[dict, dict]:
+                             img_path_lst: Optional[list[Path]] = None,
+                             img_detail: str = "auto"
+                             ) -> tuple[dict, dict, list[tuple[int, int]]]:
+        """Returns the headers, the payload, and the sizes of the prepared images."""
         content = [{
             "type": "text",
             "text": prompt
         }]
+        img_size_lst = []
         if img_path_lst is not None:
             for img_path in img_path_lst:
-                img_base64 = encode_img(img_path)
+                img_base64, img_size = self.img_encoder.encode(img_path, img_detail)
+                img_size_lst.append(img_size)
                 content.append({
                     "type": "image_url",
                     "image_url": {
                         "url": img_base64,
-                        "detail": "auto"
+                        "detail": img_detail
                     }
                 })
 
@@ -107,21 +230,26 @@ class GPT4(BaseLLM):
             "temperature": self.temperature
         }
 
-        return headers, payload
+        return headers, payload, img_size_lst
 
     def _send_request(self, headers: dict, payload: dict,
+                      n_tokens: int = 0,
                       max_retries: int = 5,
                       initial_delay: int = 3,
                       exp_base: int = 2,
                       jitter: bool = True) -> requests.Response:
-        """Sends a request to the OpenAI API and handles errors with exponential backoff."""
+        """Sends a request to the OpenAI API and handles errors with exponential backoff. If rate limited proactively, waits for `n_tokens` tokens in the bucket before each attempt."""
 
         n_retries = 0
         backoff_delay = initial_delay
         while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(n_tokens)
             try:
-                response = requests.post("https://api.openai.com/v1/chat/completions",
-                                         headers=headers, json=payload)
+                response = http_client.post("https://api.openai.com/v1/chat/completions",
+                                            headers=headers, json=payload)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.update_from_headers(response.headers)
                 is_valid, recommended_delay = self._check_response(response)
                 if is_valid:
                     return response
@@ -178,23 +306,16 @@ class GPT4(BaseLLM):
 
         return True, None
 
-    def _check_syntax(self, rsp_text: str, format_check: Callable[[object], None]
-                      ) -> tuple[bool, str]:
-        """Checks whether the response is a valid Python object and follows the specified format. 
+    def _check_syntax(self, rsp_text: str, format_check: Callable[[object], None],
+                      count: bool = True) -> tuple[bool, str]:
+        """Checks whether the response is a valid Python object (repaired if possible) and follows the specified format. 
         If valid, returns the processed response (the valid response may be wrapped in something)."""
         # Check if the response is a valid Python object
-        try:
-            obj = eval(rsp_text)
-        except:
-            # GPT may wrap the response in a code block
-            inner_rsp_text = rsp_text.strip("```").lstrip("json").strip()
-            try:
-                obj = eval(inner_rsp_text)
-                rsp_text = inner_rsp_text
-            except:
-                self._log("Failed to parse the response:", level='warning')
-                self._log(rsp_text, level='warning')
-                return False, ""
+        parsed, obj, obj_text = self.rsp_parser.parse(rsp_text, count)
+        if not parsed:
+            self._log("Failed to parse the response:", level='warning')
+            self._log(rsp_text, level='warning')
+            return False, ""
         # Check if the response follows the specified format
         try:
             format_check(obj)
@@ -202,12 +323,22 @@ class GPT4(BaseLLM):
             self._log(f"Failed to pass the format check: {e}", level='warning')
             self._log(f"Response: {obj}", level='warning')
             return False, ""
-        return True, rsp_text
+        return True, obj_text
     
+    @property
+    def cost(self) -> float:
+        """Cost of the token usage so far in dollars."""
+        return self.prompt_tokens/1000*0.01 + self.completion_tokens/1000*0.03
+
     def _post_process(self):
         """Logs the token usage and cost."""        
         self._log("Token usage so far: "
                   f"{self.prompt_tokens} prompt tokens, "
                   f"{self.completion_tokens} completion tokens")
-        total_cost = self.prompt_tokens/1000*0.01 + self.completion_tokens/1000*0.03
-        self._log(f"Cost so far: ${total_cost:.5f}")
+        self._log(f"Cost so far: ${self.cost:.5f}")
+        n_repaired = sum(n for kind, n in self.rsp_parser.stats.items()
+                         if kind not in {"direct", "failed"})
+        self._log(f"Responses parsed so far: {self.rsp_parser.stats['direct']} directly, "
+                  f"{n_repaired} after repair, {self.rsp_parser.stats['failed']} failed")
+        if self.cache is not None:
+            self._log(f"Cache so far: {self.cache.hits} hits, {self.cache.misses} misses")
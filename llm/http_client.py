@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPClient:
+    """HTTP client shared by LLM clients. Connections are kept alive in pools, and the number of in-flight requests to each endpoint (scheme and host) is limited.
+
+    Args:
+        pool_maxsize (int, optional): Maximum number of connections kept alive per host. Defaults to 16.
+        default_concurrency (int, optional): Maximum number of in-flight requests per endpoint unless set by `set_concurrency`. Defaults to 8.
+    """
+
+    def __init__(self, pool_maxsize: int = 16, default_concurrency: int = 8):
+        self.default_concurrency = default_concurrency
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def set_concurrency(self, url: str, n: int) -> None:
+        """Limits the number of in-flight requests to the endpoint of `url`."""
+        with self._lock:
+            self._semaphores[self._endpoint(url)] = threading.BoundedSemaphore(n)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Same as `requests.post`, but over a pooled connection."""
+        with self._limit(url):
+            return self._session.post(url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Same as `requests.get`, but over a pooled connection."""
+        with self._limit(url):
+            return self._session.get(url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> requests.Response:
+        """Async counterpart of `post`, running the request in a worker thread."""
+        return await asyncio.to_thread(self.post, url, **kwargs)
+
+    @contextmanager
+    def _limit(self, url: str):
+        endpoint = self._endpoint(url)
+        with self._lock:
+            if endpoint not in self._semaphores:
+                self._semaphores[endpoint] = threading.BoundedSemaphore(
+                    self.default_concurrency)
+            semaphore = self._semaphores[endpoint]
+        with semaphore:
+            yield
+
+    @staticmethod
+    def _endpoint(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+
+# make singleton
+http_client = HTTPClient()
@@ -0,0 +1,65 @@
+from pathlib import Path
+from base64 import b64encode
+from collections import OrderedDict
+import threading
+
+import cv2
+
+from utils.misc import hash_img
+
+
+class ImagePayloadEncoder:
+    """Prepares images for vision LLM requests. Each image is downscaled to the resolution that the detail level actually consumes, re-encoded compactly, and memoized by content hash.
+
+    Args:
+        fmt (str, optional): "jpeg", "webp", or "png" (lossless). Defaults to "jpeg".
+        quality (int, optional): Quality of lossy formats in [1, 100]. Defaults to 95.
+        max_entries (int, optional): Maximum number of memoized payloads. Defaults to 256.
+    """
+
+    def __init__(self, fmt: str = "jpeg", quality: int = 95, max_entries: int = 256):
+        assert fmt in {"jpeg", "webp", "png"}, f"Unexpected format: {fmt}"
+        self.fmt = fmt
+        self.quality = quality
+        self.max_entries = max_entries
+        self._memo: OrderedDict[tuple, tuple[str, tuple[int, int]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, img_path: Path | str, detail: str = "auto") -> tuple[str, tuple[int, int]]:
+        """Returns the data URI of the prepared image and its size (width, height)."""
+        key = (hash_img(img_path), detail, self.fmt, self.quality)
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+
+        img = cv2.imread(str(img_path))
+        h, w = img.shape[:2]
+        new_w, new_h = self.target_size(w, h, detail)
+        if (new_w, new_h) != (w, h):
+            img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        ext, params = {
+            "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, self.quality]),
+            "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, self.quality]),
+            "png": (".png", []),
+        }[self.fmt]
+        ok, buf = cv2.imencode(ext, img, params)
+        assert ok, f"Failed to encode {img_path}."
+        b64code = b64encode(buf.tobytes()).decode('utf-8')
+        res = (f"data:image/{self.fmt};base64,{b64code}", (new_w, new_h))
+
+        with self._lock:
+            self._memo[key] = res
+            if len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return res
+
+    @staticmethod
+    def target_size(w: int, h: int, detail: str) -> tuple[int, int]:
+        """Size consumed by OpenAI vision models: 512 x 512 at most for "low"; otherwise fit in 2048 x 2048 and then the shortest side at most 768."""
+        if detail == "low":
+            scale = min(1., 512 / max(w, h))
+        else:
+            scale = min(1., 2048 / max(w, h))
+            scale *= min(1., 768 / (min(w, h) * scale))
+        return max(1, round(w * scale)), max(1, round(h * scale))
@@ -0,0 +1,162 @@
+from pathlib import Path
+from contextlib import contextmanager
+import fcntl
+import json
+import math
+import re
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Bucket refilled continuously up to `capacity` at `capacity` per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.level = capacity
+        self.last = time.time()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity,
+                         self.level + (now - self.last) * self.capacity / 60)
+        self.last = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (after `refill`)."""
+        if self.level >= amount:
+            return 0.
+        return (amount - self.level) * 60 / self.capacity
+
+    def to_dict(self) -> dict:
+        return {"level": self.level, "last": self.last}
+
+    def load_dict(self, d: dict) -> None:
+        self.level, self.last = d["level"], d["last"]
+
+
+class RateLimiter:
+    """Token-bucket limiter of requests per minute and tokens per minute, which makes clients wait before sending instead of retrying after errors.
+
+    Args:
+        rpm (int | None): Requests per minute. None for unlimited.
+        tpm (int | None): Tokens per minute. None for unlimited.
+        state_path (Path | None, optional): If not None, the buckets are stored in this file under a lock, so that the quota is shared across processes. Defaults to None.
+    """
+
+    def __init__(self,
+                 rpm: Optional[int],
+                 tpm: Optional[int],
+                 state_path: Optional[Path] = None):
+        self.buckets: dict[str, TokenBucket] = {}
+        if rpm is not None:
+            self.buckets["requests"] = TokenBucket(rpm)
+        if tpm is not None:
+            self.buckets["tokens"] = TokenBucket(tpm)
+        self.state_path = state_path
+        if self.state_path is not None:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            self.state_path.touch()
+        self._lock = threading.Lock()
+        self.total_wait = 0.
+
+    def acquire(self, n_tokens: int) -> None:
+        """Blocks until a request with `n_tokens` tokens can be sent, and consumes the quota."""
+        amounts = {"requests": 1, "tokens": n_tokens}
+        while True:
+            with self._locked_state():
+                now = time.time()
+                wait = 0.
+                for name, bucket in self.buckets.items():
+                    bucket.refill(now)
+                    # a request larger than the capacity can never fit, so let it drain the bucket
+                    wait = max(wait, bucket.wait_time(min(amounts[name], bucket.capacity)))
+                if wait == 0:
+                    for name, bucket in self.buckets.items():
+                        bucket.level -= amounts[name]
+                    return
+            self.total_wait += wait
+            time.sleep(wait)
+
+    def update_from_headers(self, headers: dict) -> None:
+        """Aligns the buckets with the quota reported by the API (`x-ratelimit-remaining-*` and `x-ratelimit-reset-*`)."""
+        with self._locked_state():
+            now = time.time()
+            for name, bucket in self.buckets.items():
+                bucket.refill(now)
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                if remaining is not None:
+                    bucket.level = min(bucket.level, float(remaining))
+                reset = headers.get(f"x-ratelimit-reset-{name}")
+                if reset is not None:
+                    # the bucket should not be full before the reported reset time
+                    bucket.level = min(
+                        bucket.level,
+                        bucket.capacity - parse_reset_time(reset) * bucket.capacity / 60)
+
+    @contextmanager
+    def _locked_state(self):
+        """Context in which the buckets are exclusively owned and up to date."""
+        with self._lock:
+            if self.state_path is None:
+                yield
+                return
+            with open(self.state_path, "r+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    content = f.read()
+                    if content:
+                        state = json.loads(content)
+                        for name, bucket in self.buckets.items():
+                            if name in state:
+                                bucket.load_dict(state[name])
+                    yield
+                    f.seek(0)
+                    f.truncate()
+                    json.dump({name: bucket.to_dict()
+                               for name, bucket in self.buckets.items()}, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_rate_limiters: dict[tuple, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(rpm: Optional[int],
+                     tpm: Optional[int],
+                     state_path: Optional[Path] = None) -> RateLimiter:
+    """Returns the process-wide limiter with the given setting, so that all clients share the quota."""
+    key = (rpm, tpm, None if state_path is None else str(Path(state_path).resolve()))
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(
+                rpm, tpm, None if state_path is None else Path(state_path))
+        return _rate_limiters[key]
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Roughly 4 characters per token for English text."""
+    return math.ceil(len(text) / 4)
+
+
+def estimate_img_tokens(width: int, height: int, detail: str = "auto") -> int:
+    """Estimates the tokens of an image input following the rules of OpenAI vision models."""
+    if detail == "low":
+        return 85
+    # fit in 2048 x 2048, then scale the shortest side to 768
+    scale = min(1., 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1., 768 / min(width, height))
+    width, height = width * scale, height * scale
+    n_tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * n_tiles
+
+
+def parse_reset_time(s: str) -> float:
+    """Parses durations like "1s", "6m0s", and "20ms" in rate limit headers to seconds."""
+    seconds = 0.
+    for value, unit in re.findall(R"(\d+\.?\d*)(ms|h|m|s)", s):
+        seconds += float(value) * {"ms": 1e-3, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
@@ -0,0 +1,136 @@
+import ast
+import json
+import re
+from typing import Callable, Optional
+
+
+def with_json_schema(schema: dict) -> Callable:
+    """Attaches a JSON schema to a format check, so that the structured output mode of the API can enforce the same format."""
+    def decorator(format_check: Callable[[object], None]) -> Callable[[object], None]:
+        format_check.json_schema = schema
+        return format_check
+    return decorator
+
+
+class ResponseParser:
+    """Parses a response into a Python object, tolerating common flaws instead of re-querying:
+    - wrapped in a code block or surrounded by prose: the first balanced literal is extracted;
+    - JSON literals (true/false/null) or curly quotes: normalized;
+    - truncated: open strings and brackets are closed.
+
+    Counts how many responses are parsed directly, repaired (by kind of repair), or failed.
+    """
+
+    def __init__(self):
+        self.stats: dict[str, int] = {"direct": 0, "failed": 0}
+
+    def parse(self, text: str, count: bool = True) -> tuple[bool, object, str]:
+        """Returns whether parsed, the object, and the text of the object as a Python literal, so that callers may `eval` it (the response itself if it is already one, otherwise the repr of the object, e.g., for JSON). Counted in `stats` if `count`, i.e., unless the text has been counted before, e.g., when cached."""
+        ok, obj = self._load(text)
+        if ok:
+            if count:
+                self.stats["direct"] += 1
+            try:
+                ast.literal_eval(text.strip())
+            except Exception:  # JSON only, e.g., with true/false/null
+                return True, obj, repr(obj)
+            return True, obj, text
+
+        candidate = text
+        for repair_kind, repair in [
+            ("extract", self._extract),
+            ("normalize", self._normalize),
+            ("truncation", self._close_truncated),
+        ]:
+            candidate = repair(candidate)
+            if candidate is None:
+                break
+            ok, obj = self._load(candidate)
+            if ok:
+                if count:
+                    self.stats[repair_kind] = self.stats.get(repair_kind, 0) + 1
+                return True, obj, repr(obj)
+
+        if count:
+            self.stats["failed"] += 1
+        return False, None, ""
+
+    @staticmethod
+    def _load(s: str) -> tuple[bool, object]:
+        for load in (ast.literal_eval, json.loads):
+            try:
+                return True, load(s.strip())
+            except Exception:
+                pass
+        return False, None
+
+    @staticmethod
+    def _extract(s: str) -> Optional[str]:
+        """Extracts the first balanced dict/list literal, or the rest from its start if unbalanced."""
+        start = min((i for i in (s.find('{'), s.find('[')) if i >= 0), default=-1)
+        if start < 0:
+            return None
+        stack = []
+        quote = None
+        i = start
+        while i < len(s):
+            c = s[i]
+            if quote is not None:
+                if c == '\\':
+                    i += 1
+                elif c == quote:
+                    quote = None
+            elif c in '"\'':
+                quote = c
+            elif c in '{[':
+                stack.append(c)
+            elif c in '}]':
+                stack.pop()
+                if not stack:
+                    return s[start:i+1]
+            i += 1
+        return s[start:]
+
+    @staticmethod
+    def _normalize(s: str) -> str:
+        """Straightens curly quotes and converts JSON literals outside strings to Python ones."""
+        s = s.replace('“', '"').replace('”', '"')
+        s = s.replace('‘', "'").replace('’', "'")
+        parts = re.split(R"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')""", s)
+        for i in range(0, len(parts), 2):  # even indices are outside strings
+            parts[i] = re.sub(R"\btrue\b", "True", parts[i])
+            parts[i] = re.sub(R"\bfalse\b", "False", parts[i])
+            parts[i] = re.sub(R"\bnull\b", "None", parts[i])
+        return ''.join(parts)
+
+    @staticmethod
+    def _close_truncated(s: str) -> str:
+        """Closes an open string and open brackets, dropping a dangling separator or key."""
+        stack = []
+        quote = None
+        i = 0
+        while i < len(s):
+            c = s[i]
+            if quote is not None:
+                if c == '\\':
+                    i += 1
+                elif c == quote:
+                    quote = None
+            elif c in '"\'':
+                quote = c
+            elif c in '{[':
+                stack.append(c)
+            elif c in '}]' and stack:
+                stack.pop()
+            i += 1
+        if quote is not None:
+            s += quote
+        s = s.rstrip()
+        if stack and stack[-1] == '{':
+            # a dangling key, e.g. `{"a": 1, "b"` or `{"a": 1, "b":`
+            s = re.sub(R"""(,\s*("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')\s*:?|:)$""", "", s)
+        # a dangling separator, e.g. `[1, 2,`
+        s = re.sub(R",$", "", s.rstrip())
+        for c in reversed(stack):
+            s += '}' if c == '{' else ']'
+        return s
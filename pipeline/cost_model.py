@@ -0,0 +1,91 @@
+"""Predicts the compute of plans from per-tool seconds per megapixel and the resolution at each step.
+
+Profile the tools by
+```
+python -m pipeline.cost_model --input_path dataset/example.png
+```
+"""
+from pathlib import Path
+import argparse
+import json
+import shutil
+import tempfile
+from time import time
+from typing import Iterable
+
+from executor import executor
+from utils.custom_types import *
+from utils.misc import get_img_size
+
+
+# subtasks changing the size of images
+SCALE_FACTORS: dict[Subtask, int] = {"super-resolution": 4}
+
+
+class CostModel:
+    """
+    Args:
+        profile_path (Path, optional): Path to the seconds per megapixel of tools. Defaults to Path("memory/tool_profile.json"). If missing, all tools cost 1 second per megapixel.
+    """
+
+    def __init__(self, profile_path: Path = Path("memory/tool_profile.json")):
+        self.profile: dict[ToolName, float] = {}
+        if profile_path.exists():
+            with open(profile_path, "r") as f:
+                self.profile = json.load(f)
+
+    def subtask_cost(self, subtask: Subtask, megapixels: float) -> float:
+        """Seconds to try all tools of the subtask on an image of the size, the worst case of exploration."""
+        return sum(self.profile.get(tool.tool_name, 1.) * megapixels
+                   for tool in executor.toolbox_router[subtask])
+
+    def step_cost(self, done: Iterable[Subtask], subtask: Subtask, megapixels: float) -> float:
+        """Seconds of the subtask after the done ones, starting from an image of `megapixels`."""
+        return self.subtask_cost(subtask, self.scale(megapixels, done))
+
+    def plan_cost(self, plan: list[Subtask], megapixels: float) -> float:
+        """Seconds of the plan, starting from an image of `megapixels`."""
+        return sum(self.step_cost(plan[:i], subtask, megapixels)
+                   for i, subtask in enumerate(plan))
+
+    @staticmethod
+    def scale(megapixels: float, done: Iterable[Subtask]) -> float:
+        """Megapixels of an image of `megapixels` after the done subtasks."""
+        for done_subtask in done:
+            megapixels *= SCALE_FACTORS.get(done_subtask, 1) ** 2
+        return megapixels
+
+    @staticmethod
+    def megapixels(img_path: Path) -> float:
+        w, h = get_img_size(img_path)
+        return w * h / 1e6
+
+
+def profile_tools(input_path: Path) -> dict[ToolName, float]:
+    """Times each tool on the image, returning seconds per megapixel of input."""
+    megapixels = CostModel.megapixels(input_path)
+    profile = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_dir = Path(tmp_dir).resolve() / "input"
+        input_dir.mkdir()
+        shutil.copy(input_path, input_dir / "input.png")
+        for subtask, toolbox in executor.toolbox_router.items():
+            for tool in toolbox:
+                output_dir = Path(tmp_dir).resolve() / f"{subtask}-{tool.tool_name}"
+                output_dir.mkdir()
+                start_time = time()
+                tool(input_dir, output_dir, silent=True)
+                profile[tool.tool_name] = (time() - start_time) / megapixels
+                print(f"{subtask}@{tool.tool_name}: {profile[tool.tool_name]:.2f}s/MP")
+    return profile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_path", type=Path, required=True)
+    parser.add_argument("--output_path", type=Path, default=Path("memory/tool_profile.json"))
+    args = parser.parse_args()
+
+    profile = profile_tools(args.input_path)
+    with open(args.output_path, "w") as f:
+        json.dump(profile, f, indent=2)
@@ -0,0 +1,68 @@
+from pathlib import Path
+import json
+from typing import Optional
+
+from llm.rate_limiter import estimate_text_tokens
+from utils.custom_types import *
+
+
+def build_one_exp(degradations: str, experience: dict) -> str:
+    """Describes the fail rates of all explored orders for a combination of degradations, e.g., "dark+noise"."""
+    this_exp = f"To address {degradations} in the image, "
+    for exe_path, stat in experience.items():
+        plan = exe_path.split('+')
+        degras, fail_rates = [], []
+        for degra, fail_rate in stat['fail rate'].items():
+            if degra != "total":
+                degras.append(degra)
+                fail_rates.append(f"{fail_rate:.0%}")
+        this_exp += (
+            f"when conducting first {plan[0]} and then {plan[1]}, "
+            f"the fail rates of addressing {degras} are {fail_rates} respectively, "
+            f"and the total fail rate is {stat['fail rate']['total']:.0%}; "
+        )
+    this_exp = this_exp[:-2] + '.'  # change "; " to "."
+    return this_exp
+
+
+class ExperienceStore:
+    """Experience of scheduling indexed by combination of degradations, from which only the entries relevant to the current degradations are retrieved.
+
+    Args:
+        fail_rate_path (Path): Path to the fail rates of exploration, keyed by combination of degradations.
+        fallback (str | None, optional): Experience used when no entry is relevant, e.g., the distilled experience. Defaults to None.
+    """
+
+    def __init__(self, fail_rate_path: Path, fallback: Optional[str] = None):
+        with open(fail_rate_path, "r") as f:
+            experience_hub: dict = json.load(f)
+        self.entries: list[tuple[frozenset[Degradation], str, int]] = []
+        for degras, exp in experience_hub.items():
+            text = build_one_exp(degras, exp)
+            self.entries.append(
+                (frozenset(degras.split('+')), text, estimate_text_tokens(text)))
+        self.fallback = fallback
+
+    def retrieve(self, degradations: list[Degradation], token_budget: int) -> str:
+        """Returns the entries involving the degradations, those covered entirely by the degradations first and those sharing more degradations next, as many as the token budget allows."""
+        degradations = set(degradations)
+        relevant = [
+            (len(degras & degradations) / len(degras), len(degras & degradations), text, n_tokens)
+            for degras, text, n_tokens in self.entries
+            if degras & degradations
+        ]
+        relevant.sort(key=lambda x: (-x[0], -x[1]))
+
+        retrieved, n_used = [], 0
+        for _, _, text, n_tokens in relevant:
+            if n_used + n_tokens > token_budget:
+                continue
+            retrieved.append(text)
+            n_used += n_tokens
+
+        if not retrieved and self.fallback is not None and \
+                estimate_text_tokens(self.fallback) <= token_budget:
+            return self.fallback
+        if not retrieved:
+            return "No past trials involve these degradations."
+        return '\n'.join(retrieved)
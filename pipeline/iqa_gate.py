@@ -0,0 +1,118 @@
+"""Gate of tool results by cheap no-reference signals (see `utils.image_stats`), before any VLM is asked to reflect on them.
+
+Calibrate the thresholds from logged runs by
+```
+python -m pipeline.iqa_gate --output_dirs output/...
+```
+"""
+from pathlib import Path
+import argparse
+import json
+from typing import Iterator, Optional
+
+from utils.custom_types import *
+from utils.image_stats import degradation_signal
+
+
+class IQAGate:
+    """Decides the severity of a tool result without VLM when the signal is decisive:
+    - certified: the signal of the result is below the "clean" threshold, i.e., "very low";
+    - dropped: the signal of the result exceeds that of the input by the "inferior" margin, i.e., "very high".
+
+    Args:
+        calibration_path (Path): Path to the thresholds per degradation, calibrated by `calibrate`.
+    """
+
+    def __init__(self, calibration_path: Path):
+        with open(calibration_path, "r") as f:
+            self.thresholds: dict[Degradation, dict] = json.load(f)
+
+    def decide(self, img_path: Path, input_path: Path, degradation: Degradation
+               ) -> tuple[Optional[str], Optional[Level]]:
+        """Returns the decision ("certified" or "dropped") and the severity, or (None, None) if the VLM is needed."""
+        thresholds = self.thresholds.get(degradation)
+        if thresholds is None:
+            return None, None
+        signal = degradation_signal(img_path, degradation)
+        if signal is None:
+            return None, None
+        if thresholds["clean"] is not None and signal <= thresholds["clean"]:
+            return "certified", "very low"
+        if thresholds["inferior_margin"] is not None:
+            input_signal = degradation_signal(input_path, degradation)
+            if signal - input_signal >= thresholds["inferior_margin"]:
+                return "dropped", "very high"
+        return None, None
+
+
+def iter_samples(summary_path: Path) -> Iterator[tuple[Degradation, Path, Path, Level]]:
+    """Yields (degradation, tool result, input of the tool, severity by VLM) in a logged run, skipping results decided by the gate."""
+    with open(summary_path, "r") as f:
+        work_mem = json.load(f)
+    gated = {decision["img_path"]
+             for decision in work_mem.get("iqa_gate", {}).get("decisions", [])}
+
+    def traverse(node: dict) -> Iterator[tuple[Degradation, Path, Path, Level]]:
+        for subtask_res in node["children"].values():
+            for child in subtask_res["tools"].values():
+                if child["severity"] != "none" and child["img_path"] not in gated:
+                    yield (child["degradation"], Path(child["img_path"]),
+                           Path(node["img_path"]), child["severity"])
+                yield from traverse(child)
+
+    yield from traverse(work_mem["tree"])
+
+
+def calibrate(summary_paths: list[Path], precision: float = 0.95, min_samples: int = 20
+              ) -> dict[Degradation, dict]:
+    """Chooses, per degradation, the largest "clean" threshold below which at least `precision` of the results are "very low" by VLM, and the smallest "inferior" margin above which at least `precision` of the results are "high" or "very high". A threshold supported by fewer than `min_samples` results is None, i.e., disabled."""
+    samples: dict[Degradation, list[tuple[float, float, Level]]] = {}
+    for summary_path in summary_paths:
+        for degradation, img_path, input_path, severity in iter_samples(summary_path):
+            if not (img_path.exists() and input_path.exists()):
+                continue
+            signal = degradation_signal(img_path, degradation)
+            if signal is None:
+                continue
+            margin = signal - degradation_signal(input_path, degradation)
+            samples.setdefault(degradation, []).append((signal, margin, severity))
+
+    def threshold(values: list[tuple[float, bool]], ascending: bool) -> Optional[float]:
+        """The farthest cut such that the values on the near side are positive with the precision."""
+        values = sorted(values, reverse=not ascending)
+        best, n_pos = None, 0
+        for i, (value, pos) in enumerate(values, 1):
+            n_pos += pos
+            if i >= min_samples and n_pos / i >= precision:
+                best = value
+        return best
+
+    thresholds = {}
+    for degradation, degra_samples in samples.items():
+        thresholds[degradation] = {
+            "clean": threshold(
+                [(signal, severity == "very low") for signal, _, severity in degra_samples],
+                ascending=True),
+            "inferior_margin": threshold(
+                [(margin, severity in {"high", "very high"}) for _, margin, severity in degra_samples],
+                ascending=False),
+            "n_samples": len(degra_samples),
+        }
+    return thresholds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_dirs", type=Path, nargs='+', required=True,
+                        help="Output directories of IRAgent, searched for logs/summary.json.")
+    parser.add_argument("--output_path", type=Path, default=Path("memory/iqa_gate.json"))
+    parser.add_argument("--precision", type=float, default=0.95)
+    parser.add_argument("--min_samples", type=int, default=20)
+    args = parser.parse_args()
+
+    summary_paths = [summary_path for output_dir in args.output_dirs
+                     for summary_path in sorted(output_dir.rglob("logs/summary.json"))]
+    thresholds = calibrate(summary_paths, args.precision, args.min_samples)
+    print(f"Calibrated from {len(summary_paths)} runs: {json.dumps(thresholds, indent=2)}")
+    with open(args.output_path, "w") as f:
+        json.dump(thresholds, f, indent=2)
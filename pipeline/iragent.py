@@ -1,18 +1,33 @@
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import shutil
 import logging
-from time import localtime, strftime
+from time import localtime, strftime, time
 import cv2
 import json
 import random
 from typing import Optional
 
 from llm import GPT4, DepictQA
+from llm.image_payload import ImagePayloadEncoder
+from llm.response_parser import with_json_schema
 from . import prompts
-from executor import executor, Tool
+from .schedule_table import ScheduleTable
+from .experience import ExperienceStore
+from .selection import KnockoutSelector, PairwiseCache, map_in_pool
+from .iqa_gate import IQAGate
+from .prescreen import prescreen
+from .cost_model import CostModel
+from .recipe import export_recipe, RecipeEngine
+from .run_index import RunIndex
+from executor import executor, Tool, TIERS
+from executor.coordinator import ToolCoordinator
 from utils.img_tree import ImgTree
-from utils.logger import get_logger
-from utils.misc import sorted_glob
+from utils.cache import SQLiteCache
+from utils.crops import select_crop_boxes, extract_crops
+from utils.dedupe import DedupeIndex
+from utils.logger import close_logger, get_logger
+from utils.misc import sorted_glob, get_img_size
 from utils.custom_types import *
 
 
@@ -23,11 +38,30 @@ class IRAgent:
         output_dir (Path): Path to the output directory, in which a directory will be created.
         llm_config_path (Path, optional): Path to the config file of LLM. Defaults to Path("config.yml").
         evaluate_degradation_by (str, optional): The method of degradation evaluation, "depictqa" or "gpt4v". Defaults to "depictqa".
+        with_prescreen (bool, optional): Whether to rule out implausible degradations by image statistics before evaluating the rest by DepictQA. Defaults to False.
         with_retrieval (bool, optional): Whether to schedule with retrieval. Defaults to True.
         schedule_experience_path (Path | None, optional): Path to the experience hub. Defaults to Path( "memory/schedule_experience.json").
+        experience_token_budget (int | None, optional): If not None, only the experience relevant to the current degradations is retrieved from `fail_rate_path`, within this number of tokens. Defaults to None, i.e., the full distilled experience.
+        fail_rate_path (Path, optional): Path to the fail rates of exploration, from which experience is retrieved. Defaults to Path("memory/fail_rate.json").
+        schedule_by (str, optional): The method of scheduling, "gpt4" or "table". "table" looks up the order compiled by `exploration/compile_schedule.py`, and falls back to GPT-4 for sets with insufficient evidence. Defaults to "gpt4".
+        schedule_table_path (Path, optional): Path to the compiled order table. Defaults to Path("memory/schedule_table.json").
+        cost_weight (float | None, optional): If not None, scheduling by table also minimizes the predicted compute (seconds per megapixel of tools at the full resolution of each step, even with proxy), weighted by this in the objective; 0 only breaks ties. The predicted compute of plans is logged anyway. Defaults to None.
+        tool_profile_path (Path, optional): Path to the seconds per megapixel of tools, profiled by `pipeline/cost_model.py`. Defaults to Path("memory/tool_profile.json").
+        run_index_path (Path | None, optional): If not None, past runs indexed by degradation profile (see `pipeline/run_index.py`) are consulted before scheduling: when the nearest neighbours agree on a chain, it is taken directly and only the result is verified, falling back to scheduling if the verification fails. Finished runs are added to the index. Defaults to None.
         with_reflection (bool, optional): Whether to reflect on the results of tools. Defaults to True.
         reflect_by (str, optional): The method of reflection on results of tools, "depictqa" or "gpt4v". Defaults to "depictqa".
         with_rollback (bool, optional): Whether to roll back when failing in one subtask. Defaults to True.
+        with_recheck (bool, optional): Whether to re-evaluate the degradation of each subtask on the current image (except the input, just evaluated) before invoking tools, by the means of reflection. If the severity is already low, the subtask is satisfied without invoking any tool, since earlier tools may fix it as a side effect. Defaults to False.
+        reflect_on_crops (bool, optional): Whether to reflect on a few crops with the highest edge energy instead of the whole images. Crops are located on the input of the subtask, the same for all candidates, and the verdicts are aggregated (median severity, majority of choices). Defaults to False.
+        crop_size (int, optional): Side of crops, to which they are resized. Defaults to 256.
+        dedupe_pixel_tol (float | None, optional): If not None, near-identical tool results (by perceptual hash and then mean absolute pixel difference within this tolerance in [0, 255]) share the verdict of reflection and are compared only once. Defaults to None.
+        with_iqa_gate (bool, optional): Whether to decide the severity of tool results by cheap no-reference signals when decisive, before reflecting by VLM. Defaults to False.
+        iqa_gate_path (Path, optional): Path to the thresholds of the gate, calibrated by `pipeline/iqa_gate.py`. Defaults to Path("memory/iqa_gate.json").
+        proxy_scale (float | None, optional): If not None, exploration (tool tries, reflection, comparison, and rollback) runs on the input downscaled by this factor, and only the resulting execution path is replayed at full resolution. Defaults to None.
+        proxy_rescale (dict[str, float] | None, optional): Factors to rescale the proxy outputs of tools, keyed by tool name or subtask (tool names take precedence), e.g., to undo the upscaling of super-resolution. Defaults to None, i.e., {"super-resolution": 0.25}.
+        tier_budget_s (float | None, optional): If not None, tools run at their fastest tier first, and escalate to the next tier declared by the tool only if the severity is not "very low" and the seconds spent on tools so far are within this budget. Defaults to None, i.e., always the best tier.
+        tool_coordinator (ToolCoordinator | None, optional): If not None, tools are invoked and degradations are evaluated by DepictQA through this coordinator shared by concurrent agents, which batches requests across images. Defaults to None.
+        llm_cache_path (Path | None, optional): Path to the SQLite database caching LLM responses and outcomes of quality comparisons across runs. Defaults to None (no cache).
         silent (bool, optional): Whether to suppress the console output. Defaults to False.
     """
 
@@ -37,13 +71,32 @@ class IRAgent:
         output_dir: Path,
         llm_config_path: Path = Path("config.yml"),
         evaluate_degradation_by: str = "depictqa",
+        with_prescreen: bool = False,
         with_retrieval: bool = True,
         schedule_experience_path: Optional[Path] = Path(
             "memory/schedule_experience.json"
         ),
+        experience_token_budget: Optional[int] = None,
+        fail_rate_path: Path = Path("memory/fail_rate.json"),
+        schedule_by: str = "gpt4",
+        schedule_table_path: Path = Path("memory/schedule_table.json"),
+        cost_weight: Optional[float] = None,
+        tool_profile_path: Path = Path("memory/tool_profile.json"),
+        run_index_path: Optional[Path] = None,
         with_reflection: bool = True,
         reflect_by: str = "depictqa",
         with_rollback: bool = True,
+        with_recheck: bool = False,
+        reflect_on_crops: bool = False,
+        crop_size: int = 256,
+        dedupe_pixel_tol: Optional[float] = None,
+        with_iqa_gate: bool = False,
+        iqa_gate_path: Path = Path("memory/iqa_gate.json"),
+        proxy_scale: Optional[float] = None,
+        proxy_rescale: Optional[dict[str, float]] = None,
+        tier_budget_s: Optional[float] = None,
+        tool_coordinator: Optional[ToolCoordinator] = None,
+        llm_cache_path: Optional[Path] = None,
         silent: bool = False,
     ) -> None:
         # paths
@@ -53,13 +106,27 @@ class IRAgent:
         # config
         self._config(
             evaluate_degradation_by,
+            with_prescreen,
             with_retrieval,
+            schedule_by,
+            cost_weight,
             with_reflection,
             reflect_by,
-            with_rollback
+            with_rollback,
+            with_recheck,
+            reflect_on_crops,
+            crop_size,
+            proxy_scale,
+            proxy_rescale,
+            tier_budget_s
         )
+        self._prepare_proxy()
         # components
-        self._create_components(llm_config_path, schedule_experience_path, silent)
+        self._create_components(
+            llm_config_path, schedule_experience_path, experience_token_budget,
+            fail_rate_path, schedule_table_path, tool_profile_path, run_index_path,
+            dedupe_pixel_tol, with_iqa_gate, iqa_gate_path, tool_coordinator, llm_cache_path,
+            silent)
         # constants
         self._set_constants()
 
@@ -74,9 +141,28 @@ class IRAgent:
             ]},
             "execution_path": {"subtasks": [], "tools": []},
             "n_invocations": 0,
+            "predicted_cost": None,  # seconds of the last scheduled plan
+            "prescreen": {"ruled_out": [], "queries_saved": 0},
+            "comparisons": {"compared": 0, "observed": 0, "inferred": 0, "unknown": 0},
+            "dedupe": {"reflections_saved": 0, "comparisons_saved": 0},
+            "iqa_gate": {"certified": 0, "dropped": 0, "decisions": [
+                # {"img_path": ..., "degradation": ..., "decision": ...}
+            ]},
+            "tiers": {"tool_seconds": 0., "escalations": 0},
+            "recheck": {"queries": 0, "satisfied": [
+                # {"img_path": ..., "subtask": ..., "severity": ...}
+            ]},
+            "reuse": {
+                "evaluation": None,
+                "prediction": None,  # recipe agreed by the neighbours
+                "verification": None,
+                "accepted": False,
+                "img_path": None,
+            },
             "tree": {
                 "img_path": str(self.img_tree_dir / "0-img" / "input.png"),
                 "best_descendant": None,
+                "satisfied": [],  # subtasks found done on this image without tools
                 "children": {
                     # `subtask1`: {
                     #     "best_tool": ...,
@@ -85,7 +171,9 @@ class IRAgent:
                     #             "degradation": ...,
                     #             "severity": ...,
                     #             "img_path": ...,
+                    #             "tier": ...,
                     #             "best_descendant": ...,
+                    #             "satisfied": [...],
                     #             "children": {...}
                     #         },
                     #         ...
@@ -99,23 +187,58 @@ class IRAgent:
     def _config(
         self,
         evaluate_degradation_by: str,
+        with_prescreen: bool,
         with_retrieval: bool,
+        schedule_by: str,
+        cost_weight: Optional[float],
         with_reflection: bool,
         reflect_by: str,
-        with_rollback: bool
+        with_rollback: bool,
+        with_recheck: bool,
+        reflect_on_crops: bool,
+        crop_size: int,
+        proxy_scale: Optional[float],
+        proxy_rescale: Optional[dict[str, float]],
+        tier_budget_s: Optional[float]
     ) -> None:
         assert evaluate_degradation_by in {"gpt4v", "depictqa"}
         self.evaluate_degradation_by = evaluate_degradation_by
+        self.with_prescreen = with_prescreen
         self.with_retrieval = with_retrieval
+        assert schedule_by in {"gpt4", "table"}
+        self.schedule_by = schedule_by
+        self.cost_weight = cost_weight
         assert reflect_by in {"gpt4v", "depictqa"}
         self.with_reflection = with_reflection
         self.reflect_by = reflect_by
         self.with_rollback = with_rollback
+        assert not with_recheck or with_reflection, "Re-check relies on reflection."
+        self.with_recheck = with_recheck
+        self.reflect_on_crops = reflect_on_crops
+        self.crop_size = crop_size
+        self.n_crops = 3
+        assert proxy_scale is None or 0 < proxy_scale <= 1, \
+            f"Invalid proxy scale: {proxy_scale}"
+        self.proxy_scale = proxy_scale
+        if proxy_rescale is None:
+            proxy_rescale = {"super-resolution": 0.25}
+        self.proxy_rescale = proxy_rescale
+        self.tier_budget_s = tier_budget_s
 
     def _create_components(
         self,
         llm_config_path: Path,
         schedule_experience_path: Optional[Path],
+        experience_token_budget: Optional[int],
+        fail_rate_path: Path,
+        schedule_table_path: Path,
+        tool_profile_path: Path,
+        run_index_path: Optional[Path],
+        dedupe_pixel_tol: Optional[float],
+        with_iqa_gate: bool,
+        iqa_gate_path: Path,
+        tool_coordinator: Optional[ToolCoordinator],
+        llm_cache_path: Optional[Path],
         silent: bool,
     ) -> None:
         # logger
@@ -125,6 +248,7 @@ class IRAgent:
             console_log_level=logging.WARNING,
             file_format_str="%(message)s",
             silent=silent,
+            async_file=True,
         )
         workflow_format_str = "%(asctime)s - %(levelname)s\n%(message)s\n"
         self.workflow_logger: logging.Logger = get_logger(
@@ -141,10 +265,45 @@ class IRAgent:
             logger=self.qa_logger,
             silent=silent,
             system_message=prompts.system_message,
+            cache_path=llm_cache_path,
+            img_store_dir=self.qa_img_dir,
         )
         self.depictqa = None
         if self.evaluate_degradation_by == "depictqa" or self.reflect_by == "depictqa":
-            self.depictqa = DepictQA(logger=self.qa_logger, silent=silent)
+            self.depictqa = DepictQA(logger=self.qa_logger, silent=silent,
+                                     cache_path=llm_cache_path,
+                                     img_store_dir=self.qa_img_dir,
+                                     eval_queue=None if tool_coordinator is None else
+                                     tool_coordinator.depictqa_queue)
+
+        # selection
+        # one pool for comparisons of pairs and of their crops, bounding requests to the backend
+        self.comp_pool = ThreadPoolExecutor(max_workers=8)
+        # outcomes on crops are not those on whole images
+        comp_namespace = f"pairwise@{self.reflect_by}" + (
+            f"@crops{self.crop_size}" if self.reflect_on_crops else "")
+        self.selector = KnockoutSelector(
+            compare_fn=self.compare_quality,
+            pairwise_cache=PairwiseCache(
+                None if llm_cache_path is None else
+                SQLiteCache(llm_cache_path, namespace=comp_namespace)),
+            pool=self.comp_pool,
+            logger=self.workflow_logger,
+            nickname_fn=self._img_nickname,
+        )
+
+        # dedupe
+        self.dedupe_index = None
+        if dedupe_pixel_tol is not None:
+            self.dedupe_index = DedupeIndex(pixel_tol=dedupe_pixel_tol)
+        self.dedupe_verdicts: dict[tuple[str, Degradation], Level] = {}
+
+        # gate before reflection
+        self.iqa_gate = None
+        if with_iqa_gate and self.with_reflection:
+            assert iqa_gate_path.exists(), \
+                f"Calibrate the gate first: {iqa_gate_path} not found."
+            self.iqa_gate = IQAGate(iqa_gate_path)
 
         # experience
         if self.with_retrieval:
@@ -153,9 +312,18 @@ class IRAgent:
             ), "Experience should be provided."
             with open(schedule_experience_path, "r") as f:
                 self.schedule_experience: str = json.load(f)["distilled"]
+            self.experience_token_budget = experience_token_budget
+            if self.experience_token_budget is not None:
+                self.experience_store = ExperienceStore(
+                    fail_rate_path, fallback=self.schedule_experience)
+        if self.schedule_by == "table":
+            self.schedule_table = ScheduleTable(schedule_table_path)
+        self.cost_model = CostModel(tool_profile_path)
+        self.run_index = None if run_index_path is None else RunIndex(run_index_path)
 
         # executor
         self.executor = executor
+        self.tool_coordinator = tool_coordinator
         random.seed(0)
 
     def _set_constants(self) -> None:
@@ -175,22 +343,63 @@ class IRAgent:
         self.degradations = set(self.degra_subtask_dict.keys())
         self.subtasks = set(self.degra_subtask_dict.values())
         self.levels: list[Level] = ["very low", "low", "medium", "high", "very high"]
+        # detail level of images sent to GPT-4V for each kind of prompt:
+        # fine artifacts (noise, jpeg) need full detail, and so do comparisons,
+        # since results of tools often differ only in such artifacts;
+        # lowered for images small enough (see `_gpt_img_detail`)
+        self.gpt_img_detail_dict: dict[str, str] = {
+            "evaluate_degradation": "high",
+            "evaluate_tool_result": "high",
+            "compare_quality": "high",
+        }
 
-    def run(self, plan: Optional[list[Subtask]]=None, cache: Optional[Path]=None) -> None:
+    def run(self, plan: Optional[list[Subtask]]=None, cache: Optional[Path]=None,
+            max_seconds: Optional[float] = None,
+            max_tool_invocations: Optional[int] = None,
+            max_llm_calls: Optional[int] = None,
+            max_cost: Optional[float] = None) -> None:
+        """Restores the image, following `plan` if given. The limits (None for unlimited) on wall-clock seconds, tool invocations, LLM calls, and dollar cost of GPT-4 are checked before each tool invocation, escalation, and comparison, so one may be exceeded by at most an invocation. Once a limit is hit, exploration stops and the best result so far is taken. The logs are closed at the end, so an agent runs once."""
+        assert cache is None or self.proxy_scale is None, \
+            "Cached outputs are at full resolution, thus cannot be used with proxy."
+        self._start_budget({
+            "seconds": max_seconds,
+            "tool_invocations": max_tool_invocations,
+            "llm_calls": max_llm_calls,
+            "cost": max_cost,
+        })
         if plan is not None:
             self.plan = plan.copy()
         else:
             self.propose()
         while self.plan:
+            if self._budget_exhausted():
+                self._compromise_on_budget()
+                break
             success = self.execute_subtask(cache)
             if plan is None and self.with_rollback and not success:
+                if self._budget_exhausted():  # no more on rescheduling
+                    self._compromise_on_budget()
+                    break
                 self.roll_back()
                 self.reschedule()
+        self._budget_exhausted()  # update the consumption
         self._record_res()
+        # agents are many in batch and video restoration, each with open log files
+        close_logger(self.qa_logger)
+        close_logger(self.workflow_logger)
+        self.comp_pool.shutdown()
+
+    def export_recipe(self, recipe_path: Path) -> dict:
+        """Exports the execution path of the finished run as a recipe, to be applied to similar images by `pipeline.recipe.RecipeEngine`."""
+        assert hasattr(self, "res_path"), "Run first."
+        return export_recipe(self.work_mem_path, recipe_path)
 
     def propose(self) -> None:
-        """Sets the initial plan."""
+        """Sets the initial plan, or none if a past chain is reused."""
         evaluation = self.evaluate_degradation()
+        self.work_mem["reuse"]["evaluation"] = evaluation
+        if self.run_index is not None and self.reuse_past_runs(evaluation):
+            return
         agenda = self.extract_agenda(evaluation)
         plan = self.schedule(agenda)
 
@@ -199,18 +408,55 @@ class IRAgent:
         self.workflow_logger.info(f"Plan: {plan}")
         self.plan = plan
 
+    def reuse_past_runs(self, evaluation: list[tuple[Degradation, Level]]) -> bool:
+        """Applies the chain agreed by the nearest past runs to the input, and verifies the severities of the degradations involved in the result. Returns whether the result is accepted."""
+        reuse = self.work_mem["reuse"]
+        img_size = get_img_size(self.full_res_input_path)
+        recipe = self.run_index.predict(evaluation, img_size)
+        if recipe is None:
+            self.workflow_logger.info("No agreement among past runs, scheduling...")
+            return False
+        chain = list(zip(recipe["subtasks"], recipe["tools"]))
+        self.workflow_logger.info(
+            f"{recipe['agreement']:.0%} of past runs nearby agree on {chain}. Applying it...")
+        reuse["prediction"] = recipe
+
+        reuse_dir = self.work_dir / "reuse"
+        reuse_dir.mkdir()
+        RecipeEngine(recipe).apply([self.full_res_input_path], reuse_dir)
+        res_path = reuse_dir / f"{self.full_res_input_path.stem}.png"
+
+        degradations = {degradation for degradation, severity in evaluation
+                        if self.levels.index(severity) >= 2} | set(recipe["degradations"])
+        reuse["verification"] = [
+            (degradation, self.evaluate_tool_result(res_path, degradation))
+            for degradation in sorted(degradations - {"low resolution"})
+        ]
+        reuse["accepted"] = all(self.levels.index(severity) <= 1
+                                for _, severity in reuse["verification"])
+        if reuse["accepted"]:
+            reuse["img_path"] = str(res_path)
+            self.workflow_logger.info(f"Verified: {reuse['verification']}.")
+        else:
+            self.workflow_logger.info(
+                f"Verification failed: {reuse['verification']}. Scheduling...")
+        self._dump_summary()
+        return reuse["accepted"]
+
     def extract_agenda(self, evaluation: list[tuple[Degradation, Level]]
                        ) -> list[Subtask]:
         agenda = []
-        img_shape = cv2.imread(self.cur_node["img_path"]).shape[:2]
+        # the full-resolution input, in case of proxy
+        img_shape = cv2.imread(str(self.full_res_input_path)).shape[:2]
         if max(img_shape) < 300:  # heuristically set
             agenda.append("super-resolution")
         for degradation, severity in evaluation:
             if self.levels.index(severity) >= 2:  # "medium" and above
                 agenda.append(self.degra_subtask_dict[degradation])
         # stupid gpt is sensitive to presentation order when scheduling
-        # shuffle to avoid the bias
-        random.shuffle(agenda)
+        # shuffle to avoid the bias, but deterministically per set of subtasks,
+        # so that identical sets produce identical prompts (and hit the cache)
+        random.Random('+'.join(sorted(agenda))).shuffle(agenda)
         return agenda
 
     def evaluate_degradation(self) -> list[tuple[Degradation, Level]]:
@@ -219,13 +465,29 @@ class IRAgent:
         """
         if self.evaluate_degradation_by == "gpt4v":
             evaluation = self.evaluate_degradation_by_gpt4v()
+        elif self.with_prescreen:
+            evaluation = self.evaluate_degradation_w_prescreen()
         else:
-            evaluation = eval(
-                self.depictqa(Path(self.cur_node["img_path"]), task="eval_degradation")
-            )
+            evaluation = self.depictqa(Path(self.cur_node["img_path"]), task="eval_degradation")
         self.workflow_logger.info(f"Evaluation: {evaluation}")
         return evaluation
 
+    def evaluate_degradation_w_prescreen(self) -> list[tuple[Degradation, Level]]:
+        """Queries DepictQA only about the degradations not ruled out by image statistics."""
+        img_path = Path(self.cur_node["img_path"])
+        ruled_out = prescreen(img_path)
+        self.work_mem["prescreen"] = {
+            "ruled_out": list(ruled_out), "queries_saved": len(ruled_out)}
+        self.workflow_logger.info(f"Ruled out by image statistics: {list(ruled_out)}")
+
+        to_query = [degradation for degradation in self.degradations - {"low resolution"}
+                    if degradation not in ruled_out]
+        evaluation = []
+        if to_query:
+            evaluation = self.depictqa(
+                img_path, task="eval_degradation", degradation=sorted(to_query))
+        return evaluation + list(ruled_out.items())
+
     def evaluate_degradation_by_gpt4v(self) -> list[tuple[Degradation, Level]]:
         def check_evaluation(evaluation: object):
             assert isinstance(evaluation, list), "Evaluation should be a list."
@@ -252,25 +514,65 @@ class IRAgent:
                 prompt=prompts.gpt_evaluate_degradation_prompt,
                 img_path=Path(self.cur_node["img_path"]),
                 format_check=check_evaluation,
+                img_detail=self._gpt_img_detail(
+                    "evaluate_degradation", [Path(self.cur_node["img_path"])]),
             )
         )
         evaluation = [(ele["degradation"], ele["severity"]) for ele in evaluation]
         return evaluation
 
-    def schedule(self, agenda: list[Subtask], ps: str = "") -> list[Subtask]:
+    def schedule(self, agenda: list[Subtask], ps: str = "",
+                 avoid_first: Optional[list[Subtask]] = None) -> list[Subtask]:
+        """Orders the agenda. `ps` and `avoid_first` describe the failed tries when rescheduling, for GPT-4 and the table respectively. Only the table takes the predicted compute (see `cost_weight`) into account; otherwise it is only logged."""
         if len(agenda) <= 1:
             return agenda
 
-        degradations = [self.subtask_degra_dict[subtask] for subtask in agenda]
-        if self.with_retrieval:
-            plan = self.schedule_w_retrieval(degradations, agenda, ps)
-        else:
-            plan = self.schedule_wo_retrieval(degradations, agenda, ps)
+        megapixels = self._full_res_megapixels()
+        plan = None
+        if self.schedule_by == "table":
+            step_cost = None
+            if self.cost_weight is not None:
+                def step_cost(done: list[Subtask], subtask: Subtask) -> float:
+                    return self.cost_model.step_cost(done, subtask, megapixels)
+            plan = self.schedule_table.lookup(
+                agenda, avoid_first or (), step_cost, self.cost_weight or 0.)
+            if plan is not None:
+                self.workflow_logger.info(f"Order from the table: {plan}")
+            else:
+                self.workflow_logger.info(
+                    f"Insufficient evidence in the table for {agenda}, scheduling by GPT-4.")
+
+        if plan is None:
+            degradations = [self.subtask_degra_dict[subtask] for subtask in agenda]
+            if self.with_retrieval:
+                plan = self.schedule_w_retrieval(degradations, agenda, ps)
+            else:
+                plan = self.schedule_wo_retrieval(degradations, agenda, ps)
+
+        predicted_cost = self.cost_model.plan_cost(plan, megapixels)
+        self.work_mem["predicted_cost"] = predicted_cost
+        self.workflow_logger.info(
+            f"Predicted compute of exploring {plan}: {predicted_cost:.1f}s.")
         return plan
 
+    def _full_res_megapixels(self) -> float:
+        """Megapixels of the current image at full resolution, i.e., of the input scaled by the subtasks done, since proxy outputs are rescaled to the size of the proxy."""
+        return self.cost_model.scale(
+            self.cost_model.megapixels(self.full_res_input_path),
+            self._done_subtasks(Path(self.cur_node["img_path"])))
+
     def schedule_w_retrieval(
         self, degradations: list[Degradation], agenda: list[Subtask], ps: str
     ) -> list[Subtask]:
+        @with_json_schema({
+            "type": "object",
+            "properties": {
+                "thought": {"type": "string"},
+                "order": {"type": "array", "items": {"type": "string", "enum": agenda}},
+            },
+            "required": ["thought", "order"],
+            "additionalProperties": False,
+        })
         def check_order(schedule: object):
             assert isinstance(schedule, dict), "Schedule should be a dict."
             assert set(schedule.keys()) == {"thought", "order"}, \
@@ -282,7 +584,7 @@ class IRAgent:
         schedule = self.gpt4(
             prompt=prompts.schedule_w_retrieval_prompt.format(
                 degradations=degradations, agenda=agenda, 
-                experience=self.schedule_experience
+                experience=self.retrieve_experience(degradations)
             ) + ps,
             format_check=check_order,
         )
@@ -290,6 +592,12 @@ class IRAgent:
         self.workflow_logger.info(f"Insights: {schedule['thought']}")
         return schedule["order"]
 
+    def retrieve_experience(self, degradations: list[Degradation]) -> str:
+        if self.experience_token_budget is None:
+            return self.schedule_experience
+        return self.experience_store.retrieve(
+            degradations, self.experience_token_budget)
+
     def reason_to_schedule(
         self, degradations: list[Degradation], agenda: list[Subtask]
     ) -> str:
@@ -345,34 +653,40 @@ class IRAgent:
         """
 
         subtask = self.plan.pop(0)
+        if self.with_recheck and self._recheck_satisfied(subtask):
+            return self._avoid_tried_first()
         subtask_dir, degradation, toolbox = self._prepare_for_subtask(subtask)
         res_degra_level_dict: dict[str, list[Path]] = {}
+        res_degra_level = None
         success = True
 
         for tool in toolbox:
+            if res_degra_level_dict and self._budget_exhausted():
+                self.workflow_logger.warning(
+                    f"Budget of {self.work_mem['budget']['exhausted']} exhausted, "
+                    f"no more tools tried for {subtask}.")
+                break
             self.work_mem["n_invocations"] += 1
             # prepare directory
             tool_dir = subtask_dir / f"tool-{tool.tool_name}"
             output_dir = tool_dir / "0-img"
             output_dir.mkdir(parents=True)
 
-            # invoke tool
-            if cache is None:
-                tool(
-                    input_dir=Path(self.cur_node["img_path"]).parent,
-                    output_dir=output_dir,
-                    silent=True,
-                )
-            else:
-                dst_path = output_dir / "output.png"
-                rel_path = dst_path.relative_to(self.img_tree_dir)
-                src_path = cache / rel_path
-                dst_path.symlink_to(src_path)
-            output_path = sorted_glob(output_dir)[0]
+            # invoke tool, from the fastest tier if escalating
+            tier = None if self.tier_budget_s is None or cache is not None else "fast"
+            output_path = self._invoke_tool(tool, subtask, output_dir, cache, tier)
 
             if self.with_reflection:
-                degra_level = self.evaluate_tool_result(output_path, degradation)
-                self._record_tool_res(output_path, degra_level)
+                degra_level = self._reflect_on_tool_res(output_path, degradation)
+                while degra_level != "very low" and not self._budget_exhausted():
+                    next_tier = self._next_tier(tool, tier)
+                    if next_tier is None:
+                        break
+                    self._supersede_tool_res(output_path, tool.resolve_tier(tier))
+                    tier = next_tier
+                    output_path = self._invoke_tool(tool, subtask, output_dir, cache, tier)
+                    degra_level = self._reflect_on_tool_res(output_path, degradation)
+                self._record_tool_res(output_path, degra_level, tool.resolve_tier(tier))
                 res_degra_level_dict.setdefault(degra_level, []).append(output_path)
                 if degra_level == "very low":
                     res_degra_level = "very low"
@@ -383,10 +697,10 @@ class IRAgent:
                 best_tool_name = tool.tool_name
                 # best_img_path = output_path
                 res_degra_level = "none"
-                self._record_tool_res(output_path, "none")
+                self._record_tool_res(output_path, "none", tool.resolve_tier(tier))
                 break
 
-        else:  # no result with "very low" degradation level
+        if res_degra_level is None:  # no result with "very low" degradation level
             for res_level in self.levels[1:]:
                 if res_level in res_degra_level_dict:
                     candidates = res_degra_level_dict[res_level]
@@ -402,7 +716,7 @@ class IRAgent:
         self.cur_node = self.cur_node["children"][subtask]["tools"][best_tool_name]
         if self.with_rollback and not success:
             self.cur_node["best_descendant"] = str(best_img_path)
-            done_subtasks, _ = self._get_execution_path(Path(self.cur_node['img_path']))
+            done_subtasks = self._done_subtasks(Path(self.cur_node['img_path']))
             self.work_mem["plan"]["adjusted"].append({
                 "failed": f"{done_subtasks} + {self.plan}", "new": None
             })
@@ -416,20 +730,147 @@ class IRAgent:
             
         return success
 
+    def _invoke_tool(self, tool: Tool, subtask: Subtask, output_dir: Path,
+                     cache: Optional[Path], tier: Optional[str]) -> Path:
+        """Invokes the tool at the tier on the current image, or links its output from the cache. Returns the path to the output."""
+        if cache is None:
+            input_dir = Path(self.cur_node["img_path"]).parent
+            if self.tool_coordinator is not None:
+                # only the share of this agent, not the wait for others
+                seconds = self.tool_coordinator.invoke(tool, input_dir, output_dir, tier)
+            else:
+                start_time = time()
+                tool(
+                    input_dir=input_dir,
+                    output_dir=output_dir,
+                    silent=True,
+                    tier=tier,
+                )
+                seconds = time() - start_time
+            self.work_mem["tiers"]["tool_seconds"] += seconds
+        else:
+            dst_path = output_dir / "output.png"
+            rel_path = dst_path.relative_to(self.img_tree_dir)
+            src_path = cache / rel_path
+            dst_path.symlink_to(src_path)
+        output_path = sorted_glob(output_dir)[0]
+        if self.proxy_scale is not None:
+            self._rescale_proxy_output(output_path, subtask, tool.tool_name)
+        return output_path
+
+    def _reflect_on_tool_res(self, img_path: Path, degradation: Degradation) -> Level:
+        degra_level = self._dedupe_verdict(img_path, degradation)
+        if degra_level is None:
+            degra_level = self.evaluate_tool_result(img_path, degradation)
+            self._share_verdict(img_path, degradation, degra_level)
+        return degra_level
+
+    def _next_tier(self, tool: Tool, tier: Optional[str]) -> Optional[str]:
+        """Returns the next tier declared by the tool to escalate to, or None if at the best one or out of the budget."""
+        if tier is None:
+            return None
+        tier = tool.resolve_tier(tier)
+        better_tiers = [t for t in tool.tiers if TIERS.index(t) > TIERS.index(tier)]
+        if not better_tiers:
+            return None
+        if self.work_mem["tiers"]["tool_seconds"] >= self.tier_budget_s:
+            self.workflow_logger.info(
+                f"Tier budget of {self.tier_budget_s}s spent, staying at {tier}.")
+            return None
+        return min(better_tiers, key=TIERS.index)
+
+    def _supersede_tool_res(self, img_path: Path, tier: str) -> None:
+        """Moves the output of a lower tier aside (out of the image tree), so that the tool can run again into the same directory."""
+        if self.dedupe_index is not None:
+            self.dedupe_index.discard(img_path)
+            self.dedupe_verdicts = {key: level for key, level in self.dedupe_verdicts.items()
+                                    if key[0] != str(img_path)}
+        img_path.rename(img_path.parents[1] / f"{tier}.png")
+        self.work_mem["tiers"]["escalations"] += 1
+        self.workflow_logger.info(
+            f"Escalating {self._get_name_stem(img_path.parents[1].name)} from {tier}...")
+
     def evaluate_tool_result(self, img_path: Path, degradation: Degradation) -> Level:
+        if self.iqa_gate is not None:
+            level = self.gate_tool_result(img_path, degradation)
+            if level is not None:
+                return level
+        crop_paths = self._get_crops(img_path)
+        if crop_paths is None:
+            return self._evaluate_tool_result(img_path, degradation)
+        levels = map_in_pool(self.comp_pool, self._evaluate_tool_result,
+                             [(crop_path, degradation) for crop_path in crop_paths])
+        # median, the worse one of the middle two if even
+        level = sorted(levels, key=self.levels.index)[len(levels) // 2]
+        self.workflow_logger.info(f"Severities on crops: {levels}, aggregated as {level}.")
+        return level
+
+    def _evaluate_tool_result(self, img_path: Path, degradation: Degradation) -> Level:
         if self.reflect_by == "gpt4v":
             level = self.evaluate_tool_result_by_gpt4v(img_path, degradation)
         else:
-            level = eval(
-                self.depictqa(
-                    img_path=img_path, task="eval_degradation", degradation=degradation
-                )
+            level = self.depictqa(
+                img_path=img_path, task="eval_degradation", degradation=degradation
             )[0][1]
         return level
 
+    def _get_crops(self, img_path: Path) -> Optional[list[Path]]:
+        """Returns the crops of the image at the boxes located on the current image (the input of the subtask), or None if not reflecting on crops or the current image is no larger than a crop."""
+        if not self.reflect_on_crops:
+            return None
+        ref_path = Path(self.cur_node["img_path"])
+        if max(get_img_size(ref_path)) <= self.crop_size:
+            return None
+        boxes = select_crop_boxes(ref_path, self.n_crops, self.crop_size)
+        return extract_crops(img_path, boxes, self.crop_size, self.work_dir / "crops")
+
+    def _dedupe_verdict(self, img_path: Path, degradation: Degradation) -> Optional[Level]:
+        """Returns the verdict of a near-identical result, or None if no such one."""
+        if self.dedupe_index is None:
+            return None
+        rep = self.dedupe_index.add(img_path)
+        if rep is None or (str(rep), degradation) not in self.dedupe_verdicts:
+            return None
+        self.work_mem["dedupe"]["reflections_saved"] += 1
+        self.workflow_logger.info(
+            f"{self._img_nickname(img_path)} is near-identical to "
+            f"{self._img_nickname(rep)}, sharing its verdict.")
+        return self.dedupe_verdicts[(str(rep), degradation)]
+
+    def _share_verdict(self, img_path: Path, degradation: Degradation, level: Level
+                       ) -> None:
+        if self.dedupe_index is not None:
+            rep = self.dedupe_index.representative(img_path)
+            self.dedupe_verdicts[(str(rep), degradation)] = level
+
+    def gate_tool_result(self, img_path: Path, degradation: Degradation
+                         ) -> Optional[Level]:
+        """Returns the severity decided by the gate without VLM, or None if undecided."""
+        decision, level = self.iqa_gate.decide(
+            img_path, Path(self.cur_node["img_path"]), degradation)
+        if decision is None:
+            return None
+        gate_mem = self.work_mem["iqa_gate"]
+        gate_mem[decision] += 1
+        gate_mem["decisions"].append({
+            "img_path": str(img_path), "degradation": degradation, "decision": decision})
+        self.workflow_logger.info(
+            f"{self._img_nickname(img_path)} is {decision} by the IQA gate "
+            f"({gate_mem['certified'] + gate_mem['dropped']} reflection(s) saved so far).")
+        return level
+
     def evaluate_tool_result_by_gpt4v(
         self, img_path: Path, degradation: Degradation
     ) -> Level:
+        @with_json_schema({
+            "type": "object",
+            "properties": {
+                "thought": {"type": "string"},
+                "severity": {"type": "string", "enum": self.levels},
+            },
+            "required": ["thought", "severity"],
+            "additionalProperties": False,
+        })
         def check_tool_res_evaluation(evaluation: object):
             assert isinstance(evaluation, dict), "Evaluation should be a dict."
             assert set(evaluation.keys()) == {
@@ -446,41 +887,55 @@ class IRAgent:
                 ),
                 img_path=img_path,
                 format_check=check_tool_res_evaluation,
+                img_detail=self._gpt_img_detail("evaluate_tool_result", [img_path]),
             )
         )["severity"]
         return degra_level
 
     def search_best_by_comp(self, candidates: list[Path]) -> Path:
-        """Compares multiple images to decide the best one."""
-
-        best_img = candidates[0]
-        for i in range(1, len(candidates)):
-            cur_img = candidates[i]
-            self.workflow_logger.info(
-                f"Comparing {self._img_nickname(best_img)} and {self._img_nickname(cur_img)}..."
-            )
-
-            choice = self.compare_quality(best_img, cur_img)
-
-            if choice == "latter":
-                best_img = cur_img
-                self.workflow_logger.info(
-                    f"{self._img_nickname(best_img)} is better."
-                )
-            elif choice == "former":
-                self.workflow_logger.info(
-                    f"{self._img_nickname(best_img)} is better."
-                )
-            else:  # neither; keep the former
-                self.workflow_logger.info(
-                    f"Hard to decide. Keeping {self._img_nickname(best_img)}."
-                )
+        """Compares multiple images to decide the best one by a knockout tournament. Outcomes known from earlier comparisons (in this run or, with cache, in past runs) are reused or inferred transitively. Once the budget is exhausted, only known outcomes are used, and the earlier candidate wins otherwise."""
+        if self.dedupe_index is not None:
+            # near-identical candidates are represented by the first one
+            unique, reps = [], set()
+            for img_path in candidates:
+                rep = self.dedupe_index.representative(img_path)
+                if rep not in reps:
+                    reps.add(rep)
+                    unique.append(img_path)
+            self.work_mem["dedupe"]["comparisons_saved"] += len(candidates) - len(unique)
+            candidates = unique
+        best_img = self.selector.select(candidates, known_only=self._budget_exhausted())
+        self.work_mem["comparisons"] = dict(self.selector.stats)
         self.workflow_logger.info(
-            f"{self._img_nickname(best_img)} is selected as the best."
+            f"{self._img_nickname(best_img)} is selected as the best "
+            f"({self.selector.n_saved} comparison(s) saved so far)."
         )
         return best_img
 
+    def _gpt_img_detail(self, prompt_kind: str, img_paths: list[Path]) -> str:
+        """Returns the detail level for the kind of prompt, or "low" if all the images fit in what low detail consumes, e.g., crops or downscaled inputs, since then nothing is lost at a fraction of the tokens."""
+        if all(ImagePayloadEncoder.target_size(*get_img_size(img_path), "low")
+               == get_img_size(img_path) for img_path in img_paths):
+            return "low"
+        return self.gpt_img_detail_dict[prompt_kind]
+
     def compare_quality(self, img1: Path, img2: Path) -> str:
+        crop_paths1, crop_paths2 = self._get_crops(img1), self._get_crops(img2)
+        if crop_paths1 is None:
+            return self._compare_quality(img1, img2)
+        choices = map_in_pool(self.comp_pool, self._compare_quality,
+                              list(zip(crop_paths1, crop_paths2)))
+        n_former, n_latter = choices.count("former"), choices.count("latter")
+        if n_former > len(choices) / 2:
+            choice = "former"
+        elif n_latter > len(choices) / 2:
+            choice = "latter"
+        else:
+            choice = "neither"
+        self.workflow_logger.info(f"Choices on crops: {choices}, aggregated as {choice}.")
+        return choice
+
+    def _compare_quality(self, img1: Path, img2: Path) -> str:
         if self.reflect_by == "gpt4v":
             choice = self.compare_quality_by_gpt4v(img1, img2)
         else:
@@ -488,6 +943,15 @@ class IRAgent:
         return choice
 
     def compare_quality_by_gpt4v(self, img1: Path, img2: Path) -> str:
+        @with_json_schema({
+            "type": "object",
+            "properties": {
+                "thought": {"type": "string"},
+                "choice": {"type": "string", "enum": ["former", "latter", "neither"]},
+            },
+            "required": ["thought", "choice"],
+            "additionalProperties": False,
+        })
         def check_comparison(comparison: object):
             assert isinstance(comparison, dict), "Comparison should be a dict."
             assert set(comparison.keys()) == {
@@ -505,6 +969,7 @@ class IRAgent:
                 prompt=prompts.gpt_compare_prompt,
                 img_path=[img1, img2],
                 format_check=check_comparison,
+                img_detail=self._gpt_img_detail("compare_quality", [img1, img2]),
             )
         )
         return comparison["choice"]
@@ -541,7 +1006,7 @@ class IRAgent:
                 "Invalid compromise: cannot go on or terminate."
         
         # check
-        done_subtasks, _ = self._get_execution_path(Path(self.cur_node['img_path']))
+        done_subtasks = self._done_subtasks(Path(self.cur_node['img_path']))
         done_subtasks, plan = set(done_subtasks), set(self.plan)
         assert done_subtasks & plan == set(), \
             f"Invalid plan: {done_subtasks} & {plan} != ∅."
@@ -563,13 +1028,13 @@ class IRAgent:
 
     def _to_best_desc(self, best_desc_path: Path):
         self.cur_node = self._img_path_to_node(best_desc_path)
-        done_subtasks, _ = self._get_execution_path(best_desc_path)
+        done_subtasks = self._done_subtasks(best_desc_path)
         self.plan = list(set(self.plan) - set(done_subtasks))
 
     def _backtrack(self) -> None:
-        """Returns to the parent of the current node (update plan and cur_node)."""
+        """Returns to the parent of the current node (update plan and cur_node). Subtasks satisfied on the current node are planned again."""
         this_subtask = self.degra_subtask_dict[self.cur_node["degradation"]]
-        self.plan.insert(0, this_subtask)
+        self.plan = [this_subtask] + self.cur_node["satisfied"] + self.plan
 
         parent_img_path = next(
             Path(self.cur_node["img_path"]).parents[3].glob("0-img/*.png")
@@ -591,7 +1056,7 @@ class IRAgent:
         
         if not self.cur_node["children"]:
             # compromise, pick up the failed plan
-            done_subtasks, _ = self._get_execution_path(Path(self.cur_node['img_path']))
+            done_subtasks = self._done_subtasks(Path(self.cur_node['img_path']))
             for adjusted_plan in self.work_mem["plan"]["adjusted"]:
                 failed = adjusted_plan["failed"]
                 failed_done, failed_planned = failed.split(" + ")
@@ -618,7 +1083,8 @@ class IRAgent:
                 failed_tries_str = 'any of ' + ', '.join(done_top_subtasks)
             reschedule_ps = prompts.reschedule_ps_prompt.format(
                 failed_tries=failed_tries_str)
-            self.plan = self.schedule(agenda=self.plan, ps=reschedule_ps)
+            self.plan = self.schedule(agenda=self.plan, ps=reschedule_ps,
+                                      avoid_first=done_top_subtasks)
 
             if self.plan[0] in done_top_subtasks:
                 invalid_plan = self.plan.copy()
@@ -631,7 +1097,7 @@ class IRAgent:
                     f"in {done_top_subtasks}. Swapping it with {self.plan[0]}.")
 
         # record update
-        done_subtasks, _ = self._get_execution_path(Path(self.cur_node['img_path']))
+        done_subtasks = self._done_subtasks(Path(self.cur_node['img_path']))
         assert set(done_subtasks+self.plan) == set(self.work_mem["plan"]["initial"]), \
             (f"Invalid adjusted plan: {done_subtasks} ∪ {self.plan} "
              f"!= {self.work_mem['plan']['initial']}.")
@@ -640,6 +1106,90 @@ class IRAgent:
 
         self.workflow_logger.info(f"Adjusted plan: {self.plan}.")
 
+    def _start_budget(self, limits: dict[str, Optional[float]]) -> None:
+        self.run_start_time = time()
+        self.work_mem["budget"] = {"limits": limits, "consumed": {}, "exhausted": []}
+
+    def _budget_exhausted(self) -> bool:
+        """Updates the consumption of the budget and returns whether any limit is hit."""
+        budget = self.work_mem["budget"]
+        budget["consumed"] = {
+            "seconds": time() - self.run_start_time,
+            "tool_invocations": self.work_mem["n_invocations"],
+            "llm_calls": self.gpt4.n_calls + (
+                0 if self.depictqa is None else self.depictqa.n_calls),
+            "cost": self.gpt4.cost,
+        }
+        budget["exhausted"] = [
+            name for name, limit in budget["limits"].items()
+            if limit is not None and budget["consumed"][name] >= limit
+        ]
+        return bool(budget["exhausted"])
+
+    def _compromise_on_budget(self) -> None:
+        """Jumps to the best result so far, selected as the best descendant in `roll_back` among the current image and the best descendants of failed nodes, by the outcomes of comparisons already known (the current image wins when unknown)."""
+        candidates = [Path(self.cur_node["img_path"])]
+        nodes = [self.work_mem["tree"]]
+        while nodes:
+            node = nodes.pop()
+            if node["best_descendant"] is not None:
+                candidates.append(Path(node["best_descendant"]))
+            for subtask_res in node["children"].values():
+                nodes.extend(subtask_res["tools"].values())
+        self.workflow_logger.info("Searching for the best result so far...")
+        best_img_path = self.search_best_by_comp(candidates)
+        # the best result may be on another branch, with other subtasks done
+        self.plan = self._done_subtasks(Path(self.cur_node["img_path"])) + self.plan
+        self._to_best_desc(best_img_path)
+        self.workflow_logger.warning(
+            f"Budget of {self.work_mem['budget']['exhausted']} exhausted. "
+            f"Compromise: stop at {self._img_nickname(self.cur_node['img_path'])} "
+            f"with agenda {self.plan} left.")
+        self._dump_summary()
+
+    def _recheck_satisfied(self, subtask: Subtask) -> bool:
+        """Re-evaluates the degradation of the subtask on the current image, except the input. If the severity is low, marks the subtask satisfied on the current node and returns True."""
+        if self.cur_node is self.work_mem["tree"] or subtask == "super-resolution":
+            # the input has just been evaluated, and the resolution is not evaluated
+            return False
+        img_path = Path(self.cur_node["img_path"])
+        degradation = self.subtask_degra_dict[subtask]
+        self.work_mem["recheck"]["queries"] += 1
+        severity = self._reflect_on_tool_res(img_path, degradation)
+        if self.levels.index(severity) > 1:  # "medium" and above
+            return False
+
+        self.cur_node["satisfied"].append(subtask)
+        self.work_mem["recheck"]["satisfied"].append(
+            {"img_path": str(img_path), "subtask": subtask, "severity": severity})
+        self._dump_summary()
+        self.workflow_logger.info(
+            f"Severity of {degradation} of {self._img_nickname(img_path)} is already "
+            f"{severity}. Skipping {subtask}.")
+        return True
+
+    def _avoid_tried_first(self) -> bool:
+        """After a subtask is satisfied without tools, keeps the subtasks already tried on the current node (failed there before a rollback) from being the next one, as `reschedule` does. Returns False if all the remaining subtasks have been tried, i.e., the node is a dead end, failed with its best descendant like a failed result."""
+        tried = self.cur_node["children"]
+        if not self.plan or self.plan[0] not in tried:
+            return True
+        for i, subtask in enumerate(self.plan):
+            if subtask not in tried:
+                self.plan.insert(0, self.plan.pop(i))
+                self.workflow_logger.info(
+                    f"{list(tried)} tried on {self._img_nickname(self.cur_node['img_path'])}. "
+                    f"Adjusted plan: {self.plan}.")
+                return True
+
+        self.workflow_logger.info(
+            f"All of {self.plan} failed on {self._img_nickname(self.cur_node['img_path'])}.")
+        self._set_best_desc()
+        done_subtasks = self._done_subtasks(Path(self.cur_node['img_path']))
+        self.work_mem["plan"]["adjusted"].append({
+            "failed": f"{done_subtasks} + {self.plan}", "new": None
+        })
+        return False
+
     def _prepare_for_subtask(
         self, subtask: Subtask
     ) -> tuple[Path, Degradation, list[Tool]]:
@@ -656,7 +1206,8 @@ class IRAgent:
 
         return subtask_dir, degradation, toolbox
 
-    def _record_tool_res(self, img_path: Path, degra_level: Level) -> None:
+    def _record_tool_res(self, img_path: Path, degra_level: Level,
+                         tier: Optional[str] = None) -> None:
         tool_name = self._get_name_stem(img_path.parents[1].name)
         subtask = self._get_name_stem(img_path.parents[2].name)
         degradation = self.subtask_degra_dict[subtask]
@@ -676,21 +1227,105 @@ class IRAgent:
             "degradation": degradation,
             "severity": degra_level,
             "img_path": str(img_path),
+            "tier": tier,
             "best_descendant": None,
+            "satisfied": [],
             "children": {},
         }
 
     def _record_res(self) -> None:
-        self.res_path = Path(self.cur_node["img_path"])
-        self.workflow_logger.info(
-            f"Restoration result: {self._img_nickname(self.res_path)}.")
-        subtasks, tools = self._get_execution_path(self.res_path)
-        self.work_mem["execution_path"]["subtasks"] = subtasks
-        self.work_mem["execution_path"]["tools"] = tools
-        self._dump_summary()
+        reuse = self.work_mem["reuse"]
+        if reuse["accepted"]:
+            self.res_path = Path(reuse["img_path"])
+            self.workflow_logger.info(f"Restoration result: {self.res_path} (reused).")
+            for key in ["subtasks", "tools", "tiers"]:
+                self.work_mem["execution_path"][key] = reuse["prediction"][key]
+            self._dump_summary()
+        else:
+            self.res_path = Path(self.cur_node["img_path"])
+            self.workflow_logger.info(
+                f"Restoration result: {self._img_nickname(self.res_path)}.")
+            subtasks, tools = self._get_execution_path(self.res_path)
+            self.work_mem["execution_path"]["subtasks"] = subtasks
+            self.work_mem["execution_path"]["tools"] = tools
+            tiers = self._get_tiers(subtasks, tools)
+            self.work_mem["execution_path"]["tiers"] = tiers
+            if self.proxy_scale is not None:
+                self.res_path = self._replay_at_full_res(subtasks, tools, tiers)
+            self._dump_summary()
+            # only runs explored to the end are indexed, not to reinforce reused chains,
+            # nor to let partial chains of runs stopped by the budget outvote complete ones
+            if self.run_index is not None and reuse["evaluation"] is not None \
+                    and not self.work_mem["budget"]["exhausted"]:
+                self.run_index.add(reuse["evaluation"],
+                                   get_img_size(self.full_res_input_path),
+                                   export_recipe(self.work_mem_path))
         shutil.copy(self.res_path, self.work_dir / "result.png")
         print(f"Result saved in {self.res_path}.")
 
+    def _prepare_proxy(self) -> None:
+        """Sets `full_res_input_path`. In case of proxy, keeps the full-resolution input for replay, and replaces the input in the image tree with its downscaled version."""
+        if self.proxy_scale is None:
+            self.full_res_input_path = self.root_input_path
+            return
+        self.full_res_input_path = self.work_dir / "full_res_input.png"
+        shutil.copy(self.root_input_path, self.full_res_input_path)
+        img = cv2.imread(str(self.root_input_path))
+        h, w = img.shape[:2]
+        proxy_size = (max(1, round(w * self.proxy_scale)), max(1, round(h * self.proxy_scale)))
+        cv2.imwrite(str(self.root_input_path),
+                    cv2.resize(img, proxy_size, interpolation=cv2.INTER_AREA))
+
+    def _rescale_proxy_output(self, output_path: Path, subtask: Subtask, tool_name: ToolName
+                              ) -> None:
+        factor = self.proxy_rescale.get(tool_name, self.proxy_rescale.get(subtask, 1.))
+        if factor == 1:
+            return
+        img = cv2.imread(str(output_path))
+        h, w = img.shape[:2]
+        size = (max(1, round(w * factor)), max(1, round(h * factor)))
+        cv2.imwrite(str(output_path), cv2.resize(img, size, interpolation=cv2.INTER_AREA))
+
+    def _replay_at_full_res(self, subtasks: list[Subtask], tools: list[ToolName],
+                            tiers: list[Optional[str]]) -> Path:
+        """Replays the execution path found on the proxy at full resolution. Returns the path to the result."""
+        self.workflow_logger.info(
+            f"Replaying {list(zip(subtasks, tools))} at full resolution...")
+        start_time = time()
+        replay_dir = self.work_dir / "replay"
+        input_dir = replay_dir / "0-img"
+        input_dir.mkdir(parents=True)
+        shutil.copy(self.full_res_input_path, input_dir / "input.png")
+        for i, (subtask, tool_name, tier) in enumerate(zip(subtasks, tools, tiers), 1):
+            output_dir = replay_dir / f"{i}-{subtask}@{tool_name}"
+            output_dir.mkdir()
+            self.executor.invoke_a_tool(subtask, tool_name, input_dir, output_dir, tier)
+            input_dir = output_dir
+        res_path = sorted_glob(input_dir)[0]
+        self.work_mem["replay"] = {
+            "img_path": str(res_path), "seconds": time() - start_time}
+        return res_path
+
+    def _get_tiers(self, subtasks: list[Subtask], tools: list[ToolName]
+                   ) -> list[Optional[str]]:
+        """Returns the tiers of tools along the execution path."""
+        tiers = []
+        node = self.work_mem["tree"]
+        for subtask, tool_name in zip(subtasks, tools):
+            node = node["children"][subtask]["tools"][tool_name]
+            tiers.append(node["tier"])
+        return tiers
+
+    def _done_subtasks(self, img_path: Path) -> list[Subtask]:
+        """Returns the subtasks done on the way to the image, i.e., those in the execution path and those satisfied without tools."""
+        subtasks, tools = self._get_execution_path(img_path)
+        node = self.work_mem["tree"]
+        done_subtasks = node["satisfied"].copy()
+        for subtask, tool_name in zip(subtasks, tools):
+            node = node["children"][subtask]["tools"][tool_name]
+            done_subtasks += [subtask] + node["satisfied"]
+        return done_subtasks
+
     def _get_execution_path(self, img_path: Path) -> tuple[list[Subtask], list[ToolName]]:
         """Returns the execution path of the restored image (list of subtask and tools)."""
         exe_path = self._img_tree.get_execution_path(img_path)
@@ -700,17 +1335,22 @@ class IRAgent:
         return list(subtasks), list(tools)
 
     def _prepare_dir(self, input_path: Path, output_dir: Path) -> None:
-        """Sets attributes: `work_dir, img_tree_dir, log_dir, qa_path, workflow_path, summary_path`. Creates necessary directories, which will be like
+        """Sets attributes: `work_dir, img_tree_dir, log_dir, qa_path, qa_img_dir, workflow_path, summary_path`. Creates necessary directories, which will be like
         ```
         output_dir
         └── {task_id}(work_dir)
             ├── img_tree
             │   └── 0-img
-            │       └── input.png
+            │       └── input.png (downscaled in case of proxy)
+            ├── full_res_input.png (in case of proxy)
+            ├── crops (in case of reflection on crops)
+            ├── replay (in case of proxy, full-resolution outputs along the execution path)
+            ├── reuse (in case of a chain reused from past runs)
             └── logs
                 ├── summary.json
                 ├── workflow.log
                 ├── llm_qa.md
+                ├── qa_images (images linked from llm_qa.md, named by content hash)
                 └── img_tree.html
         ```
         """
@@ -725,6 +1365,7 @@ class IRAgent:
         self.log_dir = self.work_dir / "logs"
         self.log_dir.mkdir()
         self.qa_path = self.log_dir / "llm_qa.md"
+        self.qa_img_dir = self.log_dir / "qa_images"
         self.workflow_path = self.log_dir / "workflow.log"
         self.work_mem_path = self.log_dir / "summary.json"
 
@@ -0,0 +1,35 @@
+"""Rules out degradations that simple image statistics make implausible, so that only the ambiguous ones are evaluated by VLM."""
+from pathlib import Path
+
+from utils.custom_types import *
+from utils.image_stats import compute_stats
+
+
+# conservative: a degradation is ruled out only far from where it is plausible
+PRESCREEN_THRESHOLDS: dict[str, float] = {
+    "min_brightness_not_dark": 0.35,  # brighter than this cannot be "dark"
+    "min_sharpness_not_blurry": 300.,  # Laplacian variance above this rules out strong blur...
+    "max_noise_sigma_for_sharpness": 5.,  # ...unless inflated by noise
+    "max_noise_sigma_not_noisy": 2.,
+    "max_dark_channel_not_hazy": 0.1,  # dark channel prior: haze-free images are near 0
+    "max_blockiness_not_jpeg": 1.05,  # no excess of gradients on 8x8 block boundaries
+}
+
+
+def prescreen(img_path: Path, thresholds: dict[str, float] = PRESCREEN_THRESHOLDS
+              ) -> dict[Degradation, Level]:
+    """Returns the confident verdicts ("very low") for the degradations ruled out."""
+    stats = compute_stats(img_path)
+    ruled_out = []
+    if stats["brightness"] > thresholds["min_brightness_not_dark"]:
+        ruled_out.append("dark")
+    if stats["sharpness"] > thresholds["min_sharpness_not_blurry"] and \
+            stats["noise_sigma"] < thresholds["max_noise_sigma_for_sharpness"]:
+        ruled_out += ["motion blur", "defocus blur"]
+    if stats["noise_sigma"] < thresholds["max_noise_sigma_not_noisy"]:
+        ruled_out.append("noise")
+    if stats["dark_channel"] < thresholds["max_dark_channel_not_hazy"]:
+        ruled_out.append("haze")
+    if stats["blockiness"] < thresholds["max_blockiness_not_jpeg"]:
+        ruled_out.append("jpeg compression artifact")
+    return {degradation: "very low" for degradation in ruled_out}
@@ -0,0 +1,156 @@
+"""Plan once, apply many: the chain of subtasks and tools of a finished run, applied to batches of images from the same source without LLM.
+
+Apply a recipe by
+```
+python -m pipeline.recipe --recipe_path recipe.json --input_dir dataset/batch --output_dir output/batch
+```
+"""
+from pathlib import Path
+import argparse
+import json
+import random
+import shutil
+from time import time
+from typing import Callable, Optional
+
+import cv2
+
+from executor import executor
+from llm import DepictQA
+from utils.misc import sorted_glob
+from utils.custom_types import *
+
+
+def export_recipe(summary_path: Path, recipe_path: Optional[Path] = None) -> dict:
+    """Exports the execution path in the summary of a finished run as a recipe, with the degradation of each step for spot-check."""
+    with open(summary_path, "r") as f:
+        work_mem = json.load(f)
+    subtasks = work_mem["execution_path"]["subtasks"]
+    tools = work_mem["execution_path"]["tools"]
+    tiers = work_mem["execution_path"].get("tiers", [None] * len(subtasks))
+    degradations = []
+    node = work_mem["tree"]
+    for subtask, tool_name in zip(subtasks, tools):
+        node = node["children"][subtask]["tools"][tool_name]
+        degradations.append(node["degradation"])
+
+    recipe = {
+        "subtasks": subtasks,
+        "tools": tools,
+        "tiers": tiers,
+        "degradations": degradations,
+        "source": str(summary_path),
+    }
+    if recipe_path is not None:
+        with open(recipe_path, "w") as f:
+            json.dump(recipe, f, indent=2)
+    return recipe
+
+
+class RecipeEngine:
+    """Applies a recipe to many images, each step once for all images by `Tool.batch_call`, without planning, reflection, or comparison. Optionally spot-checks a sample of results by DepictQA, and restores the outliers (with any degradation of the recipe still "medium" or above) by `fallback_fn`.
+
+    Args:
+        recipe (dict): Recipe exported by `export_recipe`.
+        spot_check_rate (float, optional): Fraction of results to spot-check, in [0, 1]. Defaults to 0.
+        depictqa (DepictQA | None, optional): Evaluator for spot-check, required if `spot_check_rate` > 0. Defaults to None.
+        fallback_fn (Callable[[Path, Path], Path] | None, optional): Restores an outlier given the input path and a working directory, returning the path to the result, e.g., by running `IRAgent`. Defaults to None, i.e., outliers are only reported.
+        seed (int, optional): Seed for sampling images to spot-check. Defaults to 0.
+    """
+
+    def __init__(self,
+                 recipe: dict,
+                 spot_check_rate: float = 0.,
+                 depictqa: Optional[DepictQA] = None,
+                 fallback_fn: Optional[Callable[[Path, Path], Path]] = None,
+                 seed: int = 0):
+        self.recipe = recipe
+        assert 0 <= spot_check_rate <= 1, f"Invalid spot-check rate: {spot_check_rate}"
+        assert spot_check_rate == 0 or depictqa is not None, "Spot-check requires DepictQA."
+        self.spot_check_rate = spot_check_rate
+        self.depictqa = depictqa
+        self.fallback_fn = fallback_fn
+        self.seed = seed
+
+    def apply(self, input_paths: list[Path], output_dir: Path,
+              steps_dir: Optional[Path] = None) -> dict:
+        """Writes the results to `output_dir / {stem}.png`, with the outputs of each step in `steps_dir` (defaults to `output_dir / steps`). Returns the statistics of the batch."""
+        start_time = time()
+        if steps_dir is None:
+            steps_dir = output_dir / "steps"
+        cur_paths = list(input_paths)
+        for i, (subtask, tool_name, tier) in enumerate(zip(
+                self.recipe["subtasks"], self.recipe["tools"], self.recipe["tiers"]), 1):
+            cur_paths = executor.batch_invoke_a_tool(
+                subtask, tool_name, cur_paths, steps_dir / f"{i}-{subtask}@{tool_name}", tier)
+
+        res_paths = [output_dir / f"{input_path.stem}.png" for input_path in input_paths]
+        assert len(set(res_paths)) == len(res_paths), "Names of inputs should be unique."
+        for cur_path, res_path in zip(cur_paths, res_paths):
+            if cur_path.suffix == ".png":
+                shutil.copy(cur_path, res_path)
+            else:  # inputs untouched by an empty recipe
+                cv2.imwrite(str(res_path), cv2.imread(str(cur_path)))
+
+        stats = {"n_images": len(input_paths), "seconds": time() - start_time,
+                 "spot_checked": 0, "outliers": [], "fallbacks": 0}
+        if self.spot_check_rate > 0:
+            self._spot_check(input_paths, res_paths, output_dir, stats)
+        return stats
+
+    def _spot_check(self, input_paths: list[Path], res_paths: list[Path], output_dir: Path,
+                    stats: dict) -> None:
+        degradations = sorted(set(self.recipe["degradations"]) - {"low resolution"})
+        if not degradations:
+            return
+        n_samples = max(1, round(len(input_paths) * self.spot_check_rate))
+        indices = sorted(random.Random(self.seed).sample(range(len(input_paths)), n_samples))
+        for idx in indices:
+            evaluation = self.depictqa(
+                res_paths[idx], task="eval_degradation", degradation=degradations)
+            stats["spot_checked"] += 1
+            severe = [degradation for degradation, level in evaluation
+                      if level in {"medium", "high", "very high"}]
+            if not severe:
+                continue
+            stats["outliers"].append({"img_path": str(input_paths[idx]), "severe": severe})
+            if self.fallback_fn is not None:
+                fallback_dir = output_dir / "fallback" / input_paths[idx].stem
+                fallback_dir.mkdir(parents=True, exist_ok=True)  # when applied again
+                shutil.copy(self.fallback_fn(input_paths[idx], fallback_dir), res_paths[idx])
+                stats["fallbacks"] += 1
+
+
+if __name__ == "__main__":
+    from .iragent import IRAgent
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipe_path", type=Path, required=True)
+    parser.add_argument("--summary_path", type=Path, default=None,
+                        help="If given, exports the recipe from this summary first.")
+    parser.add_argument("--input_dir", type=Path, required=True)
+    parser.add_argument("--output_dir", type=Path, required=True)
+    parser.add_argument("--spot_check_rate", type=float, default=0.)
+    parser.add_argument("--with_fallback", action="store_true")
+    args = parser.parse_args()
+
+    if args.summary_path is not None:
+        recipe = export_recipe(args.summary_path, args.recipe_path)
+    else:
+        with open(args.recipe_path, "r") as f:
+            recipe = json.load(f)
+
+    def run_agent(input_path: Path, work_dir: Path) -> Path:
+        agent = IRAgent(input_path=input_path, output_dir=work_dir, silent=True)
+        agent.run()
+        return agent.work_dir / "result.png"
+
+    engine = RecipeEngine(
+        recipe,
+        spot_check_rate=args.spot_check_rate,
+        depictqa=DepictQA(silent=True) if args.spot_check_rate > 0 else None,
+        fallback_fn=run_agent if args.with_fallback else None,
+    )
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    stats = engine.apply(sorted_glob(args.input_dir), args.output_dir.resolve())
+    print(json.dumps(stats, indent=2))
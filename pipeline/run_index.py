@@ -0,0 +1,115 @@
+"""Index of past runs by degradation profile, predicting the execution path of a new image from its nearest neighbours."""
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+import fcntl
+import json
+import math
+import os
+import tempfile
+import threading
+from typing import Optional
+
+import numpy as np
+
+from utils.custom_types import *
+
+
+DEGRADATIONS: list[Degradation] = [
+    "motion blur", "defocus blur", "rain", "haze", "dark", "noise", "jpeg compression artifact"
+]
+LEVELS: list[Level] = ["very low", "low", "medium", "high", "very high"]
+
+_lock = threading.Lock()  # for threads, in addition to the file lock for processes
+
+
+def profile_features(evaluation: list[tuple[Degradation, Level]], img_size: tuple[int, int]
+                     ) -> list[float]:
+    """Severities in [0, 1] of the degradations (missing ones being "very low"), whether the image is small enough for super-resolution, and the log of megapixels, down-weighted since sizes rarely change the chain."""
+    severity = dict(evaluation)
+    features = [LEVELS.index(severity.get(degradation, "very low")) / (len(LEVELS) - 1)
+                for degradation in DEGRADATIONS]
+    w, h = img_size
+    features.append(float(max(w, h) < 300))  # as `IRAgent.extract_agenda`
+    features.append(0.1 * math.log2(w * h / 1e6))
+    return features
+
+
+class RunIndex:
+    """Past runs keyed by their degradation profiles, with their recipes (see `pipeline.recipe`). A prediction is made only if at least `k` runs lie within `max_distance`, and the most common chain among the `k` nearest has a share of at least `min_agreement`. Search is brute force over a matrix, fast enough for tens of thousands of runs.
+
+    Args:
+        index_path (Path): Path to the index, created if missing.
+        k (int, optional): Number of neighbours. Defaults to 5.
+        min_agreement (float, optional): Minimum share of the most common chain among the neighbours. Defaults to 0.8.
+        max_distance (float, optional): Maximum Euclidean distance of neighbours in the feature space. Defaults to 0.3, i.e., about one severity level on one degradation.
+    """
+
+    def __init__(self, index_path: Path, k: int = 5, min_agreement: float = .8,
+                 max_distance: float = .3):
+        self.index_path = index_path
+        self.k = k
+        self.min_agreement = min_agreement
+        self.max_distance = max_distance
+        self._load()
+
+    def predict(self, evaluation: list[tuple[Degradation, Level]], img_size: tuple[int, int]
+                ) -> Optional[dict]:
+        """Returns the recipe agreed by the neighbours, with the share of agreement, or None."""
+        if len(self.entries) < self.k:
+            return None
+        query = np.array(profile_features(evaluation, img_size))
+        distances = np.linalg.norm(self.features - query, axis=1)
+        nearest = np.argsort(distances)[:self.k]
+        if distances[nearest[-1]] > self.max_distance:
+            return None
+        chains = Counter(self._chain_key(self.entries[i]["recipe"]) for i in nearest)
+        chain_key, n_votes = chains.most_common(1)[0]
+        agreement = n_votes / self.k
+        if agreement < self.min_agreement:
+            return None
+        recipe = next(self.entries[i]["recipe"] for i in nearest
+                      if self._chain_key(self.entries[i]["recipe"]) == chain_key)
+        return {**recipe, "agreement": agreement}
+
+    def add(self, evaluation: list[tuple[Degradation, Level]], img_size: tuple[int, int],
+            recipe: dict) -> None:
+        """Adds a run and saves the index under a lock shared across processes, reloading first to keep the runs added by others meanwhile."""
+        with self._locked():
+            self._load()
+            self.entries.append({
+                "features": profile_features(evaluation, img_size),
+                "evaluation": evaluation,
+                "img_size": list(img_size),
+                "recipe": recipe,
+            })
+            self.features = np.array([entry["features"] for entry in self.entries])
+            # written aside and then replaced, so that readers never see a partial index
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self.index_path.parent, prefix=f"{self.index_path.name}.", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"entries": self.entries}, f, indent=2)
+            os.replace(tmp_path, self.index_path)
+
+    @contextmanager
+    def _locked(self):
+        """Context in which the index is exclusively owned. The lock is on a separate file, since the index itself is replaced."""
+        with _lock:
+            with open(self.index_path.with_suffix(".lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        self.entries: list[dict] = []
+        if self.index_path.exists():
+            with open(self.index_path, "r") as f:
+                self.entries = json.load(f)["entries"]
+        self.features = np.array([entry["features"] for entry in self.entries])
+
+    @staticmethod
+    def _chain_key(recipe: dict) -> str:
+        return '+'.join(f"{subtask}@{tool_name}"
+                        for subtask, tool_name in zip(recipe["subtasks"], recipe["tools"]))
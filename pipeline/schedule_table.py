@@ -0,0 +1,140 @@
+from pathlib import Path
+from itertools import combinations
+import json
+from typing import Callable, Iterable, Optional
+
+from utils.custom_types import *
+
+
+# pairwise[a][b]: statistics of conducting a before b
+Pairwise = dict[Subtask, dict[Subtask, dict]]
+
+# objectives closer than this are tied, as sums of fail rates in different orders
+# differ by rounding
+TOL = 1e-9
+
+
+def set_key(subtasks: Iterable[Subtask]) -> str:
+    """Key of a set of subtasks, independent of the order."""
+    return '+'.join(sorted(subtasks))
+
+
+def has_evidence(subtasks: list[Subtask], pairwise: Pairwise, min_samples: int) -> bool:
+    """Whether both orders of every pair of subtasks have been explored with enough samples."""
+    for a, b in combinations(subtasks, 2):
+        for x, y in [(a, b), (b, a)]:
+            stat = pairwise.get(x, {}).get(y)
+            if stat is None or stat["n"] < min_samples:
+                return False
+    return True
+
+
+def is_better(cost: tuple[float, float], other: tuple[float, float]) -> bool:
+    """Compares (objective, compute) lexicographically, objectives within `TOL` being tied."""
+    if abs(cost[0] - other[0]) > TOL:
+        return cost[0] < other[0]
+    return cost[1] < other[1]
+
+
+def order_compute(order: list[Subtask],
+                  step_cost: Callable[[list[Subtask], Subtask], float]) -> float:
+    return sum(step_cost(order[:i], subtask) for i, subtask in enumerate(order))
+
+
+def best_order(subtasks: list[Subtask],
+               pairwise: Pairwise,
+               avoid_first: Iterable[Subtask] = (),
+               step_cost: Optional[Callable[[list[Subtask], Subtask], float]] = None,
+               cost_weight: float = 0.
+               ) -> tuple[list[Subtask], float]:
+    """Finds the order minimizing the sum of pairwise fail rates over all pairs, i.e., composes pairwise statistics for sets never explored as a whole. Bitmask DP over subsets, O(2^n n^2).
+
+    Args:
+        subtasks (list[Subtask]): Subtasks to order, all pairs of which should be in `pairwise`.
+        pairwise (Pairwise): Statistics of pairs of subtasks.
+        avoid_first (Iterable[Subtask], optional): Subtasks that cannot be the first. Defaults to ().
+        step_cost (Callable[[list[Subtask], Subtask], float] | None, optional): Compute of a subtask after the done ones (see `pipeline.cost_model`), added to the objective with `cost_weight` and breaking ties. Defaults to None.
+        cost_weight (float, optional): Weight of compute in the objective. Defaults to 0., i.e., only breaking ties.
+
+    Returns:
+        tuple[list[Subtask], float]: The order and its cost (sum of fail rates, plus weighted compute if any).
+    """
+    subtasks = sorted(subtasks)
+    n = len(subtasks)
+    avoid_first = set(avoid_first)
+    assert not set(subtasks) <= avoid_first, "All subtasks are avoided to be the first."
+
+    # cost of appending t after the subtasks in mask, compared by `is_better`:
+    # (objective, compute), so that compute breaks ties
+    def append_cost(mask: int, t: int) -> tuple[float, float]:
+        done = [subtasks[s] for s in range(n) if mask >> s & 1]
+        fail = sum(pairwise[s][subtasks[t]]["fail_rate"] for s in done)
+        compute = 0. if step_cost is None else step_cost(done, subtasks[t])
+        return fail + cost_weight * compute, compute
+
+    inf = (float("inf"), float("inf"))
+    cost = [inf] * (1 << n)
+    last = [-1] * (1 << n)
+    cost[0] = (0., 0.)
+    for mask in range(1 << n):
+        if cost[mask] == inf:
+            continue
+        for t in range(n):
+            if mask >> t & 1:
+                continue
+            if mask == 0 and subtasks[t] in avoid_first:
+                continue
+            new_mask = mask | 1 << t
+            new_cost = tuple(map(sum, zip(cost[mask], append_cost(mask, t))))
+            if is_better(new_cost, cost[new_mask]):
+                cost[new_mask], last[new_mask] = new_cost, t
+
+    order = []
+    mask = (1 << n) - 1
+    while mask:
+        t = last[mask]
+        order.append(subtasks[t])
+        mask ^= 1 << t
+    return order[::-1], cost[(1 << n) - 1][0]
+
+
+class ScheduleTable:
+    """Order table compiled offline from the experience of exploration (see `exploration/compile_schedule.py`), answering scheduling without LLM.
+
+    Args:
+        table_path (Path): Path to the compiled table.
+    """
+
+    def __init__(self, table_path: Path):
+        with open(table_path, "r") as f:
+            table = json.load(f)
+        self.pairwise: Pairwise = table["pairwise"]
+        self.orders: dict[str, dict] = table["orders"]
+        self.min_samples: int = table["min_samples"]
+
+    def lookup(self, agenda: list[Subtask], avoid_first: Iterable[Subtask] = (),
+               step_cost: Optional[Callable[[list[Subtask], Subtask], float]] = None,
+               cost_weight: float = 0.
+               ) -> Optional[list[Subtask]]:
+        """Returns the order of the agenda, or None if the evidence is insufficient. See `best_order` for `step_cost` and `cost_weight`. Orders observed as a whole take precedence over composed ones."""
+        avoid_first = set(avoid_first) & set(agenda)
+        entry = self.orders.get(set_key(agenda))
+        if entry is not None and entry["source"] == "observed":
+            best, best_cost = None, (float("inf"), float("inf"))
+            for exe_path, fail_rate in entry["fail_rates"].items():
+                order = exe_path.split('+')
+                if order[0] in avoid_first:
+                    continue
+                compute = 0. if step_cost is None else order_compute(order, step_cost)
+                cost = (fail_rate + cost_weight * compute, compute)
+                if is_better(cost, best_cost):
+                    best, best_cost = order, cost
+            if best is not None:
+                return best
+        if not avoid_first and step_cost is None:
+            return None if entry is None else entry["order"].copy()
+        # constrained or compute-aware orders are not tabulated, but the DP is cheap
+        if not has_evidence(agenda, self.pairwise, self.min_samples):
+            return None
+        order, _ = best_order(agenda, self.pairwise, avoid_first, step_cost, cost_weight)
+        return order
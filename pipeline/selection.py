@@ -0,0 +1,162 @@
+from pathlib import Path
+from concurrent.futures import Executor, ThreadPoolExecutor
+import logging
+import threading
+from typing import Callable, Optional
+
+from utils.cache import SQLiteCache
+from utils.misc import hash_img
+
+
+Choice = str  # "former", "latter", or "neither"
+
+
+def map_in_pool(pool: Executor, fn: Callable, args_lst: list[tuple]) -> list:
+    """Maps `fn` over the arguments in the pool, running in the calling thread those not started yet, so that calls from workers of the pool (e.g., comparisons on crops within a tournament) never wait for a free worker, and cannot deadlock the pool."""
+    futures = [pool.submit(fn, *args) for args in args_lst]
+    return [fn(*args) if future.cancel() else future.result()
+            for future, args in zip(futures, args_lst)]
+
+
+class PairwiseCache:
+    """Outcomes of quality comparisons keyed by the contents of the images, so that no pair is compared twice. Outcomes not observed are inferred transitively from strict preferences (A > B > C => A > C), as long as the preferences do not contradict each other.
+
+    Args:
+        cache (SQLiteCache | None, optional): Persistent store of outcomes across runs. Defaults to None.
+    """
+
+    def __init__(self, cache: Optional[SQLiteCache] = None):
+        self.cache = cache
+        self.outcomes: dict[tuple[str, str], str] = {}  # sorted hashes -> better hash or "neither"
+        self.better: dict[str, set[str]] = {}  # hash -> hashes strictly worse
+        self._lock = threading.Lock()
+
+    def get(self, img1: Path, img2: Path) -> tuple[Optional[Choice], str]:
+        """Returns the choice between the two images and how it is known ("observed" or "inferred"), or None if unknown."""
+        h1, h2 = hash_img(img1), hash_img(img2)
+        if h1 == h2:
+            return "neither", "observed"
+        key = tuple(sorted((h1, h2)))
+        with self._lock:
+            outcome = self.outcomes.get(key)
+        if outcome is None and self.cache is not None:
+            outcome = self.cache.get(SQLiteCache.make_key(*key))
+            if outcome is not None:
+                self._add(key, outcome)
+        if outcome is not None:
+            return self._to_choice(outcome, h1, h2), "observed"
+
+        with self._lock:
+            h1_better, h2_better = self._reachable(h1, h2), self._reachable(h2, h1)
+        if h1_better != h2_better:  # a cycle means contradictory preferences
+            return ("former" if h1_better else "latter"), "inferred"
+        return None, ""
+
+    def set(self, img1: Path, img2: Path, choice: Choice) -> None:
+        h1, h2 = hash_img(img1), hash_img(img2)
+        key = tuple(sorted((h1, h2)))
+        outcome = {"former": h1, "latter": h2, "neither": "neither"}[choice]
+        self._add(key, outcome)
+        if self.cache is not None:
+            self.cache.set(SQLiteCache.make_key(*key), outcome)
+
+    def _add(self, key: tuple[str, str], outcome: str) -> None:
+        with self._lock:
+            self.outcomes[key] = outcome
+            if outcome != "neither":
+                worse = key[1] if outcome == key[0] else key[0]
+                self.better.setdefault(outcome, set()).add(worse)
+
+    def _reachable(self, src: str, dst: str) -> bool:
+        """Whether `src` is strictly better than `dst` through a chain of preferences."""
+        stack, visited = [src], {src}
+        while stack:
+            for h in self.better.get(stack.pop(), ()):
+                if h == dst:
+                    return True
+                if h not in visited:
+                    visited.add(h)
+                    stack.append(h)
+        return False
+
+    @staticmethod
+    def _to_choice(outcome: str, h1: str, h2: str) -> Choice:
+        if outcome == h1:
+            return "former"
+        if outcome == h2:
+            return "latter"
+        return "neither"
+
+
+class KnockoutSelector:
+    """Selects the best image by a knockout tournament, in which the comparisons of each round run concurrently, so that the latency is about log2(N) comparisons rather than N - 1. Known outcomes are taken from `PairwiseCache` instead of comparing again.
+
+    Args:
+        compare_fn (Callable[[Path, Path], Choice]): Compares two images, returning "former", "latter", or "neither".
+        pairwise_cache (PairwiseCache): Cache of outcomes.
+        max_workers (int, optional): Maximum number of concurrent comparisons. Defaults to 8.
+        pool (Executor | None, optional): Pool of comparisons shared with `compare_fn`, e.g., comparing on crops by `map_in_pool`, so that the concurrency of both is bounded together. Defaults to None, i.e., a pool of `max_workers` per selection.
+        logger (logging.Logger | None, optional): Logger of outcomes. Defaults to None.
+        nickname_fn (Callable[[Path], str] | None, optional): Name of images in log. Defaults to None, i.e., the path.
+    """
+
+    def __init__(self,
+                 compare_fn: Callable[[Path, Path], Choice],
+                 pairwise_cache: PairwiseCache,
+                 max_workers: int = 8,
+                 pool: Optional[Executor] = None,
+                 logger: Optional[logging.Logger] = None,
+                 nickname_fn: Optional[Callable[[Path], str]] = None):
+        self.compare_fn = compare_fn
+        self.pairwise_cache = pairwise_cache
+        self.max_workers = max_workers
+        self.pool = pool
+        self.logger = logger
+        self.nickname_fn = nickname_fn if nickname_fn is not None else str
+        self.stats = {"compared": 0, "observed": 0, "inferred": 0, "unknown": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def n_saved(self) -> int:
+        """Number of comparisons answered without calling the compare backend."""
+        return self.stats["observed"] + self.stats["inferred"]
+
+    def select(self, candidates: list[Path], known_only: bool = False) -> Path:
+        """Returns the winner. If `known_only`, the compare backend is not called, and a pair with unknown outcome is taken as "neither", so that the earlier candidate wins."""
+        if self.pool is None:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                return self._select(candidates, known_only, pool)
+        return self._select(candidates, known_only, self.pool)
+
+    def _select(self, candidates: list[Path], known_only: bool, pool: Executor) -> Path:
+        contenders = list(candidates)
+        while len(contenders) > 1:
+            pairs = [(contenders[i], contenders[i+1], known_only)
+                     for i in range(0, len(contenders) - 1, 2)]
+            choices = map_in_pool(pool, self._compare, pairs)
+            winners = [img2 if choice == "latter" else img1  # neither; keep the former
+                       for (img1, img2, _), choice in zip(pairs, choices)]
+            if len(contenders) % 2 == 1:  # bye
+                winners.append(contenders[-1])
+            contenders = winners
+        return contenders[0]
+
+    def _compare(self, img1: Path, img2: Path, known_only: bool = False) -> Choice:
+        choice, source = self.pairwise_cache.get(img1, img2)
+        if choice is None and known_only:
+            choice, source = "neither", "unknown"
+        elif choice is None:
+            choice = self.compare_fn(img1, img2)
+            self.pairwise_cache.set(img1, img2, choice)
+        with self._stats_lock:
+            self.stats[source if source else "compared"] += 1
+
+        if self.logger is not None:
+            name1, name2 = self.nickname_fn(img1), self.nickname_fn(img2)
+            known = "" if not source else f" ({source})"
+            if choice == "neither":
+                self.logger.info(f"Hard to decide between {name1} and {name2}{known}. Keeping {name1}.")
+            else:
+                better, worse = (name1, name2) if choice == "former" else (name2, name1)
+                self.logger.info(f"{better} is better than {worse}{known}.")
+        return choice
@@ -0,0 +1,150 @@
+"""Restoration of videos and bursts: the full agent plans on keyframes, and the chain of a keyframe is applied to the frames after it in batches, until the frames drift away from it.
+
+Restore a video (or a directory of frames) by
+```
+python -m pipeline.video --input_path dataset/clip.mp4 --output_dir output/clip
+```
+"""
+from pathlib import Path
+import argparse
+import json
+import math
+import shutil
+from time import time
+from typing import Optional
+
+import cv2
+
+from .iragent import IRAgent
+from .recipe import RecipeEngine
+from utils.image_stats import compute_stats
+from utils.misc import sorted_glob
+
+
+# change of each statistic counted as one unit of drift; sharpness drifts by ratio
+DRIFT_SCALES: dict[str, float] = {
+    "noise_sigma": 5.,
+    "sharpness": math.log(2),
+    "brightness": .1,
+    "dark_channel": .1,
+    "blockiness": .2,
+}
+
+
+def stats_drift(stats: dict[str, float], ref_stats: dict[str, float]) -> float:
+    """The largest change of statistics (see `utils.image_stats`) from the reference, in units of `DRIFT_SCALES`."""
+    drifts = []
+    for name, scale in DRIFT_SCALES.items():
+        if name == "sharpness":
+            change = abs(math.log((stats[name] + 1) / (ref_stats[name] + 1)))
+        else:
+            change = abs(stats[name] - ref_stats[name])
+        drifts.append(change / scale)
+    return max(drifts)
+
+
+def extract_frames(video_path: Path, frames_dir: Path) -> list[Path]:
+    frames_dir.mkdir(parents=True)
+    capture = cv2.VideoCapture(str(video_path))
+    frame_paths = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frame_path = frames_dir / f"{len(frame_paths):06d}.png"
+        cv2.imwrite(str(frame_path), frame)
+        frame_paths.append(frame_path)
+    capture.release()
+    assert frame_paths, f"No frame read from {video_path}."
+    return frame_paths
+
+
+class VideoRestorer:
+    """Restores a sequence of frames, written as an image sequence to `output_dir / frames`. A frame becomes a keyframe, restored by `IRAgent`, when it is the first, when `keyframe_interval` frames have passed, or when its statistics drift from those of the last keyframe beyond `drift_threshold`. Other frames follow the chain of the last keyframe by `RecipeEngine`, `batch_size` frames per invocation of each tool.
+
+    Args:
+        output_dir (Path): Path to the output directory.
+        keyframe_interval (int, optional): Maximum number of frames per keyframe. Defaults to 30.
+        drift_threshold (float, optional): Drift of statistics (see `stats_drift`) triggering re-planning. Defaults to 1.
+        batch_size (int, optional): Number of frames per invocation of tools. Defaults to 16.
+        agent_kwargs (dict | None, optional): Arguments of `IRAgent` for keyframes, other than the input and output. Defaults to None.
+    """
+
+    def __init__(self,
+                 output_dir: Path,
+                 keyframe_interval: int = 30,
+                 drift_threshold: float = 1.,
+                 batch_size: int = 16,
+                 agent_kwargs: Optional[dict] = None):
+        self.output_dir = output_dir.resolve()
+        self.frames_dir = self.output_dir / "frames"
+        self.keyframes_dir = self.output_dir / "keyframes"
+        self.steps_dir = self.output_dir / "steps"
+        self.frames_dir.mkdir(parents=True)
+        self.keyframe_interval = keyframe_interval
+        self.drift_threshold = drift_threshold
+        self.batch_size = batch_size
+        self.agent_kwargs = {"silent": True} if agent_kwargs is None else agent_kwargs
+
+    def restore(self, frame_paths: list[Path]) -> dict:
+        """Restores the frames in order. Returns the statistics of the segments, each of which is a keyframe and the frames following its chain."""
+        start_time = time()
+        stats = {"n_frames": len(frame_paths), "segments": []}
+        i = 0
+        while i < len(frame_paths):
+            keyframe_path = frame_paths[i]
+            segment_start_time = time()
+            recipe = self._restore_keyframe(keyframe_path)
+            key_stats = compute_stats(keyframe_path)
+
+            j = i + 1
+            while j < len(frame_paths) and j - i < self.keyframe_interval and \
+                    stats_drift(compute_stats(frame_paths[j]), key_stats) <= self.drift_threshold:
+                j += 1
+            followers = frame_paths[i + 1:j]
+            engine = RecipeEngine(recipe)
+            for k in range(0, len(followers), self.batch_size):
+                engine.apply(followers[k:k + self.batch_size], self.frames_dir, self.steps_dir)
+                shutil.rmtree(self.steps_dir, ignore_errors=True)
+
+            stats["segments"].append({
+                "keyframe": str(keyframe_path),
+                "n_frames": j - i,
+                "chain": list(zip(recipe["subtasks"], recipe["tools"])),
+                "seconds": time() - segment_start_time,
+            })
+            i = j
+
+        stats["seconds"] = time() - start_time
+        stats["seconds_per_frame"] = stats["seconds"] / len(frame_paths)
+        with open(self.output_dir / "segments.json", "w") as f:
+            json.dump(stats, f, indent=2)
+        return stats
+
+    def _restore_keyframe(self, keyframe_path: Path) -> dict:
+        agent = IRAgent(input_path=keyframe_path, output_dir=self.keyframes_dir,
+                        **self.agent_kwargs)
+        agent.run()
+        shutil.copy(agent.work_dir / "result.png", self.frames_dir / f"{keyframe_path.stem}.png")
+        return agent.export_recipe(agent.work_dir / "recipe.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_path", type=Path, required=True,
+                        help="A video, or a directory of frames sorted by name.")
+    parser.add_argument("--output_dir", type=Path, required=True)
+    parser.add_argument("--keyframe_interval", type=int, default=30)
+    parser.add_argument("--drift_threshold", type=float, default=1.)
+    parser.add_argument("--batch_size", type=int, default=16)
+    args = parser.parse_args()
+
+    restorer = VideoRestorer(args.output_dir, args.keyframe_interval,
+                             args.drift_threshold, args.batch_size)
+    if args.input_path.is_dir():
+        frame_paths = sorted_glob(args.input_path)
+    else:
+        frame_paths = extract_frames(args.input_path, restorer.output_dir / "input_frames")
+    stats = restorer.restore(frame_paths)
+    print(json.dumps({key: stats[key] for key in ["n_frames", "seconds", "seconds_per_frame"]},
+                     indent=2))
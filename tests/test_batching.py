@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.batching import BatchQueue
+
+
+def test_concurrent_requests_are_batched():
+    batch_sizes = []
+
+    def run_fn(requests: list[dict]) -> list[int]:
+        batch_sizes.append(len(requests))
+        return [r["x"] * 2 for r in requests]
+
+    batch_queue = BatchQueue(run_fn, max_batch_size=8, max_wait=.1)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda x: batch_queue.submit([{"x": x}])[0], range(8)))
+    assert results == [x * 2 for x in range(8)]
+    assert len(batch_sizes) < 8 and sum(batch_sizes) == 8
+    assert batch_queue.stats["requests"] == 8
+
+
+def test_mismatched_results_fail_the_batch():
+    batch_queue = BatchQueue(lambda requests: requests[1:], max_wait=.01)
+    with pytest.raises(RuntimeError):
+        batch_queue.submit([{"x": 0}, {"x": 1}])
@@ -0,0 +1,42 @@
+from time import sleep
+
+from utils.cache import SQLiteCache
+
+
+def test_get_and_set(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.sqlite")
+    assert cache.get("key") is None
+    cache.set("key", [["noise", "low"]])
+    assert cache.get("key") == [["noise", "low"]]
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+
+def test_namespaces_do_not_collide(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.sqlite", namespace="a")
+    other = SQLiteCache(tmp_path / "cache.sqlite", namespace="b")
+    cache.set("key", 1)
+    assert other.get("key") is None
+    assert len(cache) == 1 and len(other) == 0
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.sqlite", max_entries=2)
+    cache.set("a", 1)
+    sleep(.01)
+    cache.set("b", 2)
+    sleep(.01)
+    assert cache.get("a") == 1
+    sleep(.01)
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_expired_entries_are_missing(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.sqlite", ttl=.05)
+    cache.set("key", 1)
+    assert cache.get("key") == 1
+    sleep(.1)
+    assert cache.get("key") is None
+    assert len(cache) == 0
@@ -0,0 +1,55 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from pipeline.iragent import IRAgent
+
+
+def make_agent(plan: list[str], tried: list[str]) -> IRAgent:
+    """An agent at a node on which `tried` failed before a rollback, on which brightening is satisfied without tools."""
+    agent = IRAgent.__new__(IRAgent)
+    agent.img_tree_dir = Path("img_tree")
+    agent._init_state()
+    agent.plan = plan
+    agent.cur_node = {"img_path": "node.png", "children": {subtask: {} for subtask in tried},
+                      "satisfied": [], "best_descendant": None}
+    agent.with_recheck = True
+    agent.workflow_logger = logging.getLogger("test_recheck")
+    agent._img_nickname = lambda img_path: str(img_path)
+    agent._done_subtasks = lambda img_path: ["denoising"] + agent.cur_node["satisfied"]
+
+    def recheck_satisfied(subtask):
+        if subtask != "brightening":
+            return False
+        agent.cur_node["satisfied"].append(subtask)
+        return True
+    agent._recheck_satisfied = recheck_satisfied
+
+    def prepare_for_subtask(subtask):
+        assert subtask not in agent.cur_node["children"], f"{subtask} tried again."
+        raise NotImplementedError  # tools are not run here
+    agent._prepare_for_subtask = prepare_for_subtask
+
+    def set_best_desc():
+        agent.cur_node["best_descendant"] = "best.png"
+    agent._set_best_desc = set_best_desc
+    return agent
+
+
+def test_tried_subtask_is_not_next_after_skip():
+    agent = make_agent(["brightening", "dehazing", "deraining"], tried=["dehazing"])
+    assert agent.execute_subtask(cache=None)
+    assert agent.plan == ["deraining", "dehazing"]
+    with pytest.raises(NotImplementedError):
+        agent.execute_subtask(cache=None)
+
+
+def test_node_with_only_tried_subtasks_left_fails():
+    # dehazing failed after denoising, and brightening is then satisfied
+    agent = make_agent(["brightening", "dehazing"], tried=["dehazing"])
+    assert not agent.execute_subtask(cache=None)
+    assert agent.plan == ["dehazing"]
+    assert agent.cur_node["best_descendant"] == "best.png"
+    assert agent.work_mem["plan"]["adjusted"][-1] == {
+        "failed": "['denoising', 'brightening'] + ['dehazing']", "new": None}
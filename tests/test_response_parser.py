@@ -0,0 +1,53 @@
+from llm.response_parser import ResponseParser
+
+
+def test_python_literal_is_parsed_directly():
+    parser = ResponseParser()
+    ok, obj, text = parser.parse("[('noise', 'low')]")
+    assert ok and obj == [("noise", "low")]
+    assert text == "[('noise', 'low')]"
+    assert parser.stats["direct"] == 1
+
+
+def test_json_is_returned_as_python_literal():
+    parser = ResponseParser()
+    ok, obj, text = parser.parse('{"choice": "former", "sure": true}')
+    assert ok and obj == {"choice": "former", "sure": True}
+    assert eval(text) == obj
+    assert parser.stats["direct"] == 1
+
+
+def test_code_block_is_extracted():
+    parser = ResponseParser()
+    ok, obj, text = parser.parse('Sure:\n```json\n{"order": ["a", "b"]}\n```')
+    assert ok and obj == {"order": ["a", "b"]}
+    assert eval(text) == obj
+    assert parser.stats["extract"] == 1
+
+
+def test_curly_quotes_are_normalized():
+    parser = ResponseParser()
+    ok, obj, _ = parser.parse('{“thought”: “fine”}')
+    assert ok and obj == {"thought": "fine"}
+    assert parser.stats["normalize"] == 1
+
+
+def test_truncated_response_is_closed():
+    parser = ResponseParser()
+    ok, obj, _ = parser.parse('[{"degradation": "noise"}, {"degradation": "haze')
+    assert ok and obj == [{"degradation": "noise"}, {"degradation": "haze"}]
+    assert parser.stats["truncation"] == 1
+
+
+def test_unparsable_response_fails():
+    parser = ResponseParser()
+    assert parser.parse("I cannot tell.") == (False, None, "")
+    assert parser.stats["failed"] == 1
+
+
+def test_uncounted_parse_keeps_stats():
+    parser = ResponseParser()
+    ok, obj, _ = parser.parse('Sure:\n```json\n{"order": ["a", "b"]}\n```', count=False)
+    assert ok and obj == {"order": ["a", "b"]}
+    assert parser.parse("I cannot tell.", count=False) == (False, None, "")
+    assert all(n == 0 for n in parser.stats.values())
@@ -0,0 +1,49 @@
+from pipeline.run_index import RunIndex, profile_features
+
+
+RECIPE = {"subtasks": ["denoising", "dehazing"], "tools": ["restormer", "ridcp"],
+          "tiers": [None, None], "degradations": ["noise", "haze"]}
+OTHER_RECIPE = {"subtasks": ["dehazing"], "tools": ["dehazeformer"],
+                "tiers": [None], "degradations": ["haze"]}
+EVALUATION = [("noise", "high"), ("haze", "medium")]
+SIZE = (512, 512)
+
+
+def test_profile_features():
+    features = profile_features(EVALUATION, SIZE)
+    assert len(features) == 9
+    assert features[5] == .75  # noise, "high"
+    assert features[0] == 0.  # motion blur, missing
+    assert features[7] == 0.  # not small
+
+
+def test_predict_needs_k_neighbours(tmp_path):
+    index = RunIndex(tmp_path / "index.json", k=3)
+    for _ in range(2):
+        index.add(EVALUATION, SIZE, RECIPE)
+    assert index.predict(EVALUATION, SIZE) is None
+    index.add(EVALUATION, SIZE, RECIPE)
+    prediction = index.predict(EVALUATION, SIZE)
+    assert prediction["tools"] == RECIPE["tools"]
+    assert prediction["agreement"] == 1.
+
+
+def test_predict_needs_agreement(tmp_path):
+    index = RunIndex(tmp_path / "index.json", k=4, min_agreement=.8)
+    for recipe in [RECIPE, RECIPE, RECIPE, OTHER_RECIPE]:
+        index.add(EVALUATION, SIZE, recipe)
+    assert index.predict(EVALUATION, SIZE) is None
+    index.min_agreement = .75
+    assert index.predict(EVALUATION, SIZE)["agreement"] == .75
+
+
+def test_predict_needs_close_neighbours(tmp_path):
+    index = RunIndex(tmp_path / "index.json", k=2)
+    for _ in range(2):
+        index.add(EVALUATION, SIZE, RECIPE)
+    assert index.predict([("noise", "very low"), ("dark", "very high")], SIZE) is None
+
+
+def test_index_is_persisted(tmp_path):
+    RunIndex(tmp_path / "index.json").add(EVALUATION, SIZE, RECIPE)
+    assert len(RunIndex(tmp_path / "index.json").entries) == 1
@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+
+from exploration.compile_schedule import compile_table
+from pipeline.schedule_table import ScheduleTable, best_order, has_evidence
+
+
+def make_experience(fail_rates: dict[str, float], n: int = 10) -> dict:
+    return {"exp": {exe_path: {"fail rate": {"total": fail_rate}, "total": n}
+                    for exe_path, fail_rate in fail_rates.items()}}
+
+
+# pairs of a, b, c explored in both orders, and no triple
+PAIRS = {"a+b": .1, "b+a": .5, "a+c": .2, "c+a": .4, "b+c": .3, "c+b": .3}
+
+
+def write_table(tmp_path, experience: dict, min_samples: int = 5) -> ScheduleTable:
+    table_path = tmp_path / "schedule_table.json"
+    with open(table_path, "w") as f:
+        json.dump(compile_table(experience, min_samples), f)
+    return ScheduleTable(table_path)
+
+
+def test_best_order_composes_pairwise_fail_rates():
+    pairwise = compile_table(make_experience(PAIRS), min_samples=5)["pairwise"]
+    order, cost = best_order(["c", "b", "a"], pairwise)
+    assert order == ["a", "b", "c"]
+    assert abs(cost - .6) < 1e-9
+
+
+def test_best_order_avoids_first():
+    pairwise = compile_table(make_experience(PAIRS), min_samples=5)["pairwise"]
+    order, _ = best_order(["a", "b", "c"], pairwise, avoid_first=["a"])
+    assert order[0] != "a"
+
+
+def test_compile_table_sources():
+    experience = make_experience({**PAIRS, "a+b+c": .5})
+    table = compile_table(experience, min_samples=5)
+    assert table["orders"]["a+b"]["source"] == "observed"
+    assert table["orders"]["a+b"]["order"] == ["a", "b"]
+    # not all orders of the triple are explored
+    assert table["orders"]["a+b+c"]["source"] == "composed"
+    assert not has_evidence(["a", "b"], table["pairwise"], min_samples=20)
+    assert compile_table(experience, min_samples=20)["orders"] == {}
+
+
+def test_lookup(tmp_path):
+    table = write_table(tmp_path, make_experience(PAIRS))
+    assert table.lookup(["b", "a"]) == ["a", "b"]
+    assert table.lookup(["b", "a"], avoid_first=["a"]) == ["b", "a"]
+    assert table.lookup(["a", "b", "c"]) == ["a", "b", "c"]
+    assert table.lookup(["a", "d"]) is None
+
+
+def test_compute_breaks_ties_despite_rounding():
+    # .1 + .2 != .3 in floating point, which should still be a tie
+    pairwise = compile_table(make_experience(
+        {"a+b": .1 + .2, "b+a": .3}), min_samples=5)["pairwise"]
+    def step_cost(done, subtask):
+        return {"a": 1., "b": 2.}[subtask] * (1 + len(done))
+    assert best_order(["a", "b"], pairwise, step_cost=step_cost)[0] == ["b", "a"]
+
+
+def test_lookup_weighs_compute_of_observed_orders(tmp_path):
+    table = write_table(tmp_path, make_experience(PAIRS))
+    def step_cost(done, subtask):
+        return {"a": 1., "b": 10.}[subtask] * (1 + len(done))
+    # b+a fails more often but computes less
+    assert table.lookup(["a", "b"], step_cost=step_cost, cost_weight=.01) == ["a", "b"]
+    assert table.lookup(["a", "b"], step_cost=step_cost, cost_weight=1.) == ["b", "a"]
+    assert table.lookup(["a", "b"], avoid_first=["b"], step_cost=step_cost,
+                        cost_weight=1.) == ["a", "b"]
+
+
+def test_shipped_table_keeps_observed_fail_rates():
+    table = ScheduleTable(Path(__file__).parents[1] / "memory" / "schedule_table.json")
+    for entry in table.orders.values():
+        if entry["source"] == "observed":
+            assert '+'.join(entry["order"]) in entry["fail_rates"]
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from executor.tool import Tool
+
+
+class CopyingTool(Tool):
+    """Copies the input, tagged with the tier, after a pause that lets concurrent calls interleave."""
+
+    tiers = ("fast", "best")
+
+    def _invoke(self) -> None:
+        input_path = next(self.input_dir.glob('*'))
+        tier = self.tier
+        time.sleep(.01)
+        (self.output_dir / "output.png").write_bytes(input_path.read_bytes() + f"-{tier}".encode())
+
+
+def test_concurrent_calls_keep_their_state(tmp_path):
+    tool = CopyingTool("copy", "denoising")
+
+    def call(i: int) -> None:
+        input_dir, output_dir = tmp_path / f"{i}-input", tmp_path / f"{i}-output"
+        input_dir.mkdir()
+        output_dir.mkdir()
+        (input_dir / f"{i}.png").write_bytes(str(i).encode())
+        tool(input_dir, output_dir, silent=True, tier=["fast", "best"][i % 2])
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(call, range(16)))
+    for i in range(16):
+        output_path = tmp_path / f"{i}-output" / "output.png"
+        assert output_path.read_bytes() == f"{i}-{['fast', 'best'][i % 2]}".encode()
+    assert not hasattr(tool, "input_dir") and not hasattr(tool, "tier")
+
+
+def test_batch_call_keeps_order(tmp_path):
+    input_paths = []
+    for i in range(3):
+        input_paths.append(tmp_path / f"{i}.png")
+        input_paths[-1].write_bytes(str(i).encode())
+    output_paths = CopyingTool("copy", "denoising").batch_call(
+        input_paths, tmp_path / "output", silent=True, tier="fast")
+    assert [p.read_bytes() for p in output_paths] == [b"0-fast", b"1-fast", b"2-fast"]
@@ -0,0 +1,28 @@
+import pytest
+
+from executor.tool import Tool
+
+
+class TieredTool(Tool):
+    tiers = ("fast", "best")
+
+
+def test_default_tier_is_best_declared():
+    assert Tool("dummy", "denoising").resolve_tier(None) == "best"
+    assert TieredTool("dummy", "denoising").resolve_tier(None) == "best"
+
+
+def test_declared_tier_is_kept():
+    tool = TieredTool("dummy", "denoising")
+    assert tool.resolve_tier("fast") == "fast"
+    assert tool.resolve_tier("best") == "best"
+
+
+def test_undeclared_tier_goes_up():
+    assert TieredTool("dummy", "denoising").resolve_tier("balanced") == "best"
+    assert Tool("dummy", "denoising").resolve_tier("fast") == "best"
+
+
+def test_unknown_tier_is_rejected():
+    with pytest.raises(AssertionError):
+        Tool("dummy", "denoising").resolve_tier("fastest")
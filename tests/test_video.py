@@ -0,0 +1,27 @@
+import math
+
+from pipeline.video import DRIFT_SCALES, stats_drift
+
+
+STATS = {"noise_sigma": 10., "sharpness": 100., "brightness": .5,
+         "dark_channel": .2, "blockiness": 1.}
+
+
+def test_no_drift_from_itself():
+    assert stats_drift(STATS, STATS) == 0.
+
+
+def test_drift_in_units_of_scales():
+    assert math.isclose(stats_drift({**STATS, "noise_sigma": 20.}, STATS), 2.)
+    assert math.isclose(stats_drift({**STATS, "brightness": .45}, STATS), .5)
+
+
+def test_sharpness_drifts_by_ratio():
+    sharper = {**STATS, "sharpness": 2 * (STATS["sharpness"] + 1) - 1}
+    assert math.isclose(stats_drift(sharper, STATS), 1.)
+    assert math.isclose(stats_drift(STATS, sharper), 1.)
+
+
+def test_largest_drift_counts():
+    stats = {**STATS, "noise_sigma": 15., "blockiness": 1.6}
+    assert math.isclose(stats_drift(stats, STATS), .6 / DRIFT_SCALES["blockiness"])
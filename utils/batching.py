@@ -0,0 +1,76 @@
+"""Batching of concurrent requests, used by `executor.coordinator` and by the DepictQA servers (copied next to them by `installation/deploy_depictqa.sh`), thus depending on the standard library only."""
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from typing import Callable
+
+
+class BatchQueue:
+    """Groups requests from concurrent callers into batches, each served by one call.
+
+    Args:
+        run_fn (Callable[[list[dict]], list]): Serves a batch of requests in order.
+        max_batch_size (int, optional): Maximum number of requests in a batch. Defaults to 8.
+        max_wait (float, optional): Maximum time in seconds to wait for more requests after the first one of a batch arrives. Defaults to 0.05.
+    """
+
+    def __init__(self,
+                 run_fn: Callable[[list[dict]], list],
+                 max_batch_size: int = 8,
+                 max_wait: float = 0.05):
+        self.run_fn = run_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.n_requests = 0
+        self.n_batches = 0
+
+        self._queue: queue.Queue[tuple[dict, Future]] = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, daemon=True)
+        self._worker.start()
+
+    def submit(self, requests: list[dict]) -> list:
+        """Enqueues the requests and blocks until all of them are served."""
+        futures = []
+        for r in requests:
+            future = Future()
+            self._queue.put((r, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "requests": self.n_requests,
+            "batches": self.n_batches,
+        }
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            requests, futures = zip(*batch)
+            try:
+                results = self.run_fn(list(requests))
+                if len(results) != len(requests):
+                    raise RuntimeError(
+                        f"{len(results)} results for {len(requests)} requests.")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            self.n_requests += len(batch)
+            self.n_batches += 1
@@ -0,0 +1,108 @@
+from pathlib import Path
+from contextlib import contextmanager
+import hashlib
+import json
+import sqlite3
+import threading
+from time import time
+from typing import Optional
+
+
+class SQLiteCache:
+    """Key-value cache persisted in a SQLite database, which can be shared across processes.
+
+    Args:
+        db_path (Path | str): Path to the database file. Parent directories are created if needed.
+        namespace (str, optional): Entries in different namespaces never collide, e.g., responses of different models. Defaults to "default".
+        max_entries (int | None, optional): If not None, least recently used entries beyond this number are evicted. Defaults to None.
+        ttl (float | None, optional): If not None, entries older than `ttl` seconds are treated as missing and evicted. Defaults to None.
+    """
+
+    def __init__(self,
+                 db_path: Path | str,
+                 namespace: str = "default",
+                 max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None
+                 ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()  # the cache is shared by threads
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT, key TEXT, value TEXT, created REAL, accessed REAL, "
+                "PRIMARY KEY (namespace, key))")
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hashes JSON-serializable parts into a key."""
+        s = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[object]:
+        """Returns the cached value, or None if missing or expired."""
+        now = time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?",
+                             (self.namespace, key))
+                row = None
+            if row is None:
+                with self._stats_lock:
+                    self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+                         (now, self.namespace, key))
+        with self._stats_lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: object) -> None:
+        now = time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now))
+            self._evict(conn, now)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?",
+                                (self.namespace,)).fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND created < ?",
+                         (self.namespace, now - self.ttl))
+        if self.max_entries is not None:
+            conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key NOT IN ("
+                "SELECT key FROM entries WHERE namespace = ? "
+                "ORDER BY accessed DESC LIMIT ?)",
+                (self.namespace, self.namespace, self.max_entries))
+
+    @contextmanager
+    def _connect(self):
+        # a new connection for each operation keeps it safe across threads and processes
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:  # commits on success
+                yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,81 @@
+"""Informative crops of images, so that VLMs see a few small inputs of a predictable size instead of the whole frame."""
+from pathlib import Path
+from collections import OrderedDict
+import threading
+
+import cv2
+import numpy as np
+
+from utils.misc import hash_img
+
+
+Box = tuple[float, float, float, float]  # (x0, y0, x1, y1) relative to the width and height
+
+_MAX_MEMO_ENTRIES = 256
+# (image hash, n_crops, crop_size) -> boxes
+_memo: OrderedDict[tuple[str, int, int], tuple[Box, ...]] = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def select_crop_boxes(img_path: Path, n_crops: int = 3, crop_size: int = 256) -> list[Box]:
+    """Selects the square boxes of side `crop_size` (or the shorter side if smaller) with the highest edge energy, overlapping by at most half. Boxes are relative, so that they can be applied to images of other sizes, e.g., upscaled ones. Memoized by content only, so that copies of an image at other paths are not computed again."""
+    key = (hash_img(img_path), n_crops, crop_size)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return list(_memo[key])
+
+    boxes = _select_crop_boxes(img_path, n_crops, crop_size)
+
+    with _memo_lock:
+        _memo[key] = boxes
+        if len(_memo) > _MAX_MEMO_ENTRIES:
+            _memo.popitem(last=False)
+    return list(boxes)
+
+
+def _select_crop_boxes(img_path: Path, n_crops: int, crop_size: int) -> tuple[Box, ...]:
+    gray = cv2.cvtColor(cv2.imread(str(img_path)), cv2.COLOR_BGR2GRAY).astype(np.float32)
+    h, w = gray.shape
+    side = min(crop_size, h, w)
+    energy = cv2.magnitude(cv2.Sobel(gray, cv2.CV_32F, 1, 0), cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+    # integral image for the energy of all windows at once
+    integral = cv2.integral(energy)
+    stride = max(1, side // 4)
+    ys = np.arange(0, h - side + 1, stride)
+    xs = np.arange(0, w - side + 1, stride)
+    Y, X = np.meshgrid(ys, xs, indexing='ij')
+    window_energy = (integral[Y + side, X + side] - integral[Y, X + side]
+                     - integral[Y + side, X] + integral[Y, X])
+
+    boxes: list[Box] = []
+    chosen: list[tuple[int, int]] = []
+    for idx in np.argsort(window_energy, axis=None)[::-1]:
+        y, x = int(Y.flat[idx]), int(X.flat[idx])
+        if any(abs(y - cy) < side / 2 and abs(x - cx) < side / 2 for cy, cx in chosen):
+            continue
+        chosen.append((y, x))
+        boxes.append((x / w, y / h, (x + side) / w, (y + side) / h))
+        if len(boxes) == n_crops:
+            break
+    return tuple(boxes)
+
+
+def extract_crops(img_path: Path, boxes: list[Box], crop_size: int, output_dir: Path
+                  ) -> list[Path]:
+    """Crops the boxes from the image, resized to `crop_size` x `crop_size`. Crops are named by the content of the image, so they are written once."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    img_hash = hash_img(img_path)
+    crop_paths = [output_dir / f"{img_hash[:16]}_{crop_size}_{x0:.4f}_{y0:.4f}.png"
+                  for x0, y0, _, _ in boxes]
+    if all(crop_path.exists() for crop_path in crop_paths):
+        return crop_paths
+
+    img = cv2.imread(str(img_path))
+    h, w = img.shape[:2]
+    for (x0, y0, x1, y1), crop_path in zip(boxes, crop_paths):
+        crop = img[round(y0 * h):round(y1 * h), round(x0 * w):round(x1 * w)]
+        interpolation = cv2.INTER_AREA if crop.shape[0] > crop_size else cv2.INTER_CUBIC
+        cv2.imwrite(str(crop_path),
+                    cv2.resize(crop, (crop_size, crop_size), interpolation=interpolation))
+    return crop_paths
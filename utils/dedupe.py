@@ -0,0 +1,64 @@
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+def dhash(img: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash: signs of horizontal gradients of the downscaled gray image."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(''.join('1' if b else '0' for b in bits), 2)
+
+
+class DedupeIndex:
+    """Index of images finding near-identical ones, i.e., whose perceptual hashes are within `max_hamming` bits and whose mean absolute pixel difference is within `pixel_tol`. The perceptual hash prunes candidates cheaply, and the pixel check confirms.
+
+    Args:
+        pixel_tol (float, optional): Tolerance of mean absolute difference in [0, 255]. Defaults to 1.
+        max_hamming (int, optional): Tolerance of Hamming distance between 64-bit hashes. Defaults to 4.
+    """
+
+    def __init__(self, pixel_tol: float = 1., max_hamming: int = 4):
+        self.pixel_tol = pixel_tol
+        self.max_hamming = max_hamming
+        self.entries: list[tuple[int, Path]] = []  # hash, path of representatives
+        self.representatives: dict[str, Path] = {}  # path -> representative
+        self.stats = {"checked": 0, "duplicates": 0}
+
+    def add(self, img_path: Path) -> Optional[Path]:
+        """Returns the representative if the image duplicates an indexed one; otherwise indexes it as a representative and returns None."""
+        if str(img_path) in self.representatives:
+            rep = self.representatives[str(img_path)]
+            return None if rep == img_path else rep
+        self.stats["checked"] += 1
+        img = cv2.imread(str(img_path))
+        img_hash = dhash(img)
+        for rep_hash, rep_path in self.entries:
+            if bin(img_hash ^ rep_hash).count('1') > self.max_hamming:
+                continue
+            rep_img = cv2.imread(str(rep_path))
+            if rep_img.shape != img.shape:
+                continue
+            if cv2.absdiff(img, rep_img).mean() <= self.pixel_tol:
+                self.representatives[str(img_path)] = rep_path
+                self.stats["duplicates"] += 1
+                return rep_path
+        self.entries.append((img_hash, img_path))
+        self.representatives[str(img_path)] = img_path
+        return None
+
+    def discard(self, img_path: Path) -> None:
+        """Forgets the image, e.g., before it is overwritten. Images it represented are indexed again when added."""
+        self.entries = [(h, p) for h, p in self.entries if p != img_path]
+        self.representatives = {
+            path: rep for path, rep in self.representatives.items()
+            if path != str(img_path) and rep != img_path
+        }
+
+    def representative(self, img_path: Path) -> Path:
+        """Returns the representative of the image, indexing it if needed."""
+        rep = self.add(img_path)
+        return img_path if rep is None else rep
@@ -0,0 +1,92 @@
+"""Classical no-reference estimators of degradations, cheap enough to run on CPU for every tool output."""
+from pathlib import Path
+from collections import OrderedDict
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from utils.misc import hash_img
+
+
+def noise_sigma(gray: np.ndarray) -> float:
+    """Standard deviation of Gaussian noise (Immerkaer, 1996), in [0, 255]."""
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float64)
+    h, w = gray.shape
+    conv = cv2.filter2D(gray.astype(np.float64), -1, kernel)[1:-1, 1:-1]
+    return float(np.sqrt(np.pi / 2) * np.abs(conv).sum() / (6 * (w - 2) * (h - 2)))
+
+
+def sharpness(gray: np.ndarray) -> float:
+    """Variance of the Laplacian, low for blurry images."""
+    return float(cv2.Laplacian(gray.astype(np.float64), cv2.CV_64F).var())
+
+
+def brightness(img: np.ndarray) -> float:
+    """Mean luminance in [0, 1]."""
+    return float(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).mean() / 255)
+
+
+def dark_channel(img: np.ndarray, patch_size: int = 15) -> float:
+    """Mean of the dark channel (He et al., 2009) in [0, 1], high for hazy images."""
+    min_channel = img.min(axis=2)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (patch_size, patch_size))
+    return float(cv2.erode(min_channel, kernel).mean() / 255)
+
+
+def blockiness(gray: np.ndarray, block_size: int = 8) -> float:
+    """Ratio of the gradients across block boundaries to those elsewhere, above 1 for images with blocking artifacts."""
+    gray = gray.astype(np.float64)
+    ratios = []
+    for diff in (np.abs(np.diff(gray, axis=1)), np.abs(np.diff(gray, axis=0).T)):
+        on_boundary = np.zeros(diff.shape[1], dtype=bool)
+        on_boundary[block_size-1::block_size] = True
+        ratios.append(diff[:, on_boundary].mean() / (diff[:, ~on_boundary].mean() + 1e-6))
+    return float(np.mean(ratios))
+
+
+_MAX_MEMO_ENTRIES = 1024
+_memo: OrderedDict[str, dict[str, float]] = OrderedDict()  # image hash -> statistics
+_memo_lock = threading.Lock()
+
+
+def compute_stats(img_path: Path | str) -> dict[str, float]:
+    """Returns all statistics of the image. Memoized by content only, so that copies of an image at other paths are not computed again."""
+    img_hash = hash_img(img_path)
+    with _memo_lock:
+        if img_hash in _memo:
+            _memo.move_to_end(img_hash)
+            return dict(_memo[img_hash])
+
+    img = cv2.imread(str(img_path))
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    stats = {
+        "noise_sigma": noise_sigma(gray),
+        "sharpness": sharpness(gray),
+        "brightness": brightness(img),
+        "dark_channel": dark_channel(img),
+        "blockiness": blockiness(gray),
+    }
+
+    with _memo_lock:
+        _memo[img_hash] = stats
+        if len(_memo) > _MAX_MEMO_ENTRIES:
+            _memo.popitem(last=False)
+    return dict(stats)
+
+
+def degradation_signal(img_path: Path | str, degradation: str) -> Optional[float]:
+    """Returns a signal increasing with the severity of the degradation, or None if no estimator applies."""
+    stats = compute_stats(img_path)
+    if degradation == "noise":
+        return stats["noise_sigma"]
+    if degradation in {"motion blur", "defocus blur"}:
+        return -float(np.log10(stats["sharpness"] + 1e-6))
+    if degradation == "dark":
+        return 1 - stats["brightness"]
+    if degradation == "haze":
+        return stats["dark_channel"]
+    if degradation == "jpeg compression artifact":
+        return stats["blockiness"]
+    return None  # e.g., rain, low resolution
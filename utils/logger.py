@@ -1,5 +1,9 @@
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+import queue
+import threading
 from typing import Optional
 from time import time
 
@@ -30,13 +34,46 @@ class ColoredFormatter(logging.Formatter):
         return formatter.format(record)
 
 
+class _FileRouter(logging.Handler):
+    """Handler of the listener shared by all asynchronous file logs, passing each record to the file handler of its logger, so that loggers do not start a thread each."""
+
+    def __init__(self):
+        super().__init__()
+        self.file_handlers: dict[str, logging.Handler] = {}
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, self)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        if getattr(record, "close", False):  # after the pending records, see `close_logger`
+            self.file_handlers.pop(record.name).close()
+            return
+        file_handler = self.file_handlers.get(record.name)
+        if file_handler is not None and record.levelno >= file_handler.level:
+            file_handler.handle(record)
+
+
+_file_router: Optional[_FileRouter] = None
+_file_router_lock = threading.Lock()
+
+
+def _get_file_router() -> _FileRouter:
+    global _file_router
+    with _file_router_lock:
+        if _file_router is None:
+            _file_router = _FileRouter()
+        return _file_router
+
+
 def get_logger(logger_name: str,
                log_file: Optional[Path | str] = None,
                console_log_level: int = logging.INFO,
                file_log_level: int = logging.INFO,
                console_format_str: str = '%(asctime)s - %(levelname)s - %(name)s - %(message)s',
                file_format_str: str = '%(asctime)s - %(levelname)s - %(name)s - %(message)s',
-               silent: bool = False
+               silent: bool = False,
+               async_file: bool = False
                ) -> logging.Logger:
     """Gets a logger with the specified setting.
 
@@ -46,6 +83,7 @@ def get_logger(logger_name: str,
         console_log_level/file_log_level (int, optional): Logging level for console/file. One of logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL. Defaults to logging.INFO.
         console_format_str/file_format_str (str, optional): Format of the log message for console/file. Defaults to '%(asctime)s - %(levelname)s - %(name)s - %(message)s'.
         silent (bool, optional): If True, does not log to console. Defaults to False.
+        async_file (bool, optional): If True, writes to the file in a background thread shared by all loggers, so that logging does not block the caller. Pending records are flushed at exit, or by `close_logger`. Defaults to False.
 
     Returns:
         logging.Logger: Logger object.
@@ -67,6 +105,23 @@ def get_logger(logger_name: str,
         file_handler.setLevel(file_log_level)
         file_formatter = logging.Formatter(file_format_str)
         file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        if async_file:
+            file_router = _get_file_router()
+            file_router.file_handlers[logger_id] = file_handler
+            queue_handler = QueueHandler(file_router.queue)
+            queue_handler.setLevel(file_log_level)
+            logger.addHandler(queue_handler)
+        else:
+            logger.addHandler(file_handler)
 
     return logger
+
+
+def close_logger(logger: logging.Logger) -> None:
+    """Detaches the handlers of a logger from `get_logger` and closes them, the file of an asynchronous one after its pending records are written."""
+    for handler in logger.handlers.copy():
+        logger.removeHandler(handler)
+        if isinstance(handler, QueueHandler):
+            handler.queue.put(logging.makeLogRecord({"name": logger.name, "close": True}))
+        else:
+            handler.close()
@@ -1,12 +1,24 @@
+import os
 from pathlib import Path
+from functools import lru_cache
+import mimetypes
 from base64 import b64encode
+from hashlib import sha256
+import struct
 
 
 def encode_img(img_path: Path | str) -> str:
-    """Encodes image to base64."""    
+    """Encodes image to base64. Memoized as long as the file is unchanged."""
+    stat = os.stat(img_path)
+    return _encode_img(str(img_path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=64)
+def _encode_img(img_path: str, mtime_ns: int, size: int) -> str:
+    mime_type = mimetypes.guess_type(img_path)[0] or "image/png"
     with open(img_path, "rb") as img_file:
         b64code = b64encode(img_file.read()).decode('utf-8')
-        return f"data:image/jpeg;base64,{b64code}"
+        return f"data:{mime_type};base64,{b64code}"
     
 
 def sorted_glob(dir_path: Path, pattern: str = "*") -> list[Path]:
@@ -17,3 +29,26 @@ def sorted_glob(dir_path: Path, pattern: str = "*") -> list[Path]:
 def sorted_rglob(dir_path: Path, pattern: str = "*") -> list[Path]:
     assert dir_path.is_dir(), f"{dir_path} is not a directory."
     return sorted(list(dir_path.rglob(pattern)))
+
+
+def hash_img(img_path: Path | str) -> str:
+    """Returns the SHA-256 digest of the image file content. Memoized as long as the file is unchanged."""
+    stat = os.stat(img_path)
+    return _hash_img(str(img_path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1024)
+def _hash_img(img_path: str, mtime_ns: int, size: int) -> str:
+    with open(img_path, "rb") as img_file:
+        return sha256(img_file.read()).hexdigest()
+
+
+def get_img_size(img_path: Path | str) -> tuple[int, int]:
+    """Returns (width, height) of the image, reading only the header of PNG files."""
+    with open(img_path, "rb") as img_file:
+        header = img_file.read(24)
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", header[16:24])
+    import cv2
+    h, w = cv2.imread(str(img_path)).shape[:2]
+    return w, h
@@ -0,0 +1,39 @@
+"""Renders a QA log (e.g., `logs/llm_qa.md`), whose images are linked into a content-addressed store, into self-contained markdown with the images embedded in base64.
+
+Usage: `python -m utils.render_qa_log {log_dir}/llm_qa.md [-o output.md]`
+"""
+
+from pathlib import Path
+import argparse
+import re
+from typing import Optional
+
+from .misc import encode_img
+
+
+def render_qa_log(md_path: Path, output_path: Optional[Path] = None) -> Path:
+    """Embeds the linked images of `md_path` and writes to `output_path` (defaults to `{stem}_rendered.md` next to it)."""
+    if output_path is None:
+        output_path = md_path.with_name(f"{md_path.stem}_rendered.md")
+
+    def embed(match: re.Match) -> str:
+        link = match.group(2)
+        img_path = md_path.parent / link
+        if link.startswith("data:") or not img_path.is_file():
+            return match.group(0)
+        return f"![{match.group(1)}]({encode_img(img_path)})"
+
+    with open(md_path, "r") as f:
+        content = f.read()
+    content = re.sub(R"!\[([^\]]*)\]\(([^)]+)\)", embed, content)
+    with open(output_path, "w") as f:
+        f.write(content)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("md_path", type=Path)
+    parser.add_argument("-o", "--output_path", type=Path, default=None)
+    args = parser.parse_args()
+    print(f"Rendered to {render_qa_log(args.md_path, args.output_path)}.")